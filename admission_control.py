@@ -0,0 +1,155 @@
+import time
+
+from message_classifier import ChunkTracker, parse_header, MESSAGE_TIMEOUT, MAX_TRACKED_MESSAGES
+from metrics import metrics
+
+# Memory the ingest path may hold before traffic is shed: batches queued for the workers,
+# incomplete ISE messages in the fragment tables and rows waiting in inserter batches
+MEMORY_BUDGET_BYTES = 512 * 1024 * 1024
+# Rough size of one pending row (Python tuple of strings) for the budget
+PENDING_ROW_BYTES = 2048
+# Per-item overhead of a queued (ip, bytes) datagram on top of its payload
+QUEUED_ITEM_BYTES = 100
+# Messages per second and burst allowed per source IP, for rate-limited classes
+SOURCE_RATE = 5000
+SOURCE_BURST = 20000
+# How often the receiver re-reads queue depths and the shards' memory use
+PRESSURE_INTERVAL = 0.1
+
+
+class TrafficClass:
+    """
+    A priority class of traffic. Its messages are shed while the ingest path's pressure
+    (memory used / budget, or the fullest worker queue) is at or above `shed_above`, so a
+    lower threshold gives way first. `categories` are ISE categories (CISE_<category>);
+    None stands for datagrams without a CISE header (WLC and other sources).
+    """
+    __slots__ = ('name', 'categories', 'shed_above', 'rate_limited')
+
+    def __init__(self, name, categories, shed_above, rate_limited=True):
+        self.name = name
+        self.categories = [category.encode() if isinstance(category, str) else category for category in categories]
+        self.shed_above = shed_above
+        self.rate_limited = rate_limited
+
+
+# TACACS accounting is the command audit trail we must keep: shed last, never rate limited
+DEFAULT_TRAFFIC_CLASSES = [
+    TrafficClass('tacacs_accounting', ['TACACS_Accounting'], 1.0, rate_limited=False),
+    TrafficClass('failed_attempts', ['Failed_Attempts'], 0.9),
+    TrafficClass('passed_authentications', ['Passed_Authentications'], 0.75),
+    TrafficClass('wlc', [None], 0.6),
+]
+# ISE categories not listed in any class
+OTHER_CLASS = TrafficClass('other', [], 0.5)
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class AdmissionController:
+    """
+    Admits or sheds whole messages in the receiver, after the MessageClassifier and before
+    the worker queues. A message is shed when its class is over its pressure threshold, or
+    when its source has used up its token bucket (rate-limited classes only).
+
+    The decision is taken on the first chunk seen of a multi-chunk message and applied to
+    all its chunks, tracked by (source IP, unique id) with MessageClassifier's ChunkTracker, so a shard
+    never holds part of a message that the receiver shed.
+    """
+
+    def __init__(self, classes=DEFAULT_TRAFFIC_CLASSES, source_rate=SOURCE_RATE, source_burst=SOURCE_BURST,
+                 source_limits=None, timeout=MESSAGE_TIMEOUT, max_tracked=MAX_TRACKED_MESSAGES):
+        self.classes = {}
+        for traffic_class in classes:
+            for category in traffic_class.categories:
+                self.classes[category] = traffic_class
+        self.source_rate = source_rate
+        self.source_burst = source_burst
+        # source IP -> (rate, burst), overriding the defaults
+        self.source_limits = source_limits or {}
+        self.buckets = {}
+        self.pressure = 0.0
+        # State per message: [deadline, chunks seen, admitted]
+        self.tracked = ChunkTracker(timeout, max_tracked)
+
+    def set_pressure(self, pressure):
+        self.pressure = pressure
+
+    def filter_batch(self, batch):
+        """
+        Returns the (ip, data) items of `batch` that are admitted.
+        """
+        kept = []
+        now = time.time()
+        for item in batch:
+            ip, data = item
+            if data[:1] == b'\x00':
+                # Cancel notices from the classifier free memory; always forward them
+                kept.append(item)
+                continue
+            header = parse_header(data)
+            if header is None:
+                if self._admit(ip, self.classes.get(None, OTHER_CLASS), now):
+                    kept.append(item)
+                continue
+            category, unique_id, total, _ = header
+            traffic_class = self.classes.get(category, OTHER_CLASS)
+            if total == b'1':
+                if self._admit(ip, traffic_class, now):
+                    kept.append(item)
+                continue
+            state, first = self.tracked.count((ip, unique_id), int(total), now)
+            if first:
+                state.append(self._admit(ip, traffic_class, now))
+            if state[2]:
+                kept.append(item)
+        if len(kept) < len(batch):
+            metrics.count('syslog_datagrams_dropped_total', (('reason', 'shed'),), len(batch) - len(kept))
+        self.tracked.expire(now)
+        return kept
+
+    def _admit(self, ip, traffic_class, now):
+        if self.pressure >= traffic_class.shed_above:
+            reason = 'overload'
+        elif traffic_class.rate_limited and not self._bucket(ip, now).take(now):
+            reason = 'source_rate'
+        else:
+            return True
+        metrics.count('syslog_messages_shed_total', (('class', traffic_class.name), ('source', ip), ('reason', reason)))
+        return False
+
+    def _bucket(self, ip, now):
+        bucket = self.buckets.get(ip)
+        if bucket is None:
+            rate, burst = self.source_limits.get(ip, (self.source_rate, self.source_burst))
+            bucket = self.buckets[ip] = TokenBucket(rate, burst, now)
+        return bucket
+
+
+def memory_in_use(shards):
+    """
+    Bytes the shards hold, as last published by the workers: queued batches, fragment
+    tables and pending inserter rows (estimated).
+    """
+    return sum(shard['queued_bytes'].value + shard['fragment_bytes'].value +
+               shard['pending_rows'].value * PENDING_ROW_BYTES for shard in shards)
+
+
+def batch_bytes(batch):
+    return sum(len(data) for _, data in batch) + QUEUED_ITEM_BYTES * len(batch)
@@ -0,0 +1,493 @@
+import argparse
+import gzip
+import io
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import re
+import socket
+import struct
+import sys
+import time
+from datetime import datetime
+import psycopg2
+from psycopg2 import sql
+from log_setup import configure_logging
+from udp_receiver import shard_for_datagram
+from message_archive import query_archive, split_chunks
+from table_schemas import TABLES
+from partition_manager import ensure_partitions_for, partition_timezone, PARTITION_TIMEZONE
+from dimensions import is_encoded, insert_encoded
+from database_utils import DATABASE_URL, inserters, flush_all_batches, cleanup_connections, get_writer_status
+from handler_dispatcher import handle_syslog, maintenance, configure_wlc_output
+
+# Offline ingestion: reads captured or archived syslog and drives it through handle_syslog
+# and the inserters without the socket, sharded by fragment UID over worker processes as
+# the service is. Rows are loaded into staging copies of the tables and merged at the end
+# in one transaction, so re-running the same input replaces rows instead of duplicating them.
+#
+#   python backfill.py capture.pcap WLC-20240809.txt.gz --source 10.23.16.25
+#   python backfill.py --archive C:\Syslog\archive --start "2024-08-09 00:00:00" --end "2024-08-10 00:00:00"
+
+BATCH_DATAGRAMS = 500  # Datagrams per batch handed to a worker
+MAX_QUEUED_BATCHES = 16  # Per worker; the reader waits when a worker falls behind
+BATCH_ROWS = 5000  # Inserter batch size while backfilling
+PROGRESS_INTERVAL = 5  # Seconds between progress lines
+SYSLOG_PORT = 514
+MAX_PENDING_FRAGMENTS = 4096  # IP fragment sets waiting for their remaining pieces in a capture
+
+# A line of `message_archive.py query` output: local time, source IP, message
+_QUERY_LINE = re.compile(r'(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\.\d+) (\S+) (<\d+>.*)', re.S)
+
+_PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6), b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9), b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+_PCAPNG_MAGIC = b'\x0a\x0d\x0d\x0a'
+
+
+def staging_table(run_id, name):
+    return f'backfill_{run_id}_{name}'
+
+
+def in_window(arrived, start, end):
+    if arrived is None:
+        return True
+    return (start is None or arrived >= start) and (end is None or arrived < end)
+
+
+def read_lines(file, source=None, start=None, end=None):
+    """
+    (time, source IP, datagram) from a text file of messages, one per line: raw messages
+    as written to WLC.txt (source IP from `source`), `message_archive.py query` output, or
+    archive segment JSON lines. Reassembled ISE messages are split back into their chunks.
+    """
+    for raw in file:
+        line = raw.decode('utf-8', errors='replace').rstrip('\r\n')
+        if not line:
+            continue
+        arrived, ip, message = None, source, line
+        if line[0] == '[':
+            arrived, ip, message = json.loads(line)
+        else:
+            match = _QUERY_LINE.match(line)
+            if match is not None:
+                stamp, ip, message = match.groups()
+                arrived = datetime.strptime(stamp, '%Y-%m-%d %H:%M:%S.%f').timestamp()
+        if not in_window(arrived, start, end):
+            continue
+        for chunk in split_chunks(message):
+            yield arrived, ip, chunk.encode('utf-8')
+
+
+def read_archive(directory, start=None, end=None, source=None, category=None):
+    for arrived, ip, message in query_archive(directory, start, end, source, category):
+        for chunk in split_chunks(message):
+            yield arrived, ip, chunk.encode('utf-8')
+
+
+def _link_payload(linktype, frame):
+    # (IP version, IP packet) of a captured frame, or None
+    if linktype == 1:  # Ethernet, with any VLAN tags
+        offset, ethertype = 14, struct.unpack_from('!H', frame, 12)[0] if len(frame) >= 14 else 0
+        while ethertype in (0x8100, 0x88a8) and len(frame) >= offset + 4:
+            ethertype = struct.unpack_from('!H', frame, offset + 2)[0]
+            offset += 4
+    elif linktype == 113:  # Linux cooked
+        offset, ethertype = 16, struct.unpack_from('!H', frame, 14)[0] if len(frame) >= 16 else 0
+    elif linktype == 276:  # Linux cooked v2
+        offset, ethertype = 20, struct.unpack_from('!H', frame, 0)[0] if len(frame) >= 20 else 0
+    elif linktype == 0:  # BSD loopback, address family in host order
+        if len(frame) < 4:
+            return None
+        family = frame[0] if frame[0] else frame[3]
+        offset, ethertype = 4, 0x0800 if family == 2 else 0x86dd if family in (24, 28, 30) else 0
+    elif linktype in (12, 101, 228, 229):  # Raw IP
+        offset = 0
+        ethertype = 0x0800 if frame[:1] and frame[0] >> 4 == 4 else 0x86dd if frame[:1] and frame[0] >> 4 == 6 else 0
+    else:
+        return None
+    if ethertype == 0x0800:
+        return 4, frame[offset:]
+    if ethertype == 0x86dd:
+        return 6, frame[offset:]
+    return None
+
+
+class UDPExtractor:
+    """
+    Syslog datagrams (source IP, payload) from captured IP packets, reassembling IPv4
+    fragments: ISE messages are larger than the MTU, so their datagrams arrive as several
+    fragments.
+    """
+
+    def __init__(self, port=SYSLOG_PORT):
+        self.port = port
+        # (source, destination, id) -> ({fragment offset: data}, total length or None)
+        self.fragments = {}
+        self.stats = {'datagrams': 0, 'reassembled': 0, 'incomplete': 0}
+
+    def packet(self, version, packet):
+        if version == 4:
+            if len(packet) < 20 or packet[9] != 17:
+                return None
+            header_length = (packet[0] & 0x0f) * 4
+            total_length, ident, flags_offset = struct.unpack_from('!HHH', packet, 2)
+            source = socket.inet_ntoa(packet[12:16])
+            payload = packet[header_length:total_length]
+            more_fragments = flags_offset & 0x2000
+            fragment_offset = (flags_offset & 0x1fff) * 8
+            if more_fragments or fragment_offset:
+                payload = self._reassemble((packet[12:20], ident), fragment_offset, payload, not more_fragments)
+                if payload is None:
+                    return None
+        elif version == 6:
+            # Only UDP directly after the fixed header; syslog over IPv6 is not fragmented in practice
+            if len(packet) < 48 or packet[6] != 17:
+                return None
+            source = socket.inet_ntop(socket.AF_INET6, packet[8:24])
+            payload = packet[40:40 + struct.unpack_from('!H', packet, 4)[0]]
+        else:
+            return None
+        if len(payload) < 8:
+            return None
+        destination_port, udp_length = struct.unpack_from('!HH', payload, 2)
+        if destination_port != self.port:
+            return None
+        self.stats['datagrams'] += 1
+        return source, payload[8:udp_length]
+
+    def _reassemble(self, key, offset, data, last):
+        pieces, total = self.fragments.pop(key, ({}, None))
+        pieces[offset] = data
+        if last:
+            total = offset + len(data)
+        if total is not None:
+            received = sum(len(piece) for piece in pieces.values())
+            if received >= total:
+                packet = b''.join(pieces[piece_offset] for piece_offset in sorted(pieces))
+                self.stats['reassembled'] += 1
+                return packet[:total]
+        if len(self.fragments) >= MAX_PENDING_FRAGMENTS:
+            # The oldest incomplete set; its other fragments were not captured
+            del self.fragments[next(iter(self.fragments))]
+            self.stats['incomplete'] += 1
+        self.fragments[key] = (pieces, total)
+        return None
+
+
+def read_pcap(file, port=SYSLOG_PORT, start=None, end=None):
+    """
+    (capture time, source IP, datagram) of the UDP syslog traffic in a pcap or pcapng capture.
+    """
+    extractor = UDPExtractor(port)
+    magic = file.read(4)
+    if magic == _PCAPNG_MAGIC:
+        packets = _pcapng_packets(file, magic)
+    else:
+        packets = _pcap_packets(file, magic)
+    for captured, linktype, frame in packets:
+        if not in_window(captured, start, end):
+            continue
+        link = _link_payload(linktype, frame)
+        if link is None:
+            continue
+        datagram = extractor.packet(*link)
+        if datagram is not None:
+            yield captured, datagram[0], datagram[1]
+    if extractor.fragments:
+        extractor.stats['incomplete'] += len(extractor.fragments)
+    logging.info("Capture: %d syslog datagrams, %d reassembled from IP fragments, %d incomplete",
+                 extractor.stats['datagrams'], extractor.stats['reassembled'], extractor.stats['incomplete'])
+
+
+def _pcap_packets(file, magic):
+    byte_order, resolution = _PCAP_MAGIC[magic]
+    linktype = struct.unpack(byte_order + 'HHiIII', file.read(20))[5]
+    record = struct.Struct(byte_order + 'IIII')
+    while True:
+        header = file.read(record.size)
+        if len(header) < record.size:
+            return
+        seconds, fraction, captured_length, _ = record.unpack(header)
+        yield seconds + fraction * resolution, linktype, file.read(captured_length)
+
+
+def _pcapng_packets(file, magic):
+    byte_order = '<'
+    interfaces = []
+    header = magic + file.read(4)
+    while len(header) == 8:
+        if header[:4] == _PCAPNG_MAGIC:
+            # Section header: its byte-order magic sets the byte order of the section
+            byte_order = '<' if file.read(4) == b'\x4d\x3c\x2b\x1a' else '>'
+            file.read(struct.unpack(byte_order + 'I', header[4:])[0] - 12)
+            interfaces = []
+        else:
+            kind, length = struct.unpack(byte_order + 'II', header)
+            body = file.read(length - 12)
+            file.read(4)
+            if kind == 1:  # Interface description
+                linktype = struct.unpack_from(byte_order + 'H', body, 0)[0]
+                interfaces.append((linktype, _pcapng_resolution(body[8:], byte_order)))
+            elif kind == 6:  # Enhanced packet
+                interface, high, low, captured_length = struct.unpack_from(byte_order + 'IIII', body, 0)
+                linktype, resolution = interfaces[interface]
+                yield ((high << 32) | low) * resolution, linktype, body[20:20 + captured_length]
+            elif kind == 3 and interfaces:  # Simple packet, no timestamp
+                captured_length = min(struct.unpack_from(byte_order + 'I', body, 0)[0], len(body) - 4)
+                yield None, interfaces[0][0], body[4:4 + captured_length]
+        header = file.read(8)
+
+
+def _pcapng_resolution(options, byte_order):
+    offset = 0
+    while offset + 4 <= len(options):
+        code, length = struct.unpack_from(byte_order + 'HH', options, offset)
+        if code == 0:
+            break
+        if code == 9 and length >= 1:  # if_tsresol
+            value = options[offset + 4]
+            return 2 ** -(value & 0x7f) if value & 0x80 else 10 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
+
+
+def open_input(path):
+    """
+    (reader, raw file): the input opened for reading, decompressed when gzipped, and the
+    underlying file whose position gives the progress through it.
+    """
+    raw = open(path, 'rb')
+    stream = io.BufferedReader(raw)
+    if stream.peek(2)[:2] == b'\x1f\x8b':
+        stream = io.BufferedReader(gzip.GzipFile(fileobj=stream))
+    return stream, raw
+
+
+def is_capture(stream):
+    magic = stream.peek(4)[:4]
+    return magic == _PCAPNG_MAGIC or magic in _PCAP_MAGIC
+
+
+def _skip_record(fields):
+    pass
+
+
+def backfill_worker(batches, results, run_id, shard_index, handled, tables):
+    configure_logging(f"Backfill{shard_index}")
+    for name, inserter in inserters.items():
+        if name in tables:
+            inserter.set_target(staging_table(run_id, name))
+            inserter.max_batch_size = BATCH_ROWS
+        else:
+            # Rows of the tables not being loaded are not built at all
+            inserter.add_record = _skip_record
+    configure_wlc_output(to_file=False, to_database='wlc' in tables)
+    last_maintenance = time.time()
+    while True:
+        batch = batches.get()
+        if batch is None:
+            break
+        for ip, data in batch:
+            try:
+                handle_syslog(ip, data.decode(errors='replace'))
+            except Exception as e:
+                logging.error("Error handling syslog message from %s: %s", ip, e)
+        with handled.get_lock():
+            handled.value += len(batch)
+        now = time.time()
+        if now - last_maintenance >= 1:
+            last_maintenance = now
+            maintenance()
+    flush_all_batches()
+    cleanup_connections(timeout=600)
+    status = get_writer_status()
+    status['rejected'] = sum(inserter.get_rejected_count() for inserter in inserters.values())
+    results.put((shard_index, status))
+
+
+def create_staging(conn, run_id, tables):
+    with conn.cursor() as cursor:
+        for name in tables:
+            cursor.execute(sql.SQL('CREATE UNLOGGED TABLE {} (LIKE public.{})').format(
+                sql.Identifier(staging_table(run_id, name)), sql.Identifier(name)))
+    conn.commit()
+
+
+def drop_staging(conn, run_id, tables):
+    with conn.cursor() as cursor:
+        for name in tables:
+            cursor.execute(sql.SQL('DROP TABLE IF EXISTS {}').format(sql.Identifier(staging_table(run_id, name))))
+    conn.commit()
+
+
+def merge_staging(conn, run_id, tables, replace_window=None, dsn=DATABASE_URL):
+    """
+    Move the staged rows into the tables in one transaction and return
+    table -> (rows deleted, rows inserted). Rows identical to staged ones are deleted
+    first, so a window that was already loaded, by the service or an earlier backfill,
+    ends up with each staged row once. With replace_window (start, end) every row of the
+    tables in the window is deleted instead: for reprocessing after a parser fix, where
+    the earlier rows differ from the new ones.
+    """
+    merged = {}
+    tz = partition_timezone(PARTITION_TIMEZONE)
+    with conn.cursor() as cursor:
+        # The partitions the staged rows need are committed on their own connection before
+        # the merge touches the tables, so it does not lock out the service while it runs
+        for name in tables:
+            schema = TABLES[name]
+            target = schema.facts_table if is_encoded(cursor, schema) else name
+            ensure_partitions_for(cursor, target, staging_table(run_id, name), tz, dsn)
+        for name in tables:
+            target, source = name, staging_table(run_id, name)
+            schema = TABLES[name]
+            if is_encoded(cursor, schema):
+                # Staged rows are in the view's layout; they are compared and inserted encoded
+                target, source = schema.facts_table, f"{source}_encoded"
+                cursor.execute(sql.SQL('CREATE TEMPORARY TABLE {} (LIKE public.{}) ON COMMIT DROP').format(
+                    sql.Identifier(source), sql.Identifier(target)))
+                insert_encoded(cursor, schema, staging_table(run_id, name), source)
+            table = sql.Identifier('public', target)
+            staging = sql.Identifier(source)
+            if replace_window is not None:
+                cursor.execute(sql.SQL('DELETE FROM {} WHERE "timestamp" >= %s AND "timestamp" < %s').format(table),
+                               replace_window)
+            else:
+                cursor.execute(sql.SQL(
+                    'DELETE FROM {} AS t USING (SELECT DISTINCT * FROM {}) AS s '
+                    'WHERE t."timestamp" = s."timestamp" AND ROW(t.*) IS NOT DISTINCT FROM ROW(s.*)'
+                ).format(table, staging))
+            deleted = cursor.rowcount
+            cursor.execute(sql.SQL('INSERT INTO {} SELECT * FROM {}').format(table, staging))
+            merged[name] = (deleted, cursor.rowcount)
+    conn.commit()
+    return merged
+
+
+def datagrams(args, start, end, position):
+    # Every input in turn; position[0] is the byte offset reached, over all input files
+    if args.archive:
+        yield from read_archive(args.archive, start, end, args.source, args.category)
+    done = 0
+    for path in args.inputs:
+        stream, raw = open_input(path)
+        with stream:
+            reader = read_pcap(stream, args.port, start, end) if is_capture(stream) \
+                else read_lines(stream, args.source, start, end)
+            for item in reader:
+                position[0] = done + raw.tell()
+                yield item
+        done += os.path.getsize(path)
+        position[0] = done
+
+
+def report_progress(started, read, workers_handled, position, total_bytes):
+    elapsed = max(time.time() - started, 1e-6)
+    handled = sum(value.value for value in workers_handled)
+    percent = f", {100.0 * position / total_bytes:.1f}% of input" if total_bytes else ''
+    logging.info("Backfill: %d datagrams read, %d handled, %.0f/s%s", read, handled, handled / elapsed, percent)
+
+
+def _parse_time(value):
+    # Local time, made timezone-aware so --replace compares it with the stored timestamps as such
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').astimezone() if value else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load captured or archived syslog into the database")
+    parser.add_argument('inputs', nargs='*', help="Message files (plain or gzip) or pcap/pcapng captures of UDP syslog")
+    parser.add_argument('--archive', help="Message archive directory to read, e.g. C:\\Syslog\\archive")
+    parser.add_argument('--source', help="Source IP of raw message lines, and the archive source to read")
+    parser.add_argument('--category', help="Archive category to read, e.g. Passed_Authentications")
+    parser.add_argument('--start', help="YYYY-MM-DD HH:MM:SS, local time")
+    parser.add_argument('--end', help="YYYY-MM-DD HH:MM:SS, local time")
+    parser.add_argument('--port', type=int, default=SYSLOG_PORT, help="Syslog port in captures")
+    parser.add_argument('--workers', type=int, default=max(multiprocessing.cpu_count() - 1, 1))
+    parser.add_argument('--tables', default=','.join(TABLES), help="Tables to load, comma separated")
+    parser.add_argument('--replace', action='store_true',
+                        help="Delete every row of the tables between --start and --end before loading")
+    args = parser.parse_args()
+
+    configure_logging('Backfill')
+    tables = [name.strip() for name in args.tables.split(',') if name.strip()]
+    unknown = set(tables) - set(TABLES)
+    if unknown:
+        parser.error(f"Unknown tables: {', '.join(sorted(unknown))}")
+    if not args.inputs and not args.archive:
+        parser.error("Give input files or --archive")
+    start, end = _parse_time(args.start), _parse_time(args.end)
+    if args.replace and (start is None or end is None):
+        parser.error("--replace needs --start and --end")
+
+    run_id = f"{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}"
+    conn = psycopg2.connect(DATABASE_URL)
+    create_staging(conn, run_id, tables)
+    logging.info("Backfill %s into %s with %d workers", run_id, ', '.join(tables), args.workers)
+
+    results = multiprocessing.Queue()
+    queues = [multiprocessing.Queue(MAX_QUEUED_BATCHES) for _ in range(args.workers)]
+    handled = [multiprocessing.Value('q', 0) for _ in range(args.workers)]
+    workers = [multiprocessing.Process(target=backfill_worker, name=f"Backfill{index}",
+                                       args=(queues[index], results, run_id, index, handled[index], tables))
+               for index in range(args.workers)]
+    for worker in workers:
+        worker.start()
+
+    started = last_report = time.time()
+    total_bytes = sum(os.path.getsize(path) for path in args.inputs)
+    position = [0]
+    read = 0
+    pending = [[] for _ in range(args.workers)]
+    try:
+        for _, ip, data in datagrams(args, start and start.timestamp(), end and end.timestamp(), position):
+            if ip is None:
+                logging.error("No source IP for a raw message line; give --source")
+                break
+            shard = shard_for_datagram(ip, data, args.workers)
+            pending[shard].append((ip, data))
+            if len(pending[shard]) >= BATCH_DATAGRAMS:
+                queues[shard].put(pending[shard])
+                pending[shard] = []
+            read += 1
+            if time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                report_progress(started, read, handled, position[0], total_bytes)
+    finally:
+        for shard, batch in enumerate(pending):
+            if batch:
+                queues[shard].put(batch)
+            queues[shard].put(None)
+
+    # Each worker reports its writer status once its rows are written
+    statuses = {}
+    while len(statuses) < len(workers):
+        try:
+            shard, status = results.get(timeout=PROGRESS_INTERVAL)
+            statuses[shard] = status
+        except queue.Empty:
+            if not any(worker.is_alive() for worker in workers):
+                break
+            report_progress(started, read, handled, position[0], total_bytes)
+    for worker in workers:
+        worker.join()
+    report_progress(started, read, handled, position[0], total_bytes)
+
+    dropped = sum(status['dropped_rows'] for status in statuses.values())
+    if len(statuses) < len(workers) or dropped:
+        # Nothing is merged from an incomplete load; running it again is safe
+        logging.error("Backfill %s failed: %d of %d workers finished, %d rows not written; nothing was loaded",
+                      run_id, len(statuses), len(workers), dropped)
+        drop_staging(conn, run_id, tables)
+        sys.exit(1)
+
+    merged = merge_staging(conn, run_id, tables, (start, end) if args.replace else None)
+    drop_staging(conn, run_id, tables)
+    conn.close()
+    rejected = sum(status['rejected'] for status in statuses.values())
+    logging.info("Backfill %s done in %.0fs: %d datagrams, %d rows rejected by validation; %s", run_id,
+                 time.time() - started, read, rejected,
+                 ', '.join(f"{name} +{inserted} -{deleted}" for name, (deleted, inserted) in merged.items()))
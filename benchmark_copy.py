@@ -0,0 +1,72 @@
+import argparse
+import time
+import psycopg2
+from database_utils import BatchedDatabaseInserter, DATABASE_URL
+from table_schemas import TABLES, TableSchema
+from cisco_ise_passed_attempts_handler import parse_syslog_message
+from benchmark_ise_parsing import PASSED_WLC
+
+# Loads pwa rows into a temporary copy of the table through BatchedDatabaseInserter.write_rows
+# with each loader, committing per batch as the inserter does, and reports rows/sec and the
+# client CPU per row. Needs the PostgreSQL server in DATABASE_URL (or --dsn).
+
+# Values ISE can send that COPY text format must escape, carried by one row in ESCAPED_EVERY
+ESCAPED_EVERY = 100
+AWKWARD_VALUES = ['CN=D-5NRH5G3\\,OU=HO Managed\\,DC=Poise', 'tab\there', 'line\nbreak\r\n', 'back\\slash\\N']
+
+
+def make_rows(count):
+    fields = parse_syslog_message(PASSED_WLC)
+    fields['source_ip'] = '10.42.41.61'
+    schema = TABLES['pwa']
+    rows = []
+    for i in range(count):
+        fields['UserName'] = f"host/d-{i:07d}"
+        if i % ESCAPED_EVERY == 0:
+            fields['AD-Host-Resolved-DNs'] = AWKWARD_VALUES[i // ESCAPED_EVERY % len(AWKWARD_VALUES)]
+        else:
+            fields['AD-Host-Resolved-DNs'] = f"CN=H-{i:07d}"
+        rows.append(schema.build_row(fields))
+    return rows
+
+
+def run(conn, loader, rows, batch_size):
+    schema = TABLES['pwa']
+    bench_schema = TableSchema(f'bench_{schema.name}', schema.columns, loader=loader)
+    inserter = BatchedDatabaseInserter(bench_schema)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{bench_schema.name}")
+        cursor.execute(bench_schema.render_ddl().replace('public.', 'pg_temp.'))
+        conn.commit()
+
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        for i in range(0, len(rows), batch_size):
+            inserter.write_rows(cursor, rows[i:i + batch_size])
+            conn.commit()
+        cpu = time.process_time() - start_cpu
+        elapsed = time.perf_counter() - start
+
+        cursor.execute(f"SELECT count(*), array_agg(DISTINCT adhostresolveddns) FILTER (WHERE adhostresolveddns NOT LIKE 'CN=H-%') "
+                       f"FROM {bench_schema.name}")
+        loaded, stored_values = cursor.fetchone()
+    round_trip = 'ok' if sorted(stored_values) == sorted(AWKWARD_VALUES) else f'MISMATCH {stored_values!r}'
+    print(f"{loader:>7} batch={batch_size:>6}: {loaded} rows in {elapsed:.2f}s = {loaded / elapsed:,.0f} rows/s, "
+          f"client CPU {cpu / loaded * 1e6:.1f} us/row, escaping {round_trip}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark execute_values against COPY for the pwa table")
+    parser.add_argument('--dsn', default=DATABASE_URL)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[200, 2000, 20000])
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    conn = psycopg2.connect(args.dsn)
+    try:
+        for batch_size in args.batch_sizes:
+            for loader in ('insert', 'copy'):
+                run(conn, loader, rows, batch_size)
+    finally:
+        conn.close()
@@ -0,0 +1,161 @@
+import argparse
+import gc
+import multiprocessing
+import random
+import time
+import psycopg2
+from psycopg2.extensions import make_dsn
+from database_utils import BatchedDatabaseInserter, DATABASE_URL, format_copy_rows
+from dimensions import render_ddl
+from table_schemas import TABLES, TableSchema
+from cisco_ise_passed_attempts_handler import parse_syslog_message
+from benchmark_ise_parsing import PASSED_WLC
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Compares the pwa table in its plain layout with the dictionary encoded one (see
+# dimensions), on rows whose dimension columns have production-like cardinality:
+#   - RSS of a batch of rows held as the inserter holds them, with and without interning
+#     of the dimension strings (each in a fresh process; needs psutil)
+#   - bytes stored (table, partitions, indexes and dimension tables) and COPY text sent
+#   - insert rate through BatchedDatabaseInserter.write_rows, one commit per batch; the
+#     encoded layout with a cold cache (every value new) and then a warm one
+# Runs in its own database (--database), created on the server in --dsn and dropped at the end.
+#
+#   python benchmark_dimensions.py --rows 200000
+
+SCHEMA = TABLES['pwa']
+# Distinct values per dimension column; AD host DNs follow the endpoints
+CARDINALITY = {
+    'networkdevicename': 300,
+    'isepolicysetname': 8,
+    'selectedaccessservice': 5,
+    'authorizationpolicymatchedrule': 40,
+    'ndlocation': 60,
+    'adhostresolveddns': 20000,
+}
+
+
+def make_fields(count, seed):
+    # Extracted fields as the handler produces them: a new string object per value and message
+    rng = random.Random(seed)
+    template = parse_syslog_message(PASSED_WLC)
+    template['source_ip'] = '10.42.41.61'
+    for i in range(count):
+        fields = dict(template)
+        host = int(rng.paretovariate(1.2)) % CARDINALITY['adhostresolveddns']
+        fields['UserName'] = f"host/d-{seed}-{i:07d}"
+        fields['NetworkDeviceName'] = f"HO-SITE{rng.randrange(CARDINALITY['networkdevicename']):03d}-WLC-01"
+        fields['ISEPolicySetName'] = f"POISE_Wireless_Policy_Set_{rng.randrange(CARDINALITY['isepolicysetname'])}"
+        fields['SelectedAccessService'] = f"EAP-TLS-Only-Service-{rng.randrange(CARDINALITY['selectedaccessservice'])}"
+        fields['AuthorizationPolicyMatchedRule'] = \
+            f"Domain Computers Wireless Rule {rng.randrange(CARDINALITY['authorizationpolicymatchedrule'])}"
+        fields['NetworkDeviceGroups=Location#'] = f"All Locations#Region {rng.randrange(CARDINALITY['ndlocation'])}#Building"
+        fields['AD-Host-Resolved-DNs'] = f"CN=H-{host:07d}\\,OU=HO Managed\\,DC=Poise\\,DC=Local"
+        yield fields
+
+
+def batch_rss(interned, count, results):
+    schema = SCHEMA if interned else TableSchema('pwa', SCHEMA.columns)
+    gc.collect()
+    before = psutil.Process().memory_info().rss
+    batch = [schema.build_row(fields) for fields in make_fields(count, 1)]
+    gc.collect()
+    results.put((interned, psutil.Process().memory_info().rss - before, len(batch)))
+
+
+def measure_rss(count):
+    if psutil is None:
+        print("RSS: needs psutil")
+        return
+    results = multiprocessing.Queue()
+    for interned in (False, True):
+        process = multiprocessing.Process(target=batch_rss, args=(interned, count, results))
+        process.start()
+        process.join()
+        interned, rss, rows = results.get()
+        print(f"{'interned' if interned else 'plain':>9}: {rows} batched rows hold {rss / 2**20:.1f} MB RSS "
+              f"({rss / rows:.0f} bytes/row)")
+
+
+def prepare_database(dsn, database):
+    conn = psycopg2.connect(dsn)
+    conn.autocommit = True
+    with conn.cursor() as cursor:
+        cursor.execute(f'DROP DATABASE IF EXISTS "{database}"')
+        cursor.execute(f'CREATE DATABASE "{database}"')
+    conn.close()
+    return make_dsn(dsn, dbname=database)
+
+
+def stored_bytes(cursor, tables):
+    # Tables with their partitions, TOAST and indexes
+    cursor.execute("SELECT sum(pg_total_relation_size(relid)) FROM unnest(%s::regclass[]) AS t(name), "
+                   "pg_partition_tree(t.name)", (tables,))
+    return cursor.fetchone()[0]
+
+
+def load(conn, rows, batch_size):
+    # Returns the seconds taken and the bytes of COPY text sent
+    inserter = BatchedDatabaseInserter(SCHEMA)
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+    started = time.perf_counter()
+    with conn.cursor() as cursor:
+        for batch in batches:
+            inserter.write_rows(cursor, batch)
+            conn.commit()
+        seconds = time.perf_counter() - started
+        if inserter.encoder is not None:
+            batches = [inserter.encoder.encode(cursor, batch) for batch in batches]
+    conn.commit()
+    return seconds, sum(len(format_copy_rows(batch).getvalue()) for batch in batches)
+
+
+def run(conn, layout, rows, batch_size):
+    with conn.cursor() as cursor:
+        if layout == 'plain':
+            cursor.execute(SCHEMA.render_ddl())
+        else:
+            cursor.execute('DROP TABLE public.pwa')
+            cursor.execute(render_ddl(SCHEMA))
+    conn.commit()
+    # Half the rows with a cold dimension cache, then the other half with a warm one; the
+    # plain layout has no cache, and its two halves show the run-to-run spread
+    half = len(rows) // 2
+    for cache, part in (('cold', rows[:half]), ('warm', rows[half:])):
+        seconds, sent = load(conn, part, batch_size)
+        print(f"{layout:>9} {cache}: {len(part)} rows in {seconds:.2f}s = {len(part) / seconds:,.0f} rows/s, "
+              f"COPY text {sent / len(part):.0f} bytes/row")
+    with conn.cursor() as cursor:
+        tables = ['public.pwa'] if layout == 'plain' else \
+            ['public.pwa_facts'] + [f'public.dim_{column}' for column in SCHEMA.dimensions]
+        stored = stored_bytes(cursor, tables)
+    conn.commit()
+    print(f"{layout:>9}: {len(rows)} rows stored in {stored / 2**20:.1f} MB ({stored / len(rows):.0f} bytes/row)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the plain against the dictionary encoded pwa table")
+    parser.add_argument('--dsn', default=DATABASE_URL, help="Server to create the benchmark database on")
+    parser.add_argument('--database', default='syslog_bench_dimensions')
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=2000)
+    args = parser.parse_args()
+
+    measure_rss(args.rows)
+    rows = [SCHEMA.build_row(fields) for fields in make_fields(args.rows, 2)]
+    dsn = prepare_database(args.dsn, args.database)
+    conn = psycopg2.connect(dsn)
+    try:
+        for layout in ('plain', 'encoded'):
+            run(conn, layout, rows, args.batch_size)
+    finally:
+        conn.close()
+        admin = psycopg2.connect(args.dsn)
+        admin.autocommit = True
+        with admin.cursor() as cursor:
+            cursor.execute(f'DROP DATABASE IF EXISTS "{args.database}"')
+        admin.close()
@@ -0,0 +1,144 @@
+import argparse
+import time
+import psycopg2
+from database_utils import BatchedDatabaseInserter, DATABASE_URL, database_writer, cleanup_connections
+from flush_scheduler import FlushScheduler, TARGET_LATENCY
+from metrics import metrics
+from table_schemas import TABLES, TableSchema
+from benchmark_copy import make_rows
+
+# Feeds pwa rows at a low, a medium and a burst rate into a BatchedDatabaseInserter that
+# writes through the service's DatabaseWriter, once with the old fixed policy (200-row
+# batches, stale batches sent after 60s) and once with the FlushScheduler, and reports
+# the rows per write, the rows/s of write time (the writers' throughput) and the row
+# latency from add_to_batch to commit. Uses the
+# database in DATABASE_URL (SYSLOG_DATABASE_URL) and a bench_flush_pwa table dropped at
+# the end.
+#
+#   python benchmark_flush.py --seconds 20
+
+TABLE = 'bench_flush_pwa'
+# name -> (rows per second, seconds); the burst phase is a quiet second, then the rate
+LOADS = {
+    'low': (20, None),
+    'medium': (2000, None),
+    'burst': (20000, 5),
+}
+FIXED_BATCH_ROWS = 200
+FIXED_MAX_WAIT = 60
+
+
+def prepare(conn):
+    schema = TableSchema(TABLE, TABLES['pwa'].columns)
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS public.{TABLE}")
+        cursor.execute(schema.render_ddl())
+        cursor.execute(f"ALTER TABLE public.{TABLE} ADD COLUMN committed_at timestamp with time zone DEFAULT clock_timestamp()")
+    conn.commit()
+    return schema
+
+
+def feed(inserter, template, rate, seconds, tick):
+    # Rows carry their add time in username; tick() runs between rows as the worker loop would
+    username = inserter.fields.index('username')
+    total = int(rate * seconds)
+    started = time.time()
+    for i in range(total):
+        due = started + i / rate
+        while True:
+            now = time.time()
+            tick(now)
+            if now >= due:
+                break
+            time.sleep(min(due - now, 0.01))
+        row = list(template[i % len(template)])
+        row[username] = f"{time.time():.6f}"
+        inserter.add_to_batch(tuple(row))
+    return total
+
+
+def wait_for_rows(conn, expected, tick, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        tick(time.time())
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT count(*) FROM {TABLE}")
+            if cursor.fetchone()[0] >= expected:
+                return True
+        conn.commit()
+        time.sleep(0.05)
+    return False
+
+
+def measure(conn):
+    with conn.cursor() as cursor:
+        cursor.execute(f"""
+            SELECT count(*),
+                   extract(epoch FROM max(committed_at)) - min(username::float8),
+                   percentile_cont(ARRAY[0.5, 0.99]) WITHIN GROUP (ORDER BY extract(epoch FROM committed_at) - username::float8),
+                   max(extract(epoch FROM committed_at) - username::float8)
+            FROM {TABLE}""")
+        rows, span, (p50, p99), worst = cursor.fetchone()
+        cursor.execute(f"TRUNCATE {TABLE}")
+    conn.commit()
+    return rows, span, p50, p99, worst
+
+
+def run(conn, schema, template, policy, load, rate, seconds, target_latency, timeout):
+    inserter = BatchedDatabaseInserter(schema)
+    if policy == 'fixed':
+        inserter.max_batch_size = FIXED_BATCH_ROWS
+        inserter.max_wait_time = FIXED_MAX_WAIT
+        last_tick = [0.0]
+
+        def tick(now):
+            # The old worker loop: stale batches checked once a second
+            if now - last_tick[0] >= 1:
+                last_tick[0] = now
+                inserter.flush_if_stale(now)
+    else:
+        scheduler = FlushScheduler({TABLE: inserter}, target_latency=target_latency)
+        tick = scheduler.tick
+
+    write_time = ('syslog_stage_seconds', (('stage', 'insert'), ('table', TABLE)))
+    batches_before = database_writer.stats['batches']
+    seconds_before = metrics.histograms.get(write_time, [0])[-1]
+    if load == 'burst':
+        feed(inserter, template, 10, 1, tick)
+    total = (10 if load == 'burst' else 0) + feed(inserter, template, rate, seconds, tick)
+    if not wait_for_rows(conn, total, tick, timeout):
+        # Whatever is still batched goes out now, so the rows count towards the latency
+        inserter.flush()
+        wait_for_rows(conn, total, lambda now: None, 30)
+    batches = database_writer.stats['batches'] - batches_before
+    writing = metrics.histograms.get(write_time, [0])[-1] - seconds_before
+    rows, span, p50, p99, worst = measure(conn)
+    print(f"{policy:>8} {load:>6} {rate:>6}/s: {rows} rows over {span:.1f}s in {batches} writes "
+          f"({rows / max(batches, 1):.0f} rows/write, {rows / max(writing, 1e-9):,.0f} rows/s of write time), "
+          f"latency p50 {p50:.2f}s p99 {p99:.2f}s max {worst:.2f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark fixed against adaptive inserter batching")
+    parser.add_argument('--seconds', type=float, default=20, help="Length of the low and medium phases")
+    parser.add_argument('--target-latency', type=float, default=TARGET_LATENCY)
+    parser.add_argument('--timeout', type=float, default=FIXED_MAX_WAIT + 15,
+                        help="How long to wait for the last rows before flushing them")
+    parser.add_argument('--policies', nargs='+', default=['fixed', 'adaptive'], choices=['fixed', 'adaptive'])
+    parser.add_argument('--loads', nargs='+', default=list(LOADS), choices=list(LOADS))
+    args = parser.parse_args()
+
+    template = make_rows(1000)
+    conn = psycopg2.connect(DATABASE_URL)
+    try:
+        schema = prepare(conn)
+        for load in args.loads:
+            rate, seconds = LOADS[load]
+            for policy in args.policies:
+                run(conn, schema, template, policy, load, rate, seconds or args.seconds, args.target_latency, args.timeout)
+    finally:
+        cleanup_connections()
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS public.{TABLE}")
+        conn.commit()
+        conn.close()
@@ -0,0 +1,209 @@
+import argparse
+import re
+import time
+from datetime import datetime
+import cisco_ise_passed_attempts_handler
+import cisco_ise_failed_attempts_handler
+import cisco_ise_tacacs_accounting_handler
+
+# Compares the per-field regex parsers the ISE handlers used (one scan of the message per
+# field) with the single-pass attribute tokenizer they use now, on a corpus shaped like
+# production traffic: wired and wireless passed authentications, a reassembled multi-chunk
+# failed attempt and TACACS accounting. Reports microseconds per message for each parser.
+
+PASSED_SWITCH = (
+    "<181>Aug  9 12:11:07 HO-FRN-ISE-03S CISE_Passed_Authentications 0032587284 1 0 2024-08-09 12:11:07.453 +00:00 "
+    "1342420270 5200 NOTICE Passed-Authentication: Authentication succeeded, ConfigVersionId=429, "
+    "Device IP Address=10.42.41.61, DestinationIPAddress=10.23.18.220, DestinationPort=1812, UserName=host/D-5NRH5G3, "
+    "Protocol=Radius, RequestLatency=42, NetworkDeviceName=HO-TMS-SW80-4B-Comms, User-Name=host/D-5NRH5G3.poise.local, "
+    "NAS-IP-Address=10.42.41.61, NAS-Port=50147, Service-Type=Framed, Framed-MTU=1500, "
+    "Called-Station-ID=B0-8B-D0-4A-ED-03, Calling-Station-ID=E8-EA-6A-40-21-F3, NAS-Port-Type=Ethernet, "
+    "NAS-Port-Id=GigabitEthernet1/0/47, cisco-av-pair=service-type=Framed, cisco-av-pair=method=dot1x, "
+    "OriginalUserName=host/d-5nrh5g3, AuthenticationIdentityStore=POISE_AD, AuthenticationMethod=x509_PKI, "
+    "SelectedAccessService=EAP-TLS-Only, SelectedAuthorizationProfiles=Wired_Secure, "
+    "IdentityGroup=Endpoint Identity Groups:Profiled:Workstation, "
+    + "Step=11001, Step=11017, Step=15049, Step=15008, " * 12
+    + "SelectedAuthenticationIdentityStores=HO_CAP, AuthenticationStatus=AuthenticationPassed, "
+    "NetworkDeviceGroups=Location#All Locations#TMS#Peel House, NetworkDeviceGroups=Device Type#All Device Types#switch, "
+    "NetworkDeviceGroups=Rollout Stage#Rollout Stage#Secure, NetworkDeviceGroups=Reauth Controller#Reauth Controller, "
+    "NetworkDeviceGroups=Closed Mode#Closed Mode#Enabled, IdentityPolicyMatchedRule=Default, "
+    "AuthorizationPolicyMatchedRule=Domain Computers, Subject - Common Name=D-5NRH5G3, "
+    "Subject=CN=D-5NRH5G3\\,OU=HO Managed\\,DC=Poise\\,DC=Local, EndPointMACAddress=E8-EA-6A-40-21-F3, "
+    "ISEPolicySetName=POISE_Wired_Secure_Dot1X, AD-Host-Resolved-DNs=CN=D-5NRH5G3\\,OU=HO Managed\\,DC=Poise\\,DC=Local, "
+    "Days to Expiry=593, Network Device Profile=Cisco, "
+    "Response={Session-Timeout=28800; Termination-Action=RADIUS-Request; cisco-av-pair=ACS:CiscoSecure-Defined-ACL=#ACSACL#-IP-PERMIT; }"
+)
+
+PASSED_WLC = (
+    PASSED_SWITCH.replace("HO-TMS-SW80-4B-Comms", "HO-FRN-WLC-01")
+    .replace("Called-Station-ID=B0-8B-D0-4A-ED-03", "Called-Station-ID=b0-8b-d0-4a-ed-03:POISE-SECURE")
+    .replace("NAS-Port-Type=Ethernet", "NAS-Port-Type=Wireless - IEEE 802.11, RadiusFlowType=Wireless802_1x")
+)
+
+FAILED_CHUNKS = [
+    "<181>Jul 14 23:05:57 HO-FRN-ISE-04S CISE_Failed_Attempts 0002046765 3 0 2024-07-14 23:05:57.201 +01:00 "
+    "0184512730 5400 NOTICE Failed-Attempt: Authentication failed, ConfigVersionId=429, Device IP Address=10.42.41.61, "
+    "DestinationIPAddress=10.23.18.220, DestinationPort=1812, UserName=host/D-5NRH5G3, Protocol=Radius, "
+    "RequestLatency=311, NetworkDeviceName=HO-TMS-SW80-4B-Comms, NAS-IP-Address=10.42.41.61, "
+    "Called-Station-ID=B0-8B-D0-4A-ED-03:POISE, NAS-Port-Id=GigabitEthernet1/0/47, Remote-Address=E8-EA-6A-40-21-F3, "
+    "FailureReason=24486 Machine authentication against Active Directory has failed because the machine's account is disabled,",
+    "<181>Jul 14 23:05:57 HO-FRN-ISE-04S CISE_Failed_Attempts 0002046765 3 1  "
+    + "Step=11001, Step=11018, Step=12504, Step=12505, " * 15
+    + "StepData=80=CN=D-5NRH5G3\\,OU=HO Managed\\,DC=Poise\\,",
+    "<181>Jul 14 23:05:57 HO-FRN-ISE-04S CISE_Failed_Attempts 0002046765 3 2 DC=HomeOffice\\,DC=Local, "
+    "Days to Expiry=593, Network Device Profile=Cisco, Response={RadiusPacketType=AccessReject; AuthenticationResult=Failed; },",
+]
+FAILED = ''.join(FAILED_CHUNKS)
+
+TACACS = (
+    "<181>Aug  9 12:11:07 HO-FRN-ISE-03S CISE_TACACS_Accounting 0032587290 1 0 2024-08-09 12:11:07.611 +00:00 "
+    "1342420299 3300 NOTICE TACACS-Accounting: TACACS+ Accounting with Command, ConfigVersionId=429, "
+    "Device IP Address=10.42.41.61, RequestLatency=2, NetworkDeviceName=HO-TMS-SW80-4B-Comms, User=solarwinds, "
+    "Port=tty1, Remote-Address=10.221.16.49, Authen-Method=None, Service-Argument=shell, AcctRequest-Flags=Stop, "
+    "CmdSet=[ CmdAV=show CmdArgAV=interfaces CmdArgAV=status CmdArgAV=<cr> ], "
+    "NetworkDeviceGroups=Location#All Locations#TMS#Peel House, NetworkDeviceGroups=Device Type#All Device Types#switch"
+)
+
+TIMESTAMP = re.compile(r'\d* \d* (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}.\d* \+\d{2}:\d{2})')
+
+
+def legacy_parse_passed(message):
+    common_field_patterns = {
+        'NAS-IP-Address': r'NAS-IP-Address=(.*?),[\s<]',
+        'NAS-Port-Id': r'NAS-Port-Id=(.*?),[\s<]',
+        'NetworkDeviceName': r'NetworkDeviceName=(.*?),[\s<]',
+        'DeviceIP': r'Device IP Address=(.*?),[\s<]',
+        'RequestLatency': r'RequestLatency=(.*?),[\s<]',
+        'cisco-av-pair=method': r'cisco-av-pair=method=(.*?),[\s<]',
+        'UserName': r'UserName=(.*?),[\s<]',
+        'AuthenticationMethod': r'AuthenticationMethod=(.*?),[\s<]',
+        'AuthenticationIdentityStore': r'[^=]AuthenticationIdentityStore=(.*?),[\s<]',
+        'SelectedAccessService': r'SelectedAccessService=(.*?),[\s<]',
+        'SelectedAuthorizationProfiles': r'SelectedAuthorizationProfiles=(.*?),[\s<]',
+        'IdentityGroup': r'[^(Host)]IdentityGroup=Endpoint Identity Groups:(.*?),[\s<]',
+        'SelectedAuthenticationIdentityStores': r'SelectedAuthenticationIdentityStores=(.*?),[\s<]',
+        'AuthenticationStatus': r'AuthenticationStatus=(.*?),[\s<]',
+        'NetworkDeviceGroups=Location#': r'NetworkDeviceGroups=Location#(.*?),[\s<]',
+        'NetworkDeviceGroups=Device=': r'NetworkDeviceGroups=Device Type#(.*?),[\s<]',
+        'NetworkDeviceGroups=Rollout=': r'NetworkDeviceGroups=Rollout Stage#(.*?),[\s<]',
+        'NetworkDeviceGroups=Reauth=': r'NetworkDeviceGroups=Reauth Controller#(.*?),[\s<]',
+        'NetworkDeviceGroups=Closed=': r'NetworkDeviceGroups=Closed Mode#(.*?),[\s<]',
+        'IdentityPolicyMatchedRule': r'IdentityPolicyMatchedRule=(.*?),[\s<]',
+        'AuthorizationPolicyMatchedRule': r'AuthorizationPolicyMatchedRule=(.*?),[\s<]',
+        'Subject - Common Name': r'Subject - Common Name=(.*?),[\s<]',
+        'EndPointMACAddress': r'EndPointMACAddress=(.*?),[\s<]',
+        'ISEPolicySetName': r'ISEPolicySetName=(.*?),[\s<]',
+        'AD-Host-Resolved-DNs': r'AD-Host-Resolved-DNs=(.*?),[\s<]',
+        'Days to Expiry': r'Days to Expiry=(.*?),[\s<]',
+        'Session-Timeout': r'Session-Timeout=(.*?);[\s<]',
+        'cisco-av-pair=ACS': r'cisco-av-pair=ACS:(.*?);[\s<]'
+    }
+    wlc_field_patterns = {
+        'Called-Station-ID': r'Called-Station-ID=([^,:]+)',
+        'RadiusFlowType': r'RadiusFlowType=(.*?),[\s<]'
+    }
+
+    extracted_fields = {}
+    for key, pattern in common_field_patterns.items():
+        matches = re.findall(pattern, message)
+        if matches:
+            if len(matches) > 1:
+                if key == 'UserName':
+                    matches = [x.replace("-", "").lower() for x in matches]
+                unique_matches = list(set(matches))
+                extracted_fields[key] = ", ".join(unique_matches) if len(unique_matches) > 1 else unique_matches[0]
+            else:
+                extracted_fields[key] = matches[0]
+
+    if 'NetworkDeviceName' in extracted_fields and 'WLC' in extracted_fields['NetworkDeviceName']:
+        for key, pattern in wlc_field_patterns.items():
+            matches = re.findall(pattern, message)
+            if matches:
+                extracted_fields[key] = matches[0]
+
+    timestamp = TIMESTAMP.search(message)
+    extracted_fields['timestamp'] = timestamp.group(1) if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return extracted_fields
+
+
+def legacy_parse_failed(message):
+    field_patterns = {
+        'UserName': r'UserName=([^,]+)',
+        'NASIPAddress': r'NAS-IP-Address=([^,]+)',
+        'CalledStationID': r'Called-Station-ID=([^,:]+)',
+        'NasPortID': r'NAS-Port-Id=([^\s,]+)',
+        'FailureReason': r'FailureReason=([^,]+)',
+        'NetworkDeviceName': r'NetworkDeviceName=([^,]+)',
+        'RemoteAddress': r'Remote-Address=([^,]+)',
+        'RequestLatency': r'RequestLatency=([^,]+)',
+        'Device IP Address': r'Device IP Address=([^,]+)',
+    }
+    data = {}
+    for key, pattern in field_patterns.items():
+        match = re.search(pattern, message)
+        if match:
+            data[key] = match.group(1)
+    return data
+
+
+def legacy_parse_tacacs(message):
+    patterns = {
+        'Username': r'User=([^,]+)',
+        'NetworkDeviceName': r'NetworkDeviceName=([^,]+)',
+        'NetworkDeviceIP': r'Device IP Address=([^,]+)',
+        'RemoteDevice': r'Remote-Address=([^,]+)',
+        'CmdSet': r'CmdSet=\[ CmdAV=([^,]+) ]',
+        'timestamp': r'\d* \d* (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}.\d* \+\d{2}:\d{2})'
+    }
+    data = {}
+    for key, pattern in patterns.items():
+        match = re.search(pattern, message)
+        if match:
+            data[key] = match.group(1)
+    if 'CmdSet' in data:
+        data['CmdSet'] = data['CmdSet'].replace("CmdArgAV=", "")
+    if 'timestamp' not in data:
+        data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return data
+
+
+CORPUS = [
+    ('passed-switch', PASSED_SWITCH, legacy_parse_passed, cisco_ise_passed_attempts_handler.parse_syslog_message),
+    ('passed-wlc', PASSED_WLC, legacy_parse_passed, cisco_ise_passed_attempts_handler.parse_syslog_message),
+    ('failed-3-chunk', FAILED, legacy_parse_failed, cisco_ise_failed_attempts_handler.parse_syslog_message),
+    ('tacacs', TACACS, legacy_parse_tacacs, cisco_ise_tacacs_accounting_handler.parse_syslog_message),
+]
+
+
+def comparable(fields):
+    # The legacy parsers give the ISE timestamp as text, the handlers as an aware datetime
+    value = fields.get('timestamp')
+    if isinstance(value, str):
+        try:
+            return dict(fields, timestamp=datetime.strptime(value, '%Y-%m-%d %H:%M:%S.%f %z'))
+        except ValueError:
+            pass
+    return fields
+
+
+def time_parser(parser, message, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        parser(message)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+if __name__ == '__main__':
+    argparser = argparse.ArgumentParser(description="Benchmark ISE attribute parsing")
+    argparser.add_argument('--iterations', type=int, default=5000)
+    args = argparser.parse_args()
+
+    for name, message, legacy, current in CORPUS:
+        legacy_fields, current_fields = comparable(legacy(message)), comparable(current(message))
+        differing = sorted(key for key in legacy_fields.keys() | current_fields.keys()
+                           if legacy_fields.get(key) != current_fields.get(key))
+        legacy_us = time_parser(legacy, message, args.iterations)
+        current_us = time_parser(current, message, args.iterations)
+        print(f"{name:>15}: {len(message)} bytes, legacy {legacy_us:.1f} us/msg, "
+              f"tokenizer {current_us:.1f} us/msg ({legacy_us / current_us:.1f}x)"
+              + (f", differing fields: {', '.join(differing)}" if differing else ""))
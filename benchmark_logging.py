@@ -0,0 +1,76 @@
+import argparse
+import logging
+import os
+import tempfile
+import time
+import log_setup
+from database_utils import inserters
+from message_combiner import FragmentReassembler
+from cisco_ise_passed_attempts_handler import handle_cisco_ise_passed_attempts
+from cisco_ise_failed_attempts_handler import handle_cisco_ise_failed_attempts
+from cisco_ise_tacacs_accounting_handler import handle_cisco_ise_tacacs_accounting
+from benchmark_ise_parsing import PASSED_SWITCH, PASSED_WLC, FAILED_CHUNKS, TACACS
+
+# Runs the worker's per-message path (fragment reassembly, ISE handler, batching) over the
+# ISE corpus with the logging set up three ways and reports messages/sec:
+#   sync DEBUG   - what the service did before: one FileHandler at DEBUG from the handlers'
+#                  basicConfig plus the console handler, both written on the worker thread
+#   queued DEBUG - log_setup's background writer, everything logged
+#   queued INFO  - log_setup at the service default, per-message logs gated off
+# Batches are kept in memory (no database needed). The console goes to os.devnull, so the
+# sync figure leaves out the cost of a real console window.
+
+STREAM = [
+    ('10.23.18.220', PASSED_SWITCH, handle_cisco_ise_passed_attempts),
+    ('10.23.18.220', PASSED_WLC, handle_cisco_ise_passed_attempts),
+    ('10.23.18.221', TACACS, handle_cisco_ise_tacacs_accounting),
+] + [('10.23.18.222', chunk, handle_cisco_ise_failed_attempts) for chunk in FAILED_CHUNKS]
+
+
+def sync_logging(directory):
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    logging.basicConfig(filename=os.path.join(directory, 'sync.log'), level=logging.DEBUG,
+                        format=log_setup.LOG_FORMAT, filemode='a')
+    console = logging.StreamHandler(open(os.devnull, 'w'))
+    console.setLevel(logging.INFO)
+    root.addHandler(console)
+
+
+def run(messages):
+    fragments = FragmentReassembler()
+    start = time.perf_counter()
+    for i in range(messages):
+        ip, message, handler = STREAM[i % len(STREAM)]
+        complete = fragments.add(ip, message)
+        if complete:
+            handler(ip, complete)
+    elapsed = time.perf_counter() - start
+    for inserter in inserters.values():
+        inserter.batch.clear()
+    return messages / elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Worker throughput with synchronous vs queued logging")
+    parser.add_argument('--messages', type=int, default=50000)
+    args = parser.parse_args()
+
+    for inserter in inserters.values():
+        inserter.max_batch_size = args.messages + 1
+    with tempfile.TemporaryDirectory() as directory:
+        setups = [
+            ('sync DEBUG', lambda: sync_logging(directory)),
+            ('queued DEBUG', lambda: log_setup.configure_logging('bench', directory, logging.DEBUG, console=False)),
+            ('queued INFO', lambda: log_setup.configure_logging('bench', directory, logging.INFO, console=False)),
+        ]
+        results = []
+        for name, setup in setups:
+            setup()
+            run(1000)
+            results.append((name, run(args.messages)))
+            log_setup.stop_logging()
+            logging.shutdown()
+        for name, rate in results:
+            print(f"{name:>12}: {rate:,.0f} msg/s ({rate / results[0][1]:.1f}x)")
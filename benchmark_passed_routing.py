@@ -0,0 +1,87 @@
+import argparse
+import random
+import time
+from cisco_ise_passed_attempts_handler import parse_syslog_message, PassedAttemptView
+from benchmark_ise_parsing import PASSED_SWITCH, PASSED_WLC
+
+# Compares routing a passed authentication the way the handler used to (extract every
+# field, then test NetworkDeviceName and the device type) with PassedAttemptView (scan
+# the routing attributes, then build only the chosen table's fields) on a mix of WLC,
+# switch and unhandled messages. Unhandled ones come from devices that are neither a WLC
+# nor a switch, such as the routers and firewalls behind VPN authentications.
+
+PASSED_UNHANDLED = (
+    PASSED_SWITCH.replace("HO-TMS-SW80-4B-Comms", "HO-FRN-RTR-01")
+    .replace("Device Type#All Device Types#switch", "Device Type#All Device Types#router")
+)
+
+
+def legacy_route(message):
+    extracted_fields = parse_syslog_message(message)
+    if 'NetworkDeviceName' in extracted_fields and 'WLC' in extracted_fields['NetworkDeviceName']:
+        return 'pwa', extracted_fields
+    if 'NetworkDeviceGroups=Device=' in extracted_fields and 'switch' in extracted_fields['NetworkDeviceGroups=Device=']:
+        return 'pla', extracted_fields
+    return None, None
+
+
+def view_route(message):
+    view = PassedAttemptView(message)
+    table = view.table()
+    return table, view.fields(table) if table else None
+
+
+def make_mix(count, unhandled_share, wlc_share):
+    rng = random.Random(42)
+    mix = []
+    for _ in range(count):
+        draw = rng.random()
+        if draw < unhandled_share:
+            mix.append(PASSED_UNHANDLED)
+        elif draw < unhandled_share + (1 - unhandled_share) * wlc_share:
+            mix.append(PASSED_WLC)
+        else:
+            mix.append(PASSED_SWITCH)
+    return mix
+
+
+def time_router(router, mix):
+    start = time.perf_counter()
+    for message in mix:
+        router(message)
+    return (time.perf_counter() - start) / len(mix) * 1e6
+
+
+def best_of(routers, mix, rounds):
+    # Alternate the routers and keep each one's best round, to even out machine noise
+    best = [float('inf')] * len(routers)
+    for _ in range(rounds):
+        for i, router in enumerate(routers):
+            best[i] = min(best[i], time_router(router, mix))
+    return best
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark passed authentication routing")
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--unhandled-shares', type=float, nargs='+', default=[0.0, 0.2, 0.5])
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--wlc-share', type=float, default=0.6, help="Share of WLC among the handled messages")
+    args = parser.parse_args()
+
+    for name, message in (('wlc', PASSED_WLC), ('switch', PASSED_SWITCH), ('unhandled', PASSED_UNHANDLED)):
+        legacy_table, legacy_fields = legacy_route(message)
+        table, fields = view_route(message)
+        if table != legacy_table:
+            print(f"{name}: routed to {table}, legacy routed to {legacy_table}")
+        elif fields is not None:
+            # The view builds only the chosen table's fields; those must match
+            differing = sorted(key for key in fields if key != 'timestamp' and fields[key] != legacy_fields.get(key))
+            if differing:
+                print(f"{name}: differing fields {', '.join(differing)}")
+
+    for unhandled_share in args.unhandled_shares:
+        mix = make_mix(args.messages, unhandled_share, args.wlc_share)
+        legacy_us, view_us = best_of([legacy_route, view_route], mix, args.rounds)
+        print(f"unhandled {unhandled_share:.0%}: legacy {legacy_us:.1f} us/msg, view {view_us:.1f} us/msg "
+              f"({legacy_us / view_us:.2f}x)")
@@ -0,0 +1,132 @@
+import argparse
+import multiprocessing
+import os
+import queue
+import socket
+import time
+from udp_receiver import open_syslog_socket, receive_batch, RECV_BUFFER_SIZE
+
+# Blasts a local UDP socket and compares the legacy one-recvfrom-per-datagram receive loop
+# with the batched receive path. Both loops hand messages to a consumer process through a
+# multiprocessing.Queue, as the service does.
+
+SAMPLE_MESSAGE = (
+    "<181>Aug  9 12:11:07 HO-FRN-ISE-03S CISE_Passed_Authentications 0032587284 1 0 2024-08-09 12:11:07.453 +00:00 "
+    "1342420270 5200 NOTICE Passed-Authentication: Authentication succeeded, ConfigVersionId=429, "
+    "Device IP Address=10.42.41.61, DestinationIPAddress=10.23.18.220, DestinationPort=1812, UserName=host/d-5nrh5g3, "
+    "NetworkDeviceName=HO-TMS-SW80-4B-Comms, NAS-IP-Address=10.42.41.61, NAS-Port-Id=GigabitEthernet1/0/47, "
+    "AuthenticationIdentityStore=POISE_AD, AuthenticationMethod=x509_PKI, SelectedAccessService=EAP-TLS-Only, "
+    + "Step=11001, " * 60
+    + "NetworkDeviceGroups=Device Type#All Device Types#switch, Response={Session-Timeout=28800; }"
+).encode()
+
+
+def udp_drops(port):
+    # Kernel drop counter for the socket bound to `port` (Linux only)
+    try:
+        with open('/proc/net/udp') as f:
+            next(f)
+            for line in f:
+                fields = line.split()
+                if int(fields[1].split(':')[1], 16) == port:
+                    return int(fields[-1])
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def sender(ip, port, duration, sent_counter):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    deadline = time.time() + duration
+    sent = 0
+    while time.time() < deadline:
+        for _ in range(100):
+            try:
+                sock.sendto(SAMPLE_MESSAGE, (ip, port))
+                sent += 1
+            except OSError:
+                pass
+    with sent_counter.get_lock():
+        sent_counter.value += sent
+    sock.close()
+
+
+def consumer(message_queue, consumed_counter, expected, stop):
+    consumed = 0
+    while not stop.is_set() or consumed < expected.value:
+        try:
+            item = message_queue.get(timeout=0.2)
+        except queue.Empty:
+            continue
+        if isinstance(item, list):
+            for _, data in item:
+                data.decode(errors='replace')
+            consumed += len(item)
+        else:
+            consumed += 1
+    consumed_counter.value = consumed
+
+
+def run(mode, ip, port, duration, senders, max_batch):
+    sock = open_syslog_socket(ip, port)
+    message_queue = multiprocessing.Queue()
+    sent_counter = multiprocessing.Value('q', 0)
+    consumed_counter = multiprocessing.Value('q', 0)
+    expected = multiprocessing.Value('q', 0)
+    stop = multiprocessing.Event()
+
+    consumer_process = multiprocessing.Process(target=consumer, args=(message_queue, consumed_counter, expected, stop))
+    consumer_process.start()
+    sender_processes = [multiprocessing.Process(target=sender, args=(ip, port, duration, sent_counter))
+                        for _ in range(senders)]
+    drops_before = udp_drops(port)
+    for p in sender_processes:
+        p.start()
+
+    received = 0
+    start = time.perf_counter()
+    deadline = time.time() + duration + 0.5
+    if mode == 'batched':
+        while time.time() < deadline:
+            batch = receive_batch(sock, max_batch, timeout=0.1)
+            if batch:
+                received += len(batch)
+                message_queue.put(batch)
+    else:
+        sock.settimeout(0.1)
+        while time.time() < deadline:
+            try:
+                data, addr = sock.recvfrom(RECV_BUFFER_SIZE)
+            except socket.timeout:
+                continue
+            received += 1
+            message_queue.put((addr[0], data.decode()))
+    elapsed = time.perf_counter() - start
+
+    for p in sender_processes:
+        p.join()
+    drops_after = udp_drops(port)
+    expected.value = received
+    stop.set()
+    consumer_process.join()
+    sock.close()
+
+    drops = None if drops_before is None or drops_after is None else drops_after - drops_before
+    print(f"{mode:>8}: sent={sent_counter.value} received={received} consumed={consumed_counter.value} "
+          f"rate={received / elapsed:,.0f} datagrams/s kernel_drops={drops if drops is not None else 'n/a'} "
+          f"lost={sent_counter.value - received}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the syslog UDP receive path")
+    parser.add_argument('--ip', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=15514)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--senders', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--max-batch', type=int, default=512)
+    parser.add_argument('--mode', choices=['single', 'batched', 'both'], default='both')
+    args = parser.parse_args()
+
+    modes = ['single', 'batched'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        run(mode, args.ip, args.port, args.duration, args.senders, args.max_batch)
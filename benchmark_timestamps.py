@@ -0,0 +1,105 @@
+import argparse
+import re
+import time
+from datetime import datetime
+import psycopg2
+from database_utils import BatchedDatabaseInserter, DATABASE_URL, format_copy_rows
+from table_schemas import TABLES, TableSchema
+from timestamps import ise_timestamp, now_tick
+from benchmark_copy import make_rows
+from benchmark_ise_parsing import PASSED_SWITCH
+
+# Parse+insert cost per row of the "timestamp" column, before and after the timestamps
+# module: the handlers' old regex search with a strftime fallback, passing text, against
+# the header read with its per-second cache, passing timezone-aware datetimes. Messages
+# are an ISE burst (--per-second messages in each second, distinct fractions) plus a share
+# without a header time. Rows are pwa rows loaded with COPY into a temporary table, one
+# commit per batch as the inserter does; parse, COPY text and load are timed apart since
+# the rest of the row costs the same either way. Needs the PostgreSQL server in DATABASE_URL (or --dsn).
+
+LEGACY_TIMESTAMP = re.compile(r'\d* \d* (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}.\d* \+\d{2}:\d{2})')
+# One message in NO_TIME_EVERY has no time in its header (a later chunk reassembled first)
+NO_TIME_EVERY = 50
+
+
+def legacy_timestamp(message):
+    timestamp = LEGACY_TIMESTAMP.search(message)
+    return timestamp.group(1) if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def native_timestamp(message):
+    return ise_timestamp(message) or now_tick()
+
+
+def make_messages(count, per_second):
+    messages = []
+    for i in range(count):
+        second, fraction = divmod(i, per_second)
+        if i % NO_TIME_EVERY == 0:
+            stamp = ' '
+        else:
+            stamp = f"2024-08-09 {12 + second // 3600 % 12:02d}:{second // 60 % 60:02d}:{second % 60:02d}.{fraction % 1000:03d} +01:00"
+        messages.append(PASSED_SWITCH.replace('2024-08-09 12:11:07.453 +00:00', stamp, 1))
+    return messages
+
+
+def best_of(repeats, work):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        work()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def run(conn, name, parse, messages, rows, batch_size, repeats):
+    # Per row: the handler's parse, the loader's COPY text and the load with its commit
+    # (formatting included), each the best of `repeats`
+    schema = TableSchema(f'bench_ts_{name}', TABLES['pwa'].columns)
+    inserter = BatchedDatabaseInserter(schema)
+    column = inserter.fields.index('timestamp')
+    parsing = best_of(repeats, lambda: [parse(message) for message in messages])
+    rows = [row[:column] + (parse(message),) + row[column + 1:] for message, row in zip(messages, rows)]
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+    formatting = best_of(repeats, lambda: [format_copy_rows(batch) for batch in batches])
+
+    with conn.cursor() as cursor:
+        def load():
+            cursor.execute(f"DROP TABLE IF EXISTS pg_temp.{schema.name}")
+            cursor.execute(schema.render_ddl().replace('public.', 'pg_temp.'))
+            conn.commit()
+            for batch in batches:
+                inserter.write_rows(cursor, batch)
+                conn.commit()
+        loading = best_of(repeats, load)
+
+        # Event times only: the fallback differs by when each run handled the message
+        cursor.execute(f"SELECT count(*), sum(extract(epoch FROM \"timestamp\")) FILTER (WHERE \"timestamp\" < '2025-01-01') "
+                       f"FROM {schema.name}")
+        loaded, checksum = cursor.fetchone()
+    per_row = 1e6 / loaded
+    print(f"{name:>7} batch={batch_size:>6}: parse {parsing * per_row:.2f} us/row, COPY text {formatting * per_row:.2f} us/row, "
+          f"load {loading * per_row:.2f} us/row, parse+load {(parsing + loading) * per_row:.2f} us/row")
+    return checksum
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark text against native timestamps for parse+insert")
+    parser.add_argument('--dsn', default=DATABASE_URL)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--per-second', type=int, default=200, help="ISE messages sharing each second")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[2000, 20000])
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+
+    messages = make_messages(args.rows, args.per_second)
+
+    rows = make_rows(args.rows)
+    conn = psycopg2.connect(args.dsn)
+    try:
+        for batch_size in args.batch_sizes:
+            checksums = [run(conn, name, parse, messages, rows, batch_size, args.repeats)
+                         for name, parse in (('legacy', legacy_timestamp), ('native', native_timestamp))]
+            print(f"{'':>7} stored event times {'match' if checksums[0] == checksums[1] else f'DIFFER {checksums!r}'}")
+    finally:
+        conn.close()
@@ -0,0 +1,85 @@
+import argparse
+import multiprocessing
+import queue
+import time
+from shared_ring import SharedRingBuffer
+from benchmark_receive import SAMPLE_MESSAGE
+
+# Compares the receiver -> worker hand-off: multiprocessing.Queue with one (addr, str) per
+# datagram and a qsize() check per put (the original path), Queue with one list per batch,
+# and the shared-memory ring. Reports messages/sec and CPU per message across both sides.
+
+
+def consume(transport, mode, total, stats):
+    start_cpu = time.process_time()
+    consumed = 0
+    while consumed < total:
+        try:
+            item = transport.get(timeout=5)
+        except queue.Empty:
+            break
+        if mode == 'queue-per-message':
+            consumed += 1
+        else:
+            for _, data in item:
+                data.decode(errors='replace')
+            consumed += len(item)
+    stats['consumed'].value = consumed
+    stats['cpu'].value = time.process_time() - start_cpu
+
+
+def produce(transport, mode, total, batch_size, max_queue_size):
+    message = SAMPLE_MESSAGE
+    if mode == 'queue-per-message':
+        text = message.decode()
+        for _ in range(total):
+            if transport.qsize() < max_queue_size:
+                transport.put(('10.23.18.218', text))
+        return
+    # Distinct bytes objects, as recvfrom returns, so pickle cannot memoise repeats within a batch
+    batch = [('10.23.18.218', bytes(bytearray(message))) for _ in range(batch_size)]
+    sent = 0
+    while sent < total:
+        if mode == 'ring':
+            # Back off instead of overflowing so every mode moves the same number of messages
+            while transport.num_slots - transport.qsize() < batch_size:
+                time.sleep(0.0001)
+        transport.put(batch)
+        sent += batch_size
+
+
+def run(mode, total, batch_size, ring_slots):
+    if mode == 'ring':
+        transport = SharedRingBuffer(ring_slots)
+    else:
+        transport = multiprocessing.Queue()
+    stats = {'consumed': multiprocessing.Value('q', 0), 'cpu': multiprocessing.Value('d', 0.0)}
+    consumer = multiprocessing.Process(target=consume, args=(transport, mode, total, stats))
+    consumer.start()
+
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    produce(transport, mode, total, batch_size, max_queue_size=100000)
+    consumer.join()
+    # Measured after the consumer finishes so the Queue feeder thread's pickling is included
+    producer_cpu = time.process_time() - start_cpu
+    elapsed = time.perf_counter() - start
+    if mode == 'ring':
+        transport.close()
+
+    consumed = stats['consumed'].value
+    cpu_per_message = (producer_cpu + stats['cpu'].value) / max(consumed, 1) * 1e6
+    print(f"{mode:>18}: {consumed} messages in {elapsed:.2f}s = {consumed / elapsed:,.0f} msg/s, "
+          f"CPU {cpu_per_message:.2f} us/msg (producer {producer_cpu:.2f}s, consumer {stats['cpu'].value:.2f}s)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark receiver to worker transports")
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--batch-size', type=int, default=256)
+    parser.add_argument('--ring-slots', type=int, default=8192)
+    args = parser.parse_args()
+
+    total = args.messages - args.messages % args.batch_size
+    for mode in ('queue-per-message', 'queue-batched', 'ring'):
+        run(mode, total, args.batch_size, args.ring_slots)
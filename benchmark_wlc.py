@@ -0,0 +1,55 @@
+import argparse
+import os
+import tempfile
+import time
+import wlc_handler
+from database_utils import wlc_inserter
+from rotating_sink import RotatingFileSink
+
+# WLC-only load through the old handler (open, append one line, close per datagram) and
+# through the rotating sink, with and without compression of rotated segments and with
+# parsing into the wlc table (batches kept in memory, no database needed). Reports
+# messages/sec; the small max_bytes makes the sink rotate during the run.
+
+WLC_MESSAGES = [
+    "<133>HO-FRN-WLC-01: *apfMsConnTask_5: Aug 09 12:11:07.453: %APF-6-USER_NAME_CREATED: apf_ms.c:2012 "
+    "Username:host/d-5nrh5g3.poise.local Client:e8:ea:6a:40:21:f3",
+    "<134>HO-FRN-WLC-01: *Dot1x_NW_MsgTask_2: Aug 09 12:11:07.611: %DOT1X-6-MAX_EAPOL_KEY_RETRANS_REACHED: "
+    "1x_ptsm.c:599 Max EAPOL-key M1 retransmissions exceeded for client b0:8b:d0:4a:ed:03",
+    "<131>HO-FRN-WLC-02: *spamApTask3: Aug 09 12:11:08.002: %CAPWAP-3-ECHO_ERR: capwap_ac_sm.c:7574 "
+    "Did not receive heartbeat reply; AP: 00:3a:7d:11:22:33",
+]
+
+
+def legacy_handle(directory, message):
+    with open(os.path.join(directory, 'WLC.txt'), 'a') as file:
+        file.write(message + '\n')
+
+
+def run(handle, messages):
+    start = time.perf_counter()
+    for i in range(messages):
+        handle(WLC_MESSAGES[i % len(WLC_MESSAGES)])
+    return messages / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark WLC output")
+    parser.add_argument('--messages', type=int, default=200000)
+    args = parser.parse_args()
+
+    wlc_inserter.max_batch_size = args.messages + 1
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        results.append(('per-message open/close', run(lambda message: legacy_handle(directory, message), args.messages)))
+        for compression in (None, 'gzip', 'zstd'):
+            sink = RotatingFileSink(os.path.join(directory, f'WLC-{compression}.txt'), max_bytes=8 * 1024 * 1024,
+                                    compression=compression)
+            results.append((f'sink, compression {compression}', run(sink.write, args.messages)))
+            sink.close()
+        wlc_handler.wlc_output.update(to_file=False, to_database=True)
+        results.append(('parse into wlc batches', run(lambda message: wlc_handler.handle_wlc_syslog('10.23.16.25', message),
+                                                      args.messages)))
+        wlc_inserter.batch.clear()
+    for name, rate in results:
+        print(f"{name:>26}: {rate:,.0f} msg/s")
@@ -1,58 +1,52 @@
 import logging
-from datetime import datetime
-import re
 from database_utils import fta_inserter, fwa_inserter, fla_inserter
+from ise_attributes import parse_ise_attributes
+from timestamps import ise_timestamp, now_tick
 
-# Setup logging
-logging.basicConfig(filename=r'C:\Syslog\cisco_ise_failed_attempts_handler.log', level=logging.DEBUG,
-                    format='%(asctime)s - %(processName)s - %(threadName)s - %(levelname)s - %(message)s', filemode='a')
+# Extracted field -> (ISE attribute, characters that end the value)
+FIELD_ATTRIBUTES = {
+    'UserName': ('UserName', ','),
+    'NASIPAddress': ('NAS-IP-Address', ','),
+    'CalledStationID': ('Called-Station-ID', ',:'),
+    'NasPortID': ('NAS-Port-Id', ', '),
+    'FailureReason': ('FailureReason', ','),
+    'NetworkDeviceName': ('NetworkDeviceName', ','),
+    'RemoteAddress': ('Remote-Address', ','),
+    'RequestLatency': ('RequestLatency', ','),
+    'Device IP Address': ('Device IP Address', ','),
+}
+WANTED_ATTRIBUTES = frozenset(attribute for attribute, _ in FIELD_ATTRIBUTES.values())
 
 def parse_syslog_message(message):
-    field_patterns = {
-        'UserName': r'UserName=([^,]+)',
-        'NASIPAddress': r'NAS-IP-Address=([^,]+)',
-        'CalledStationID': r'Called-Station-ID=([^,:]+)',
-        'NasPortID': r'NAS-Port-Id=([^\s,]+)',
-        'FailureReason': r'FailureReason=([^,]+)',
-        'NetworkDeviceName': r'NetworkDeviceName=([^,]+)',
-        'RemoteAddress': r'Remote-Address=([^,]+)',
-        'RequestLatency': r'RequestLatency=([^,]+)',
-        'Device IP Address': r'Device IP Address=([^,]+)',
-    }
+    attributes = parse_ise_attributes(message, WANTED_ATTRIBUTES)
 
     data = {}
-    for key, pattern in field_patterns.items():
-        match = re.search(pattern, message)
-        if match:
-            data[key] = match.group(1)
+    for key, (attribute, stop_chars) in FIELD_ATTRIBUTES.items():
+        values = attributes.get(attribute)
+        if values:
+            value = values[0]
+            for char in stop_chars:
+                value = value.split(char, 1)[0]
+            if value:
+                data[key] = value
 
     return data
 
 def handle_cisco_ise_failed_attempts(ip, message):
     log_data = parse_syslog_message(message)
 
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    # The event time ISE logged, as for passed attempts, so reprocessed messages get the same rows
+    log_data['timestamp'] = ise_timestamp(message) or now_tick()
+    log_data['source_ip'] = ip
 
     if 'Failed-Attempt: Authentication failed' in message and 'Protocol=Tacacs' in message:
-        fta_inserter.add_to_batch([
-            timestamp, ip, log_data.get('UserName'), log_data.get('Device IP Address'),
-            log_data.get('RemoteAddress'), log_data.get('FailureReason'),
-            log_data.get('NetworkDeviceName'), log_data.get('RequestLatency')
-        ])
-        logging.info(f"Added FTA record for {ip}")
+        fta_inserter.add_record(log_data)
+        logging.debug("Added FTA record for %s", ip)
     elif 'WLC' in log_data.get('NetworkDeviceName', '') and 'HO' in log_data.get('CalledStationID', ''):
-        fwa_inserter.add_to_batch([
-            timestamp, ip, log_data.get('UserName'), log_data.get('NASIPAddress'),
-            log_data.get('CalledStationID'), log_data.get('FailureReason'),
-            log_data.get('NetworkDeviceName')
-        ])
-        logging.info(f"Added FWA record for {ip}")
+        fwa_inserter.add_record(log_data)
+        logging.debug("Added FWA record for %s", ip)
     elif '-' in log_data.get('NetworkDeviceName', ''):
-        fla_inserter.add_to_batch([
-            timestamp, ip, log_data.get('UserName'), log_data.get('NASIPAddress'),
-            log_data.get('NasPortID'), log_data.get('FailureReason'),
-            log_data.get('NetworkDeviceName')
-        ])
-        logging.info(f"Added FLA record for {ip}")
+        fla_inserter.add_record(log_data)
+        logging.debug("Added FLA record for %s", ip)
     else:
-        logging.warning(f"Unhandled failed attempt message from {ip}")
+        logging.warning("Unhandled failed attempt message from %s", ip)
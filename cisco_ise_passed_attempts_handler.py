@@ -1,155 +1,162 @@
-import os
-import re
 import logging
-from datetime import datetime
 from database_utils import pwa_inserter, pla_inserter
+from ise_attributes import parse_ise_attributes, first_value, prefixed_values
+from table_schemas import TABLES
+from timestamps import ise_timestamp, now_tick
 
-# Setup logging
-log_directory = r'C:\Syslog'
-os.makedirs(log_directory, exist_ok=True)
-logging.basicConfig(filename=os.path.join(log_directory, 'cisco_ise_passed_attempts_handler.log'), level=logging.DEBUG,
-                    format='%(asctime)s - %(processName)s - %(threadName)s - %(levelname)s - %(message)s', filemode='a')
+# Extracted field -> (ISE attribute, value prefix). Qualified attributes such as
+# NetworkDeviceGroups carry their qualifier as a prefix of the value.
+COMMON_FIELDS = {
+    'NAS-IP-Address': ('NAS-IP-Address', ''),
+    'NAS-Port-Id': ('NAS-Port-Id', ''),
+    'NetworkDeviceName': ('NetworkDeviceName', ''),
+    'DeviceIP': ('Device IP Address', ''),
+    'RequestLatency': ('RequestLatency', ''),
+    'cisco-av-pair=method': ('cisco-av-pair', 'method='),
+    'AuthenticationMethod': ('AuthenticationMethod', ''),
+    'AuthenticationIdentityStore': ('AuthenticationIdentityStore', ''),
+    'SelectedAccessService': ('SelectedAccessService', ''),
+    'SelectedAuthorizationProfiles': ('SelectedAuthorizationProfiles', ''),
+    'IdentityGroup': ('IdentityGroup', 'Endpoint Identity Groups:'),
+    'SelectedAuthenticationIdentityStores': ('SelectedAuthenticationIdentityStores', ''),
+    'AuthenticationStatus': ('AuthenticationStatus', ''),
+    'NetworkDeviceGroups=Location#': ('NetworkDeviceGroups', 'Location#'),
+    'NetworkDeviceGroups=Device=': ('NetworkDeviceGroups', 'Device Type#'),
+    'NetworkDeviceGroups=Rollout=': ('NetworkDeviceGroups', 'Rollout Stage#'),
+    'NetworkDeviceGroups=Reauth=': ('NetworkDeviceGroups', 'Reauth Controller#'),
+    'NetworkDeviceGroups=Closed=': ('NetworkDeviceGroups', 'Closed Mode#'),
+    'IdentityPolicyMatchedRule': ('IdentityPolicyMatchedRule', ''),
+    'AuthorizationPolicyMatchedRule': ('AuthorizationPolicyMatchedRule', ''),
+    'Subject - Common Name': ('Subject - Common Name', ''),
+    'EndPointMACAddress': ('EndPointMACAddress', ''),
+    'ISEPolicySetName': ('ISEPolicySetName', ''),
+    'AD-Host-Resolved-DNs': ('AD-Host-Resolved-DNs', ''),
+    'Days to Expiry': ('Days to Expiry', ''),
+    'Session-Timeout': ('Session-Timeout', ''),
+    'cisco-av-pair=ACS': ('cisco-av-pair', 'ACS:')
+}
 
-def parse_syslog_message(message):
-    common_field_patterns = {
-        'NAS-IP-Address': r'NAS-IP-Address=(.*?),[\s<]',
-        'NAS-Port-Id': r'NAS-Port-Id=(.*?),[\s<]',
-        'NetworkDeviceName': r'NetworkDeviceName=(.*?),[\s<]',
-        'DeviceIP': r'Device IP Address=(.*?),[\s<]',
-        'RequestLatency': r'RequestLatency=(.*?),[\s<]',
-        'cisco-av-pair=method': r'cisco-av-pair=method=(.*?),[\s<]',
-        'UserName': r'UserName=(.*?),[\s<]',
-        'AuthenticationMethod': r'AuthenticationMethod=(.*?),[\s<]',
-        'AuthenticationIdentityStore': r'[^=]AuthenticationIdentityStore=(.*?),[\s<]',
-        'SelectedAccessService': r'SelectedAccessService=(.*?),[\s<]',
-        'SelectedAuthorizationProfiles': r'SelectedAuthorizationProfiles=(.*?),[\s<]',
-        'IdentityGroup': r'[^(Host)]IdentityGroup=Endpoint Identity Groups:(.*?),[\s<]',
-        'SelectedAuthenticationIdentityStores': r'SelectedAuthenticationIdentityStores=(.*?),[\s<]',
-        'AuthenticationStatus': r'AuthenticationStatus=(.*?),[\s<]',
-        'NetworkDeviceGroups=Location#': r'NetworkDeviceGroups=Location#(.*?),[\s<]',
-        'NetworkDeviceGroups=Device=': r'NetworkDeviceGroups=Device Type#(.*?),[\s<]',
-        'NetworkDeviceGroups=Rollout=': r'NetworkDeviceGroups=Rollout Stage#(.*?),[\s<]',
-        'NetworkDeviceGroups=Reauth=': r'NetworkDeviceGroups=Reauth Controller#(.*?),[\s<]',
-        'NetworkDeviceGroups=Closed=': r'NetworkDeviceGroups=Closed Mode#(.*?),[\s<]',
-        'IdentityPolicyMatchedRule': r'IdentityPolicyMatchedRule=(.*?),[\s<]',
-        'AuthorizationPolicyMatchedRule': r'AuthorizationPolicyMatchedRule=(.*?),[\s<]',
-        'Subject - Common Name': r'Subject - Common Name=(.*?),[\s<]',
-        'EndPointMACAddress': r'EndPointMACAddress=(.*?),[\s<]',
-        'ISEPolicySetName': r'ISEPolicySetName=(.*?),[\s<]',
-        'AD-Host-Resolved-DNs': r'AD-Host-Resolved-DNs=(.*?),[\s<]',
-        'Days to Expiry': r'Days to Expiry=(.*?),[\s<]',
-        'Session-Timeout': r'Session-Timeout=(.*?);[\s<]',
-        'cisco-av-pair=ACS': r'cisco-av-pair=ACS:(.*?);[\s<]'
-    }
-
-    wlc_field_patterns = {
-        'Called-Station-ID': r'Called-Station-ID=([^,:]+)',
-        'RadiusFlowType': r'RadiusFlowType=(.*?),[\s<]'
-    }
+# The user name is reported under both attributes, in different case and hyphenation
+USERNAME_ATTRIBUTES = ('UserName', 'OriginalUserName')
+
+def collapse_values(values):
+    # Repeated attributes are stored once when identical, otherwise comma-joined
+    if len(values) == 1:
+        return values[0]
+    unique_values = list(dict.fromkeys(values))
+    if len(unique_values) > 1:
+        return ", ".join(unique_values)
+    return unique_values[0]
+
+# COMMON_FIELDS items to build, per field_names set passed to extract_fields
+_field_items = {None: list(COMMON_FIELDS.items())}
 
+def extract_fields(attributes, message, field_names=None):
+    """
+    The extracted fields of a passed authentication, from its tokenized attributes.
+    With field_names, only those fields are built.
+    """
+    items = _field_items.get(field_names)
+    if items is None:
+        items = _field_items[field_names] = [(key, spec) for key, spec in COMMON_FIELDS.items() if key in field_names]
     extracted_fields = {}
-    for key, pattern in common_field_patterns.items():
-        matches = re.findall(pattern, message)
-        if matches:
-            if len(matches) > 1:
-                try:
-                    if key == 'UserName':
-                        matches = list(map(lambda x: x.replace("-", "").lower(), matches))
-                    uniqueMatches = list(set(matches))
-                    if len(uniqueMatches) > 1:
-                        extracted_fields[key] = ", ".join(uniqueMatches)
-                    else:
-                        extracted_fields[key] = uniqueMatches[0]
-                except Exception as error:
-                    logging.error(f"Error processing matches for {key}: {error}")
-            else:
-                extracted_fields[key] = matches[0]
-
-    if 'NetworkDeviceName' in extracted_fields and 'WLC' in extracted_fields['NetworkDeviceName']:
-        for key, pattern in wlc_field_patterns.items():
-            matches = re.findall(pattern, message)
-            if matches:
-                extracted_fields[key] = matches[0]
-
-    timestamp = re.search(r'\d* \d* (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}.\d* \+\d{2}:\d{2})', message)
-    extracted_fields['timestamp'] = timestamp.group(1) if timestamp else datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for key, (attribute, prefix) in items:
+        values = prefixed_values(attributes, attribute, prefix) if prefix else attributes.get(attribute)
+        if values:
+            extracted_fields[key] = collapse_values(values)
+
+    if field_names is None or 'UserName' in field_names:
+        usernames = [value for attribute in USERNAME_ATTRIBUTES for value in attributes.get(attribute, ())]
+        if len(usernames) > 1:
+            usernames = [value.replace("-", "").lower() for value in usernames]
+        if usernames:
+            extracted_fields['UserName'] = collapse_values(usernames)
+
+    if field_names is None:
+        wlc = 'NetworkDeviceName' in extracted_fields and 'WLC' in extracted_fields['NetworkDeviceName']
+    else:
+        wlc = 'Called-Station-ID' in field_names
+    if wlc:
+        called_station_id = first_value(attributes, 'Called-Station-ID')
+        if called_station_id:
+            extracted_fields['Called-Station-ID'] = called_station_id.split(':', 1)[0].split(',', 1)[0]
+        radius_flow_type = first_value(attributes, 'RadiusFlowType')
+        if radius_flow_type is not None:
+            extracted_fields['RadiusFlowType'] = radius_flow_type
+
+    extracted_fields['timestamp'] = ise_timestamp(message) or now_tick()
 
     return extracted_fields
 
+def parse_syslog_message(message):
+    return extract_fields(parse_ise_attributes(message), message)
+
+# Per destination table, the extracted fields its columns read
+TABLE_FIELDS = {name: frozenset(column.source for column in TABLES[name].columns) for name in ('pwa', 'pla')}
+
+class PassedAttemptView:
+    """
+    Lazy view of a passed authentication. Routing reads the device name and type off the
+    raw message, so only authentications that get a table are tokenized, and only that
+    table's fields are built.
+    """
+    __slots__ = ('message', '_attributes')
+
+    def __init__(self, message):
+        self.message = message
+        self._attributes = None
+
+    @property
+    def attributes(self):
+        if self._attributes is None:
+            self._attributes = parse_ise_attributes(self.message)
+        return self._attributes
+
+    def table(self):
+        # Same predicates as on the extracted fields: a WLC device name, else a switch device type
+        message = self.message
+        if 'WLC' in message and any('WLC' in value for value in self.routing_values('NetworkDeviceName')):
+            return 'pwa'
+        if 'switch' in message and any('switch' in value for value in
+                                       self.routing_values('NetworkDeviceGroups', 'Device Type#')):
+            return 'pla'
+        return None
+
+    def routing_values(self, attribute, prefix=''):
+        # Values of `attribute` starting with `prefix`, found on the raw message. The message is
+        # tokenized only when none is found or one may be cut by a chunk header.
+        message = self.message
+        needle = '%s=%s' % (attribute, prefix)
+        values = []
+        start = message.find(needle)
+        while start >= 0:
+            end = message.find(', ', start)
+            if message[start - 2:start] == ', ' and message[start - 3] != '\\':
+                value = message[start + len(needle):end] if end >= 0 else message[start + len(needle):].rstrip()
+                if 'CISE_' in value or '{' in value:
+                    values = None
+                    break
+                values.append(value)
+            start = message.find(needle, end) if end >= 0 else -1
+        if values:
+            return values
+        return prefixed_values(self.attributes, attribute, prefix) if prefix else self.attributes.get(attribute, ())
+
+    def fields(self, table):
+        return extract_fields(self.attributes, self.message, TABLE_FIELDS[table])
+
 def handle_cisco_ise_passed_attempts(ip, message):
-    extracted_fields = parse_syslog_message(message)
-    extracted_fields['source_ip'] = ip
+    view = PassedAttemptView(message)
+    table = view.table()
+    if table is None:
+        logging.warning("Unhandled passed attempt message from %s", ip)
+        return
 
-    if 'NetworkDeviceName' in extracted_fields and 'WLC' in extracted_fields['NetworkDeviceName']:
-        pwa_inserter.add_to_batch([
-            extracted_fields.get('timestamp'),
-            extracted_fields.get('source_ip'),
-            extracted_fields.get('NAS-IP-Address'),
-            extracted_fields.get('NetworkDeviceName'),
-            extracted_fields.get('RequestLatency'),
-            extracted_fields.get('cisco-av-pair=method'),
-            extracted_fields.get('UserName'),
-            extracted_fields.get('AuthenticationMethod'),
-            extracted_fields.get('AuthenticationIdentityStore'),
-            extracted_fields.get('SelectedAccessService'),
-            extracted_fields.get('SelectedAuthorizationProfiles'),
-            extracted_fields.get('IdentityGroup'),
-            extracted_fields.get('SelectedAuthenticationIdentityStores'),
-            extracted_fields.get('AuthenticationStatus'),
-            extracted_fields.get('NetworkDeviceGroups=Location#'),
-            extracted_fields.get('NetworkDeviceGroups=Device='),
-            extracted_fields.get('NetworkDeviceGroups=Rollout='),
-            extracted_fields.get('NetworkDeviceGroups=Reauth='),
-            extracted_fields.get('NetworkDeviceGroups=Closed='),
-            extracted_fields.get('IdentityPolicyMatchedRule'),
-            extracted_fields.get('AuthorizationPolicyMatchedRule'),
-            extracted_fields.get('Subject - Common Name'),
-            extracted_fields.get('EndPointMACAddress'),
-            extracted_fields.get('ISEPolicySetName'),
-            extracted_fields.get('AD-Host-Resolved-DNs'),
-            extracted_fields.get('Days to Expiry'),
-            extracted_fields.get('Session-Timeout'),
-            extracted_fields.get('cisco-av-pair=ACS'),
-            extracted_fields.get('DeviceIP'),
-            extracted_fields.get('Called-Station-ID'),
-            extracted_fields.get('RadiusFlowType')
-        ])
-        logging.info(f"Added PWA record for {ip}")
-    elif 'NetworkDeviceGroups=Device=' in extracted_fields and 'switch' in extracted_fields['NetworkDeviceGroups=Device=']:
-        pla_inserter.add_to_batch([
-            extracted_fields.get('timestamp'),
-            extracted_fields.get('source_ip'),
-            extracted_fields.get('NAS-IP-Address'),
-            extracted_fields.get('NAS-Port-Id'),
-            extracted_fields.get('NetworkDeviceName'),
-            extracted_fields.get('RequestLatency'),
-            extracted_fields.get('cisco-av-pair=method'),
-            extracted_fields.get('UserName'),
-            extracted_fields.get('AuthenticationMethod'),
-            extracted_fields.get('AuthenticationIdentityStore'),
-            extracted_fields.get('SelectedAccessService'),
-            extracted_fields.get('SelectedAuthorizationProfiles'),
-            extracted_fields.get('IdentityGroup'),
-            extracted_fields.get('SelectedAuthenticationIdentityStores'),
-            extracted_fields.get('AuthenticationStatus'),
-            extracted_fields.get('NetworkDeviceGroups=Location#'),
-            extracted_fields.get('NetworkDeviceGroups=Device='),
-            extracted_fields.get('NetworkDeviceGroups=Rollout='),
-            extracted_fields.get('NetworkDeviceGroups=Reauth='),
-            extracted_fields.get('NetworkDeviceGroups=Closed='),
-            extracted_fields.get('IdentityPolicyMatchedRule'),
-            extracted_fields.get('AuthorizationPolicyMatchedRule'),
-            extracted_fields.get('Subject - Common Name'),
-            extracted_fields.get('EndPointMACAddress'),
-            extracted_fields.get('ISEPolicySetName'),
-            extracted_fields.get('AD-Host-Resolved-DNs'),
-            extracted_fields.get('Days to Expiry'),
-            extracted_fields.get('Session-Timeout'),
-            extracted_fields.get('cisco-av-pair=ACS'),
-            extracted_fields.get('DeviceIP')
-        ])
-        logging.info(f"Added PLA record for {ip}")
+    extracted_fields = view.fields(table)
+    extracted_fields['source_ip'] = ip
+    if table == 'pwa':
+        pwa_inserter.add_record(extracted_fields)
+        logging.debug("Added PWA record for %s", ip)
     else:
-        logging.warning(f"Unhandled passed attempt message from {ip}")
-
-    logging.debug(f"Processed passed attempt message from {ip}")
+        pla_inserter.add_record(extracted_fields)
+        logging.debug("Added PLA record for %s", ip)
@@ -1,57 +1,43 @@
 import logging
-from datetime import datetime
-import re
-import os
 from database_utils import tca_inserter
+from ise_attributes import parse_ise_attributes, first_value
+from timestamps import ise_timestamp, now_tick
 
-# Setup logging
-log_directory = r'C:\Syslog'
-os.makedirs(log_directory, exist_ok=True)
-logging.basicConfig(filename=os.path.join(log_directory, 'cisco_ise_tacacs_accounting_handler.log'), level=logging.DEBUG,
-                    format='%(asctime)s - %(processName)s - %(threadName)s - %(levelname)s - %(message)s', filemode='a')
+# Extracted field -> ISE attribute
+FIELD_ATTRIBUTES = {
+    'Username': 'User',
+    'NetworkDeviceName': 'NetworkDeviceName',
+    'NetworkDeviceIP': 'Device IP Address',
+    'RemoteDevice': 'Remote-Address',
+}
+WANTED_ATTRIBUTES = frozenset(FIELD_ATTRIBUTES.values()) | {'CmdSet'}
 
 def parse_syslog_message(message):
+    attributes = parse_ise_attributes(message, WANTED_ATTRIBUTES)
+
     data = {}
-    patterns = {
-        'Username': r'User=([^,]+)',
-        'NetworkDeviceName': r'NetworkDeviceName=([^,]+)',
-        'NetworkDeviceIP': r'Device IP Address=([^,]+)',
-        'RemoteDevice': r'Remote-Address=([^,]+)',
-        'CmdSet': r'CmdSet=\[ CmdAV=([^,]+) ]',
-        'timestamp': r'\d* \d* (\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}.\d* \+\d{2}:\d{2})'
-    }
-
-    for key, pattern in patterns.items():
-        match = re.search(pattern, message)
-        if match:
-            data[key] = match.group(1)
-    
-    if 'CmdSet' in data:
-        data['CmdSet'] = data['CmdSet'].replace("CmdArgAV=", "")
-    
-    if 'timestamp' not in data:
-        data['timestamp'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    for key, attribute in FIELD_ATTRIBUTES.items():
+        value = first_value(attributes, attribute)
+        if value:
+            data[key] = value.split(',', 1)[0]
+
+    # CmdSet=[ CmdAV=show CmdArgAV=interface CmdArgAV=<cr> ]
+    cmd_set = first_value(attributes, 'CmdSet', '')
+    if cmd_set.startswith('[ CmdAV=') and cmd_set.endswith(' ]'):
+        data['CmdSet'] = cmd_set[len('[ CmdAV='):-len(' ]')].replace("CmdArgAV=", "")
+
+    data['timestamp'] = ise_timestamp(message) or now_tick()
 
     return data
 
 def handle_cisco_ise_tacacs_accounting(ip, message):
     log_data = parse_syslog_message(message)
-    
-    # Log the parsed data for debugging
-    logging.debug(f"Parsed TACACS accounting message: {log_data}")
+    log_data['source_ip'] = ip
+
+    logging.debug("Parsed TACACS accounting message: %s", log_data)
 
     if 'terminal pager 0' not in log_data.get('CmdSet', ''):
-        tca_inserter.add_to_batch([
-            log_data.get('timestamp'),
-            log_data.get('Username'),
-            log_data.get('NetworkDeviceName'),
-            log_data.get('NetworkDeviceIP'),
-            log_data.get('RemoteDevice'),
-            log_data.get('CmdSet'),
-            ip
-        ])
-        logging.info(f"Added TACACS accounting record for {ip}")
+        tca_inserter.add_record(log_data)
+        logging.debug("Added TACACS accounting record for %s", ip)
     else:
-        logging.debug(f"Ignored 'terminal pager 0' command from {ip}")
-
-    logging.info("Processed TACACS accounting message")
+        logging.debug("Ignored 'terminal pager 0' command from %s", ip)
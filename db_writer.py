@@ -0,0 +1,292 @@
+import logging
+import os
+import queue
+import threading
+import time
+import psycopg2
+from metrics import metrics
+
+WRITER_THREADS = 2  # Per process; each holds one connection
+MAX_QUEUED_BATCHES = 64  # Ready batches waiting for a writer
+SUBMIT_TIMEOUT = 5  # Seconds a full queue may block the submitting worker before the batch is dropped
+HEALTH_CHECK_INTERVAL = 30  # Idle seconds after which a connection is checked before use
+MAX_WRITE_ATTEMPTS = 5  # Per batch, for connection failures
+RECONNECT_BACKOFF_MAX = 30
+CONNECT_TIMEOUT = 10
+REPLAY_ROWS_PER_SECOND = 5000  # Spill replay budget, so catch-up leaves the database to live batches
+REPLAY_RATE_WINDOW = 5  # Seconds over which the replay rate is measured
+
+
+class DatabaseWriter:
+    """
+    Writes ready batches to PostgreSQL from a fixed set of threads, each keeping one
+    persistent connection. Batches arrive as (inserter, rows) on a bounded queue; the
+    inserter supplies write_rows() and record_write() for the time each write took.
+
+    Connection failures close the connection and retry the batch with exponential
+    backoff; a batch the database rejects is rolled back and dropped, as before. Threads
+    start on first use in each process, so a writer created at import time works in
+    spawned worker processes.
+
+    With a spill queue enabled, batches that run out of attempts, find the queue full or
+    are still queued at close() are appended to it instead of dropped. While the database
+    is unreachable each batch gets a single attempt before it is spilled, and a replay
+    thread writes spilled batches back in order, limited to replay_rows_per_second.
+    """
+
+    def __init__(self, dsn, num_threads=WRITER_THREADS, max_queued_batches=MAX_QUEUED_BATCHES):
+        self.dsn = dsn
+        self.num_threads = num_threads
+        self.batches = queue.Queue(max_queued_batches)
+        self.threads = []
+        self.pid = None
+        self.start_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.stats_lock = threading.Lock()
+        self.stats = {'batches': 0, 'rows': 0, 'dropped_batches': 0, 'dropped_rows': 0,
+                      'connects': 0, 'connect_failures': 0, 'health_check_failures': 0}
+        self.spill = None
+        self.inserters = {}
+        self.replay_rows_per_second = REPLAY_ROWS_PER_SECOND
+        self.replay_rate = 0.0
+        # Set while the database is unreachable; cleared by the next successful write
+        self.outage = threading.Event()
+
+    def enable_spill(self, spill, inserters, replay_rows_per_second=REPLAY_ROWS_PER_SECOND):
+        # inserters: table name -> inserter, to replay spilled batches through
+        self.spill = spill
+        self.inserters = inserters
+        self.replay_rows_per_second = replay_rows_per_second
+
+    def _ensure_started(self):
+        if self.pid == os.getpid():
+            return
+        with self.start_lock:
+            if self.pid == os.getpid():
+                return
+            self.stopping.clear()
+            self.threads = [threading.Thread(target=self._run, name=f"DatabaseWriter{i}", daemon=True)
+                            for i in range(self.num_threads)]
+            if self.spill is not None:
+                self.threads.append(threading.Thread(target=self._replay, name="SpillReplay", daemon=True))
+            for thread in self.threads:
+                thread.start()
+            self.pid = os.getpid()
+
+    def submit(self, inserter, rows):
+        self._ensure_started()
+        try:
+            self.batches.put((inserter, rows), timeout=SUBMIT_TIMEOUT)
+        except queue.Full:
+            logging.error("Writer queue full with a batch of %d rows for %s", len(rows), inserter.table_name)
+            self._spill_or_drop(inserter, rows)
+
+    def queued_batches(self):
+        return self.batches.qsize()
+
+    def close(self, timeout=30):
+        """
+        Write what is queued, then stop the threads and close their connections. Batches
+        still queued when the timeout runs out are spilled.
+        """
+        if self.pid != os.getpid():
+            return
+        deadline = time.time() + timeout
+        writers = [thread for thread in self.threads if thread.name != "SpillReplay"]
+        for _ in writers:
+            try:
+                self.batches.put(None, timeout=max(deadline - time.time(), 0.1))
+            except queue.Full:
+                break
+        for thread in writers:
+            thread.join(timeout=max(deadline - time.time(), 0.1))
+        self.stopping.set()
+        for thread in self.threads:
+            thread.join(timeout=5)
+        while True:
+            try:
+                item = self.batches.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                self._spill_or_drop(*item)
+        if self.spill is not None:
+            self.spill.close()
+        self.pid = None
+
+    def _count(self, **increments):
+        with self.stats_lock:
+            for key, value in increments.items():
+                self.stats[key] += value
+
+    def _count_dropped(self, table_name, row_count):
+        self._count(dropped_batches=1, dropped_rows=row_count)
+        metrics.count('syslog_rows_lost_total', (('table', table_name),), row_count)
+
+    def _spill_or_drop(self, inserter, rows):
+        if self.spill is None:
+            self._count_dropped(inserter.table_name, len(rows))
+            logging.error("Dropped batch of %d rows for %s", len(rows), inserter.table_name)
+            return
+        try:
+            self.spill.append(inserter.table_name, inserter.copy_text(rows), len(rows))
+            metrics.count('syslog_rows_spilled_total', (('table', inserter.table_name),), len(rows))
+            logging.warning("Spilled batch of %d rows for %s", len(rows), inserter.table_name)
+        except Exception as error:
+            self._count_dropped(inserter.table_name, len(rows))
+            logging.error("Could not spill batch of %d rows for %s: %s", len(rows), inserter.table_name, error)
+
+    def _run(self):
+        conn = None
+        last_used = 0
+        while True:
+            try:
+                item = self.batches.get(timeout=HEALTH_CHECK_INTERVAL)
+            except queue.Empty:
+                conn = self._check(conn)
+                last_used = time.time()
+                continue
+            if item is None:
+                break
+            if conn is not None and time.time() - last_used > HEALTH_CHECK_INTERVAL:
+                conn = self._check(conn)
+            conn = self._write(conn, *item)
+            last_used = time.time()
+        if conn is not None:
+            conn.close()
+
+    def _connect(self):
+        try:
+            conn = psycopg2.connect(self.dsn, connect_timeout=CONNECT_TIMEOUT)
+        except psycopg2.Error as error:
+            self._count(connect_failures=1)
+            logging.error("%s could not connect to the database: %s", threading.current_thread().name, error)
+            return None
+        self._count(connects=1)
+        return conn
+
+    def _check(self, conn):
+        # Returns the connection when it still answers, else None so the next write reconnects
+        if conn is None:
+            return None
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return conn
+        except psycopg2.Error as error:
+            self._count(health_check_failures=1)
+            logging.warning("%s dropping unhealthy connection: %s", threading.current_thread().name, error)
+            self._close(conn)
+            return None
+
+    def _close(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _write(self, conn, inserter, rows):
+        delay = 1
+        # During an outage a batch gets one attempt, so the writers keep up by spilling
+        attempts = 1 if self.outage.is_set() else MAX_WRITE_ATTEMPTS
+        for attempt in range(1, attempts + 1):
+            if conn is None or conn.closed:
+                conn = self._connect()
+            if conn is not None:
+                try:
+                    started = time.perf_counter()
+                    with conn.cursor() as cursor:
+                        inserter.write_rows(cursor, rows)
+                    conn.commit()
+                    seconds = time.perf_counter() - started
+                    inserter.record_write(seconds)
+                    metrics.observe('syslog_stage_seconds', (('stage', 'insert'), ('table', inserter.table_name)), seconds)
+                    metrics.count('syslog_rows_inserted_total', (('table', inserter.table_name),), len(rows))
+                    self.outage.clear()
+                    self._count(batches=1, rows=len(rows))
+                    logging.info("Inserted %d rows into %s", len(rows), inserter.table_name)
+                    return conn
+                except (psycopg2.OperationalError, psycopg2.InterfaceError) as error:
+                    logging.error("Connection failed inserting into %s (attempt %d/%d): %s",
+                                  inserter.table_name, attempt, attempts, error)
+                    self._close(conn)
+                    conn = None
+                except Exception as error:
+                    logging.error("Error inserting batch data into %s: %s", inserter.table_name, error)
+                    try:
+                        conn.rollback()
+                    except psycopg2.Error:
+                        self._close(conn)
+                        conn = None
+                    self._count_dropped(inserter.table_name, len(rows))
+                    return conn
+            if attempt < attempts and not self.stopping.wait(delay):
+                delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+        self.outage.set()
+        logging.error("Could not insert batch of %d rows for %s after %d attempts", len(rows), inserter.table_name, attempts)
+        self._spill_or_drop(inserter, rows)
+        return conn
+
+    def _replay(self):
+        conn = None
+        delay = 1
+        window_start, window_rows = time.time(), 0
+        while not self.stopping.is_set():
+            now = time.time()
+            if now - window_start >= REPLAY_RATE_WINDOW:
+                self.replay_rate = window_rows / (now - window_start)
+                window_start, window_rows = now, 0
+            frame = self.spill.peek()
+            if frame is None:
+                self.stopping.wait(1)
+                continue
+            table_name, payload, row_count = frame
+            inserter = self.inserters.get(table_name)
+            if inserter is None:
+                logging.error("Skipping spilled batch of %d rows for unknown table %s", row_count, table_name)
+                self.spill.ack()
+                continue
+            if conn is None or conn.closed:
+                conn = self._connect()
+            if conn is None:
+                self.outage.set()
+                self.stopping.wait(delay)
+                delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+                continue
+            started = time.time()
+            try:
+                with conn.cursor() as cursor:
+                    inserter.write_copy_text(cursor, payload)
+                conn.commit()
+            except (psycopg2.OperationalError, psycopg2.InterfaceError) as error:
+                logging.error("Connection failed replaying spilled batch for %s: %s", table_name, error)
+                self._close(conn)
+                conn = None
+                self.outage.set()
+                self.stopping.wait(delay)
+                delay = min(delay * 2, RECONNECT_BACKOFF_MAX)
+                continue
+            except Exception as error:
+                # The database rejects this batch; replaying it again would block the queue
+                logging.error("Dropping spilled batch of %d rows for %s: %s", row_count, table_name, error)
+                try:
+                    conn.rollback()
+                except psycopg2.Error:
+                    self._close(conn)
+                    conn = None
+                self._count_dropped(table_name, row_count)
+                self.spill.ack()
+                continue
+            self.spill.ack()
+            metrics.count('syslog_rows_inserted_total', (('table', table_name),), row_count)
+            self.outage.clear()
+            delay = 1
+            window_rows += row_count
+            logging.info("Replayed %d spilled rows into %s", row_count, table_name)
+            # Rate limit: spend at least row_count / replay_rows_per_second on this batch
+            remaining = row_count / self.replay_rows_per_second - (time.time() - started)
+            if remaining > 0:
+                self.stopping.wait(remaining)
+        if conn is not None:
+            conn.close()
@@ -0,0 +1,268 @@
+import argparse
+import io
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import psycopg2
+from psycopg2 import sql
+from metrics import metrics
+from partition_manager import (PARTITION_TIMEZONE, PRECREATE_DAYS, ensure_partitions, ensure_partitions_for,
+                               partition_timezone)
+from table_schemas import TABLES, TableSchema, Column
+
+# Optional dictionary encoding of the tables that declare dimension columns
+# (TableSchema.dimensions). An encoded table keeps its rows in <table>_facts, with an
+# integer <column>_id in place of each dimension column, the dimension's values in
+# dim_<column> (shared by the tables that have the column), and a view with the table's
+# name and column layout for the queries and reports that read it. A table is encoded
+# once, with the service stopped:
+#   python dimensions.py migrate [table ...]
+# The writers see the encoded layout at their first write and look IDs up through a
+# per-process LRU cache; tables that are not encoded are written as before.
+
+DIMENSION_CACHE_SIZE = 100000  # Values per dimension cached in each process
+
+
+def dimension_table(column):
+    return f"dim_{column}"
+
+
+def id_column(column):
+    return f"{column}_id"
+
+
+def facts_schema(schema):
+    columns = [Column(id_column(column.name), 'integer', column.source) if column.name in schema.dimensions else column
+               for column in schema.columns]
+    return TableSchema(schema.facts_table, columns, loader=schema.loader, partitioned=schema.partitioned)
+
+
+def is_encoded(cursor, schema):
+    if not schema.dimensions:
+        return False
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'public.{schema.facts_table}',))
+    return cursor.fetchone()[0]
+
+
+def render_dimension_ddl(column):
+    return (f"CREATE TABLE IF NOT EXISTS public.{dimension_table(column)}\n(\n"
+            f"    id integer GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,\n"
+            f"    value text COLLATE pg_catalog.\"default\" NOT NULL UNIQUE\n);\n")
+
+
+def render_view(schema):
+    columns, joins = [], []
+    for column in schema.columns:
+        if column.name in schema.dimensions:
+            alias = f"d{len(joins)}"
+            columns.append(f'{alias}.value AS "{column.name}"')
+            joins.append(f'\n    LEFT JOIN public.{dimension_table(column.name)} {alias} '
+                         f'ON {alias}.id = f."{id_column(column.name)}"')
+        else:
+            columns.append(f'f."{column.name}"')
+    select = ',\n           '.join(columns)
+    return (f"CREATE OR REPLACE VIEW public.{schema.name} AS\n    SELECT {select}\n"
+            f"    FROM public.{schema.facts_table} f{''.join(joins)};\n")
+
+
+def render_ddl(schema):
+    return '\n'.join([render_dimension_ddl(column) for column in schema.dimensions] +
+                     [facts_schema(schema).render_ddl(), render_view(schema)])
+
+
+def _identifier(name):
+    return sql.Identifier(*name.split('.'))
+
+
+def insert_encoded(cursor, schema, source, target=None):
+    """
+    Insert the rows of `source`, a table in the schema's own column layout, into `target`
+    (by default the facts table) with their dimension values replaced by IDs, adding the
+    values the dimension tables lack first. Returns the number of rows inserted.
+    """
+    source = _identifier(source)
+    values, joins = [], []
+    for column in schema.columns:
+        name = sql.Identifier(column.name)
+        if column.name in schema.dimensions:
+            dimension = sql.Identifier('public', dimension_table(column.name))
+            # Sorted, so writers adding the same new values take their locks in the same order
+            cursor.execute(sql.SQL('INSERT INTO {} (value) SELECT DISTINCT {} FROM {} WHERE {} IS NOT NULL ORDER BY 1 '
+                                   'ON CONFLICT (value) DO NOTHING').format(dimension, name, source, name))
+            alias = sql.Identifier(f"d{len(joins)}")
+            values.append(sql.SQL('{}.id').format(alias))
+            joins.append(sql.SQL('LEFT JOIN {} {} ON {}.value = s.{}').format(dimension, alias, alias, name))
+        else:
+            values.append(sql.SQL('s.{}').format(name))
+    facts = facts_schema(schema)
+    cursor.execute(sql.SQL('INSERT INTO {} ({}) SELECT {} FROM {} s {}').format(
+        _identifier(target or f'public.{facts.name}'), sql.SQL(', ').join(map(sql.Identifier, facts.fields)),
+        sql.SQL(', ').join(values), source, sql.SQL(' ').join(joins)))
+    return cursor.rowcount
+
+
+class DimensionCache:
+    """
+    LRU map of one dimension's values to their IDs, shared by the process's writer threads.
+    The values of a batch that are not cached are looked up, and the new ones added, in
+    bulk. IDs added by the batch's own transaction are cached only once a later batch
+    finds them committed, so a rolled back batch cannot leave unknown IDs in the cache.
+    """
+
+    def __init__(self, column, size=DIMENSION_CACHE_SIZE):
+        self.column = column
+        self.table = sql.Identifier('public', dimension_table(column))
+        self.size = size
+        self.ids = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, cursor, values):
+        # value -> ID for the distinct, non-NULL values of a batch
+        found, missing = {}, []
+        with self.lock:
+            ids = self.ids
+            for value in values:
+                value_id = ids.get(value)
+                if value_id is None:
+                    missing.append(value)
+                else:
+                    ids.move_to_end(value)
+                    found[value] = value_id
+        labels = (('dimension', self.column),)
+        metrics.count('syslog_dimension_lookups_total', labels + (('result', 'hit'),), len(found))
+        if missing:
+            metrics.count('syslog_dimension_lookups_total', labels + (('result', 'miss'),), len(missing))
+            found.update(self._fetch(cursor, sorted(missing)))
+        return found
+
+    def _select(self, cursor, values):
+        cursor.execute(sql.SQL('SELECT value, id FROM {} WHERE value = ANY(%s)').format(self.table), (values,))
+        return dict(cursor.fetchall())
+
+    def _fetch(self, cursor, values):
+        committed = self._select(cursor, values)
+        new = [value for value in values if value not in committed]
+        added = {}
+        if new:
+            cursor.execute(sql.SQL('INSERT INTO {} (value) SELECT unnest(%s::text[]) ON CONFLICT (value) DO NOTHING '
+                                   'RETURNING value, id').format(self.table), (new,))
+            added = dict(cursor.fetchall())
+            # Values another writer committed since the SELECT
+            raced = [value for value in new if value not in added]
+            if raced:
+                committed.update(self._select(cursor, raced))
+        with self.lock:
+            ids = self.ids
+            ids.update(committed)
+            while len(ids) > self.size:
+                ids.popitem(last=False)
+        committed.update(added)
+        return committed
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def dimension_cache(column):
+    with _caches_lock:
+        cache = _caches.get(column)
+        if cache is None:
+            cache = _caches[column] = DimensionCache(column)
+        return cache
+
+
+def _compile_encoder(width, positions):
+    # encode_rows(rows, ids0, ids1, ...) -> rows with the value at positions[n] replaced by ids<n>[value]
+    values = [f'ids{positions.index(i)}.get(row[{i}])' if i in positions else f'row[{i}]' for i in range(width)]
+    source = (f"def encode_rows(rows, {', '.join(f'ids{n}' for n in range(len(positions)))}):\n"
+              f"    return [({', '.join(values)},) for row in rows]\n")
+    namespace = {}
+    exec(source, namespace)
+    return namespace['encode_rows']
+
+
+class DimensionEncoder:
+    """
+    Turns an encoded table's batches into facts rows for BatchedDatabaseInserter, and
+    loads spilled COPY text, which is in the table's own layout, through a temporary
+    table and insert_encoded().
+    """
+
+    def __init__(self, schema):
+        self.schema = schema
+        self.facts = facts_schema(schema)
+        self.positions = [schema.fields.index(column) for column in schema.dimensions]
+        self.caches = [dimension_cache(column) for column in schema.dimensions]
+        self.encode_rows = _compile_encoder(len(schema.fields), self.positions)
+        self.replay_table = f"pg_temp.{schema.name}_replay"
+
+    def encode(self, cursor, rows):
+        ids = []
+        for position, cache in zip(self.positions, self.caches):
+            values = {row[position] for row in rows}
+            values.discard(None)
+            ids.append(cache.lookup(cursor, values))
+        return self.encode_rows(rows, *ids)
+
+    def write_copy_text(self, cursor, text):
+        replay = _identifier(self.replay_table)
+        cursor.execute(sql.SQL('CREATE TEMPORARY TABLE IF NOT EXISTS {} (LIKE {}) ON COMMIT DELETE ROWS').format(
+            replay, sql.Identifier('public', self.schema.name)))
+        cursor.copy_expert(sql.SQL('COPY {} ({}) FROM STDIN').format(
+            replay, sql.SQL(', ').join(map(sql.Identifier, self.schema.fields))), io.StringIO(text))
+        insert_encoded(cursor, self.schema, self.replay_table)
+
+
+def encoded_tables():
+    return [name for name, schema in TABLES.items() if schema.dimensions]
+
+
+def migrate(conn, schema, tz):
+    """
+    Encode the table: create its dimension and facts tables, encode its rows into the
+    facts table and put the view in its place. The old table is kept as
+    <table>_unencoded, to be dropped once the view has been checked.
+    """
+    unencoded = f"{schema.name}_unencoded"
+    with conn.cursor() as cursor:
+        if is_encoded(cursor, schema):
+            logging.info("%s is already encoded", schema.name)
+            return
+        for column in schema.dimensions:
+            cursor.execute(render_dimension_ddl(column))
+        cursor.execute(facts_schema(schema).render_ddl())
+        cursor.execute(sql.SQL('ALTER TABLE {} RENAME TO {}').format(
+            sql.Identifier('public', schema.name), sql.Identifier(unencoded)))
+        if schema.partitioned:
+            ensure_partitions_for(cursor, schema.facts_table, unencoded, tz)
+            today = datetime.now(tz).date()
+            ensure_partitions(cursor, schema.facts_table, today, today + timedelta(days=PRECREATE_DAYS), tz)
+        rows = insert_encoded(cursor, schema, f'public.{unencoded}')
+        cursor.execute(render_view(schema))
+    conn.commit()
+    logging.info("%s encoded: %d rows in %s; the old table is %s", schema.name, rows, schema.facts_table, unencoded)
+
+
+if __name__ == '__main__':
+    from database_utils import DATABASE_URL
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description="Dictionary encode the dimension columns of the ISE tables")
+    parser.add_argument('action', choices=['migrate', 'ddl'])
+    parser.add_argument('tables', nargs='*', help="Default: every table with dimension columns")
+    parser.add_argument('--dsn', default=DATABASE_URL)
+    parser.add_argument('--timezone', default=PARTITION_TIMEZONE, help="Time zone of the day partitions")
+    args = parser.parse_args()
+
+    tables = args.tables or encoded_tables()
+    if args.action == 'ddl':
+        print('\n'.join(render_ddl(TABLES[name]) for name in tables))
+    else:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            for name in tables:
+                migrate(conn, TABLES[name], partition_timezone(args.timezone))
+        finally:
+            conn.close()
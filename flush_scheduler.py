@@ -0,0 +1,87 @@
+import logging
+import time
+
+from db_writer import WRITER_THREADS
+from metrics import metrics
+
+TARGET_LATENCY = 5.0  # Seconds from a row reaching its batch to its commit
+MIN_BATCH_ROWS = 50
+MAX_BATCH_ROWS = 20000
+MIN_WAIT = 0.05  # Shortest batch deadline, however slow the inserts get
+RESIZE_INTERVAL = 0.25  # How often arrival rates are sampled and batches re-sized
+RATE_DECAY = 0.05  # EWMA weight of a lower rate sample; higher samples are taken at once
+
+
+class FlushScheduler:
+    """
+    Sends each inserter's batch when it reaches its size or its deadline, both set per table
+    from the observed arrival rate and insert time so rows are committed within
+    target_latency:
+
+        deadline = target_latency - insert time (EWMA of the table's recent writes)
+        size     = arrival rate * deadline, and at least what keeps the writer threads busy
+                   with the table (arrival rate * insert time / threads), within [min_rows, max_rows]
+
+    At night batches stay small and go out on their deadline; at peak and in bursts they grow,
+    so each write carries more rows. The worker calls tick() from its loop and waits for its
+    queue no longer than time_to_next_flush().
+    """
+
+    def __init__(self, inserters, target_latency=TARGET_LATENCY, min_rows=MIN_BATCH_ROWS, max_rows=MAX_BATCH_ROWS,
+                 min_wait=MIN_WAIT, writer_threads=WRITER_THREADS):
+        self.inserters = inserters
+        self.target_latency = target_latency
+        self.min_rows = min_rows
+        self.max_rows = max_rows
+        self.min_wait = min_wait
+        self.writer_threads = writer_threads
+        self.rates = dict.fromkeys(inserters, 0.0)
+        self.rows_seen = {name: inserter.rows_added for name, inserter in inserters.items()}
+        self.last_resize = time.time()
+        self._resize_all(self.last_resize)
+
+    def tick(self, now=None):
+        now = time.time() if now is None else now
+        if now - self.last_resize >= RESIZE_INTERVAL:
+            self._resize_all(now)
+        for inserter in self.inserters.values():
+            inserter.flush_if_stale(now)
+
+    def time_to_next_flush(self, now=None):
+        # Seconds until the earliest batch deadline, capped at RESIZE_INTERVAL
+        now = time.time() if now is None else now
+        wait = RESIZE_INTERVAL - (now - self.last_resize)
+        for inserter in self.inserters.values():
+            batch_started = inserter.batch_started
+            if batch_started is not None:
+                wait = min(wait, batch_started + inserter.max_wait_time - now)
+        return max(wait, 0.001)
+
+    def _resize_all(self, now):
+        elapsed = now - self.last_resize
+        self.last_resize = now
+        for name, inserter in self.inserters.items():
+            added = inserter.rows_added
+            if elapsed > 0:
+                sample = (added - self.rows_seen[name]) / elapsed
+                rate = self.rates[name]
+                # Follow a burst at once, decay slowly after it
+                self.rates[name] = sample if sample >= rate else rate + RATE_DECAY * (sample - rate)
+            self.rows_seen[name] = added
+            self._resize(name, inserter, self.rates[name])
+
+    def _resize(self, name, inserter, rate):
+        insert_seconds = inserter.insert_seconds
+        wait = max(self.min_wait, self.target_latency - insert_seconds)
+        rows = max(rate * wait, rate * insert_seconds / self.writer_threads)
+        inserter.max_batch_size = int(min(max(rows, self.min_rows), self.max_rows))
+        inserter.max_wait_time = wait
+        metrics.set_gauge('syslog_rows_arrival_rate', (('table', name),), rate)
+
+    def describe(self):
+        return ', '.join(f"{name} {self.rates[name]:.0f} rows/s -> {inserter.max_batch_size} rows "
+                         f"or {inserter.max_wait_time:.2f}s (insert {inserter.insert_seconds * 1000:.0f}ms)"
+                         for name, inserter in self.inserters.items())
+
+    def log_status(self):
+        logging.info("Batch sizing: %s", self.describe())
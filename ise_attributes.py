@@ -0,0 +1,246 @@
+import re
+
+# The syslog + CISE header of each chunk. ISE follows it with two spaces when the chunk
+# starts a new attribute and with one when it continues a value cut at the chunk boundary.
+_CHUNK_HEADER = re.compile(r'<\d+>\w{3} +\d+ [\d:]{8} \S+ CISE_\w+ \d+ \d+ \d+ ( ?)')
+# Response={RadiusPacketType=AccessAccept; Session-Timeout=28800; }
+_RESPONSE_BLOCK = re.compile(r'\{([^{}]*)\}')
+# frozenset of wanted names -> patterns finding them as top-level and as block attributes
+_WANTED_PATTERNS = {}
+
+
+def _strip_chunk_headers(message):
+    parts = _CHUNK_HEADER.split(message)
+    text = parts[0]
+    for i in range(1, len(parts), 2):
+        if parts[i] and text:
+            text = text.rstrip(',') + ', '
+        text += parts[i + 1]
+    return text.rstrip()
+
+
+def parse_ise_attributes(message, wanted=None):
+    """
+    Tokenize an ISE message into a multimap of attribute name -> list of values, in
+    message order. The name is everything before the first '=', so nested attributes
+    keep their qualifier in the value (NetworkDeviceGroups -> 'Location#All Locations#...',
+    cisco-av-pair -> 'method=dot1x'). Attributes inside a {...} response block are
+    returned like top-level ones.
+
+    Attributes are separated by ", "; an escaped "\\, " (certificate subjects, AD errors)
+    is part of the value. With `wanted`, only the first value of those attributes is
+    returned, found by searching the raw message for each name instead of tokenizing it.
+    """
+    if wanted is not None:
+        attributes = _find_attributes(message, wanted)
+        if attributes is not None:
+            return attributes
+        return {key: values[:1] for key, values in parse_ise_attributes(message).items() if key in wanted}
+    attributes = {}
+    escaped = False
+    # re.split alternates plain text and {...} response blocks
+    parts = _RESPONSE_BLOCK.split(_strip_chunk_headers(message))
+    for i, part in enumerate(parts):
+        if i % 2:
+            for token in part.split(';'):
+                _add_token(attributes, token)
+            continue
+        if '\\, ' in part:
+            # Hide escaped separators from the split; restored on the values at the end
+            escaped = True
+            part = part.replace('\\, ', '\\\x1f')
+        tokens = part.split(', ')
+        if i + 1 < len(parts):
+            # The block's own name ("Response=") is not an attribute
+            tokens.pop()
+        for token in tokens:
+            key, sep, value = token.partition('=')
+            if sep:
+                values = attributes.get(key)
+                if values is None:
+                    attributes[key] = [value]
+                else:
+                    values.append(value)
+    return _unescape(attributes) if escaped else attributes
+
+
+def _find_attributes(message, wanted):
+    # None when an attribute sits where only the full tokenizer reads it correctly:
+    # a name cut by a chunk header, a separator escaped across one, a {...} block.
+    # The first chunk is searched with one regex; the chunk headers after it are only
+    # parsed for names it does not hold.
+    key = wanted if isinstance(wanted, frozenset) else frozenset(wanted)
+    patterns = _WANTED_PATTERNS.get(key)
+    if patterns is None:
+        patterns = _WANTED_PATTERNS[key] = _wanted_patterns(key)
+    top_level, in_block = patterns
+    block = message.find('{')
+    if block >= 0 and in_block.search(message, block) is not None:
+        return None
+    later = message.find('CISE_', message.find('CISE_') + 1)
+    limit = message.rfind('<', 0, later) if later > 0 else -1
+    if limit < 0:
+        limit = len(message)
+    attributes = {}
+    if not 0 <= block < limit and message.find('\\, ', 0, limit) < 0:
+        # Nothing in the first chunk hides a separator, so the matches need no position checks
+        for name, value, clean in top_level.findall(message, 0, limit):
+            if name in attributes:
+                continue
+            # `clean` when the value runs to a plain ", " inside the first chunk
+            if not clean:
+                start = message.find(', %s=' % name) + len(name) + 3
+                # A value that ends the chunk is whole when the next chunk starts a new attribute
+                if not (start + len(value) == limit - 1 and value[-1:] != '\\' and _new_attribute_at(message, limit)):
+                    value = _value_at(message, start, limit, block)
+                    if value is None:
+                        return None
+            attributes[name] = [value]
+    else:
+        for match in top_level.finditer(message, 0, limit):
+            name, value, clean = match.groups()
+            if name in attributes or message[match.start() - 1] == '\\':
+                continue
+            if block >= 0:
+                if block < match.start() and _in_block(message, match.start()):
+                    continue
+                if match.end() > block:
+                    clean = None
+            if not clean:
+                value = _value_at(message, match.start(2), limit, block)
+                if value is None:
+                    return None
+            attributes[name] = [value]
+    if len(attributes) == len(wanted) or limit == len(message):
+        return attributes
+    missing = [name for name in wanted if name not in attributes]
+    header_ends = _header_ends(message, missing)
+    if header_ends is None:
+        return None
+    for name in missing:
+        needle = name + '='
+        position = message.find(needle)
+        while position >= 0:
+            if (0 <= block < position and _in_block(message, position)) or not (
+                    position in header_ends or message[position - 2:position] == ', ' and message[position - 3] != '\\'):
+                position = message.find(needle, position + 1)
+                continue
+            value = _value_at(message, position + len(needle), 0, block)
+            if value is None:
+                return None
+            attributes[name] = [value]
+            break
+    return attributes
+
+
+def _wanted_patterns(wanted):
+    names = '|'.join(re.escape(name) for name in sorted(wanted, key=len, reverse=True))
+    # The lookahead rejects most separators on their first character
+    initials = ''.join(sorted({re.escape(name[:1]) for name in wanted}))
+    lookahead = '(?=[%s])' % initials if initials and all(wanted) else ''
+    return (re.compile(r', %s(%s)=([^,]*)(?=(, ))?' % (lookahead, names)),
+            re.compile('[{;] *(%s)=' % names))
+
+
+def _header_ends(message, wanted):
+    # Where the attributes after each new-attribute chunk header start
+    header_ends = set()
+    key_start = 0
+    position = message.find('CISE_')
+    while position >= 0:
+        position = message.find('CISE_', position + 1)
+        header = _CHUNK_HEADER.match(message, message.rfind('<', 0, position)) if position > 0 else None
+        if header is None:
+            continue
+        start = header.start()
+        if header.group(1) or message[start - 2:start] == ', ':
+            if message[start - 1] == ',' and message[start - 2] == '\\' or message[start - 3:start] == '\\, ':
+                return None
+            key_start = header.end()
+            header_ends.add(key_start)
+        elif message[start - 1] == '\\':
+            return None
+        else:
+            head = message[max(message.rfind(', ', key_start, start) + 2, message.rfind('{', key_start, start) + 1,
+                               message.rfind(';', key_start, start) + 1, key_start):start]
+            if '=' not in head:
+                # The header splits a name; the tokenizer reads it joined
+                end = message.find('=', header.end())
+                tail = message[header.end():end]
+                if end > 0 and ('CISE_' in head or 'CISE_' in tail or head.lstrip(' ') + tail in wanted):
+                    return None
+    return header_ends
+
+
+def _new_attribute_at(message, position):
+    header = _CHUNK_HEADER.match(message, position)
+    return header is not None and header.group(1)
+
+
+def _in_block(message, position):
+    return message.rfind('{', 0, position) > message.rfind('}', 0, position)
+
+
+def _value_at(message, start, clean, block):
+    # Up to the next unescaped ", ", joining a value cut by chunk headers. Values ending
+    # before `clean` hold no chunk header.
+    end = message.find(', ', start)
+    if 0 < end < clean and message[end - 1] != '\\' and (block < 0 or end < block):
+        return message[start:end]
+    pieces = []
+    while True:
+        end = start
+        while True:
+            end = message.find(', ', end)
+            if end < 0 or message[end - 1] != '\\':
+                break
+            end += 2
+        if end < 0:
+            end = len(message)
+        if message.find('{', start, end) >= 0:
+            return None
+        header = message.find('CISE_', start, end)
+        header = message.rfind('<', start, header) if header >= 0 else -1
+        header = _CHUNK_HEADER.match(message, header) if header >= 0 else None
+        if header is None:
+            pieces.append(message[start:end])
+            value = ''.join(pieces)
+            return value.rstrip() if end == len(message) else value
+        if message[header.start() - 1] == '\\':
+            return None
+        pieces.append(message[start:header.start()])
+        if header.group(1):
+            value = ''.join(pieces).rstrip(',')
+            return None if value.endswith('\\') else value
+        start = header.end()
+
+
+def _unescape(attributes):
+    for values in attributes.values():
+        values[:] = [value.replace('\\\x1f', '\\, ') for value in values]
+    return attributes
+
+
+def _add_token(attributes, token):
+    key, sep, value = token.partition('=')
+    if not sep:
+        return
+    key = key.strip()
+    values = attributes.get(key)
+    if values is None:
+        attributes[key] = [value]
+    else:
+        values.append(value)
+
+
+def first_value(attributes, key, default=None):
+    values = attributes.get(key)
+    return values[0] if values else default
+
+
+def prefixed_values(attributes, key, prefix):
+    """
+    Values of `key` that start with `prefix`, with the prefix removed.
+    Used for qualified attributes such as NetworkDeviceGroups=Location#... .
+    """
+    return [value[len(prefix):] for value in attributes.get(key, ()) if value.startswith(prefix)]
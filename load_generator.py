@@ -0,0 +1,267 @@
+import argparse
+import random
+import socket
+import time
+from datetime import datetime, timedelta
+
+# Synthetic ISE and WLC syslog traffic for load tests. Messages are built from templates
+# with seeded random values, so a seed always gives the same traffic. Every message
+# carries its sequence number in the user name (bench-<seq>), which ends up in the
+# table row, so a benchmark can match rows to the messages they came from.
+
+# Share of each message kind; `table` in the message says where its row should land
+DEFAULT_MIX = {
+    'passed_wired': 40,
+    'passed_wireless': 25,
+    'failed': 15,
+    'tacacs_accounting': 10,
+    'ignored': 5,
+    'wlc': 5,
+}
+MAX_FRAGMENTS = 7
+DUPLICATE_RATE = 0.02  # Messages with one fragment sent twice
+REORDER_RATE = 0.05  # Multi-fragment messages sent out of order, one fragment after the next message
+BASE_TIME = datetime(2024, 8, 9, 12, 0, 0)
+
+ISE_HOSTS = ['HO-FRN-ISE-03S', 'HO-FRN-ISE-04S', 'HO-TMS-ISE-01S']
+SWITCHES = ['HO-TMS-SW80-4B-Comms', 'HO-FRN-SW12-2A-Core', 'HO-HAH-SW03-1C-Edge', 'HO-PHL-SW07-3B-Edge']
+CONTROLLERS = ['HO-FRN-WLC-01', 'HO-FRN-WLC-02', 'HO-TMS-WLC-01']
+LOCATIONS = ['TMS#Peel House', 'FRN#Marsham Street', 'HAH', 'PHL#Lunar House']
+FAILURE_REASONS = [
+    "24486 Machine authentication against Active Directory has failed because the machine's account is disabled",
+    '22056 Subject not found in the applicable identity store(s)',
+    '12514 EAP-TLS failed SSL/TLS handshake because of an unknown CA in the client certificates chain',
+    '5400 Authentication failed',
+]
+COMMANDS = ['show CmdArgAV=interface CmdArgAV=status', 'show CmdArgAV=running-config',
+            'configure CmdArgAV=terminal', 'interface CmdArgAV=GigabitEthernet1/0/12', 'write CmdArgAV=memory']
+WLC_EVENTS = [
+    ('apfMsConnTask_5', 'APF-6-USER_NAME_CREATED', 'apf_ms.c:2012 Username:{user} Client:{mac}'),
+    ('Dot1x_NW_MsgTask_2', 'DOT1X-6-MAX_EAPOL_KEY_RETRANS_REACHED',
+     '1x_ptsm.c:599 Max EAPOL-key M1 retransmissions exceeded for client {mac} user {user}'),
+    ('spamApTask3', 'CAPWAP-3-ECHO_ERR', 'capwap_ac_sm.c:7574 Did not receive heartbeat reply; AP: {mac} ({user})'),
+]
+STEPS = [11001, 11017, 15049, 15008, 15048, 11507, 12500, 12625, 11006, 11018, 12502, 12800, 12545, 24210, 22037]
+
+
+class SyntheticMessage:
+    __slots__ = ('seq', 'kind', 'table', 'source', 'datagrams')
+
+    def __init__(self, seq, kind, table, source, datagrams):
+        self.seq = seq
+        self.kind = kind
+        # Expected destination table, or None for traffic the server should ignore
+        self.table = table
+        # 'ise' or 'wlc': which sending address it comes from
+        self.source = source
+        self.datagrams = datagrams
+
+
+class TrafficGenerator:
+    def __init__(self, seed=0, mix=None, duplicate_rate=DUPLICATE_RATE, reorder_rate=REORDER_RATE,
+                 messages_per_second=1000):
+        self.random = random.Random(seed)
+        mix = mix or DEFAULT_MIX
+        self.kinds = list(mix)
+        self.weights = [mix[kind] for kind in self.kinds]
+        self.duplicate_rate = duplicate_rate
+        self.reorder_rate = reorder_rate
+        # Event times advance at the sending rate from a fixed base, so content does not depend on the clock
+        self.time_step = 1.0 / messages_per_second
+        self.builders = {
+            'passed_wired': self._passed_wired,
+            'passed_wireless': self._passed_wireless,
+            'failed': self._failed,
+            'tacacs_accounting': self._tacacs_accounting,
+            'ignored': self._ignored,
+            'wlc': self._wlc,
+        }
+
+    def message(self, seq):
+        kind = self.random.choices(self.kinds, self.weights)[0]
+        return self.builders[kind](seq, BASE_TIME + timedelta(seconds=seq * self.time_step))
+
+    def stream(self, count):
+        """
+        (message, datagram, last) in send order, where last marks the datagram after which
+        all of the message's datagrams have been sent. Out-of-order and duplicated
+        fragments are applied here.
+        """
+        delayed = None
+        for seq in range(count):
+            message = self.message(seq)
+            datagrams = list(message.datagrams)
+            if len(datagrams) > 1 and self.random.random() < self.duplicate_rate:
+                datagrams.insert(self.random.randrange(len(datagrams) + 1), self.random.choice(datagrams))
+            held = None
+            if len(datagrams) > 1 and self.random.random() < self.reorder_rate:
+                self.random.shuffle(datagrams)
+                held = datagrams.pop()
+            for index, datagram in enumerate(datagrams):
+                yield message, datagram, held is None and index == len(datagrams) - 1
+            if delayed is not None:
+                yield delayed[0], delayed[1], True
+            delayed = (message, held) if held is not None else None
+        if delayed is not None:
+            yield delayed[0], delayed[1], True
+
+    def _mac(self):
+        return '-'.join(f'{self.random.randrange(256):02X}' for _ in range(6))
+
+    def _ip(self, prefix='10.42'):
+        return f'{prefix}.{self.random.randrange(1, 255)}.{self.random.randrange(1, 255)}'
+
+    def _ise_chunks(self, category, seq, event_time, body, fragments):
+        # ISE splits a message into chunks that each start with the syslog header and
+        # "<category> <unique id> <total> <index>"; the first carries the event time
+        host = ISE_HOSTS[seq % len(ISE_HOSTS)]
+        header_time = f"{event_time:%b} {event_time.day:2d} {event_time:%H:%M:%S}"
+        body = f"{event_time:%Y-%m-%d %H:%M:%S}.{event_time.microsecond // 1000:03d} +00:00 " \
+               f"{self.random.randrange(10 ** 9, 10 ** 10)} {body}"
+        size = -(-len(body) // fragments)
+        pieces = [body[i:i + size] for i in range(0, len(body), size)]
+        unique_id = 100000000 + seq
+        return [f"<181>{header_time} {host} CISE_{category} {unique_id:010d} {len(pieces)} {index} {piece}".encode()
+                for index, piece in enumerate(pieces)]
+
+    def _passed_common(self, seq):
+        location = self.random.choice(LOCATIONS)
+        return (f"UserName=bench-{seq}, AuthenticationIdentityStore=POISE_AD, AuthenticationMethod=x509_PKI, "
+                f"SelectedAccessService=EAP-TLS-Only, SelectedAuthorizationProfiles=PermitAccess, "
+                f"IdentityGroup=Endpoint Identity Groups:Profiled:Workstation, "
+                f"SelectedAuthenticationIdentityStores=HO_CAP, AuthenticationStatus=AuthenticationPassed, "
+                f"NetworkDeviceGroups=Location#All Locations#{location}, "
+                f"IdentityPolicyMatchedRule=Default, AuthorizationPolicyMatchedRule=Secure_Access, "
+                f"Subject - Common Name=D-{seq:07d}, EndPointMACAddress={self._mac()}, "
+                f"ISEPolicySetName=POISE_Secure_Dot1X, Days to Expiry={self.random.randrange(1, 700)}, "
+                f"Session-Timeout=28800, CPMSessionID={self.random.getrandbits(96):024X}, "
+                + ', '.join(f'Step={step}' for step in self.random.sample(STEPS, 10)))
+
+    def _passed_wired(self, seq, event_time):
+        switch = self.random.choice(SWITCHES)
+        body = (f"5200 NOTICE Passed-Authentication: Authentication succeeded, ConfigVersionId=429, "
+                f"Device IP Address={self._ip()}, DestinationIPAddress=10.23.18.220, DestinationPort=1812, "
+                f"NAS-IP-Address={self._ip()}, NAS-Port-Id=GigabitEthernet1/0/{self.random.randrange(1, 48)}, "
+                f"NetworkDeviceName={switch}, RequestLatency={self.random.randrange(1, 400)}, "
+                f"Protocol=Radius, {self._passed_common(seq)}, "
+                f"NetworkDeviceGroups=Device Type#All Device Types#switch, "
+                f"NetworkDeviceGroups=Rollout Stage#Rollout Stage#Secure, Response={{RadiusPacketType=AccessAccept; }}")
+        return SyntheticMessage(seq, 'passed_wired', 'pla', 'ise',
+                                self._ise_chunks('Passed_Authentications', seq, event_time, body, self.random.randint(1, 3)))
+
+    def _passed_wireless(self, seq, event_time):
+        controller = self.random.choice(CONTROLLERS)
+        body = (f"5200 NOTICE Passed-Authentication: Authentication succeeded, ConfigVersionId=429, "
+                f"Device IP Address={self._ip('10.23')}, NAS-IP-Address={self._ip('10.23')}, "
+                f"Called-Station-ID={self._mac()}:HO-Corporate, RadiusFlowType=Wireless802_1x, "
+                f"NetworkDeviceName={controller}, RequestLatency={self.random.randrange(1, 400)}, "
+                f"Protocol=Radius, {self._passed_common(seq)}, "
+                f"NetworkDeviceGroups=Device Type#All Device Types#Wireless Controller, "
+                f"Response={{RadiusPacketType=AccessAccept; }}")
+        return SyntheticMessage(seq, 'passed_wireless', 'pwa', 'ise',
+                                self._ise_chunks('Passed_Authentications', seq, event_time, body, self.random.randint(1, 3)))
+
+    def _failed(self, seq, event_time):
+        variant = self.random.random()
+        reason = self.random.choice(FAILURE_REASONS)
+        if variant < 0.2:
+            table = 'fta'
+            attributes = (f"Failed-Attempt: Authentication failed, Device IP Address={self._ip()}, "
+                          f"UserName=bench-{seq}, Remote-Address={self._ip('10.221')}, "
+                          f"NetworkDeviceName={self.random.choice(SWITCHES)}, Protocol=Tacacs")
+        elif variant < 0.6:
+            table = 'fwa'
+            attributes = (f"Failed-Attempt: Authentication failed, UserName=bench-{seq}, "
+                          f"NAS-IP-Address={self._ip('10.23')}, Called-Station-ID=HO-Corporate, "
+                          f"NetworkDeviceName={self.random.choice(CONTROLLERS)}, Protocol=Radius")
+        else:
+            table = 'fla'
+            attributes = (f"Failed-Attempt: Authentication failed, UserName=bench-{seq}, "
+                          f"NAS-IP-Address={self._ip()}, NAS-Port-Id=GigabitEthernet1/0/{self.random.randrange(1, 48)}, "
+                          f"Called-Station-ID={self._mac()}, NetworkDeviceName={self.random.choice(SWITCHES)}, "
+                          f"Protocol=Radius")
+        fragments = self.random.randint(1, MAX_FRAGMENTS)
+        # Failed attempts carry long step lists; about 1 KB of them per fragment
+        steps = ', '.join(f'Step={self.random.choice(STEPS)}' for _ in range(fragments * 80))
+        body = (f"5400 NOTICE {attributes}, FailureReason={reason}, RequestLatency={self.random.randrange(1, 900)}, "
+                f"{steps}, Response={{RadiusPacketType=AccessReject; AuthenticationResult=Failed; }}")
+        return SyntheticMessage(seq, 'failed', table, 'ise',
+                                self._ise_chunks('Failed_Attempts', seq, event_time, body, fragments))
+
+    def _tacacs_accounting(self, seq, event_time):
+        body = (f"3300 NOTICE TACACS: TACACS+ Accounting with Command, User=bench-{seq}, "
+                f"NetworkDeviceName={self.random.choice(SWITCHES)}, Device IP Address={self._ip()}, "
+                f"Remote-Address={self._ip('10.221')}, Port=tty1, "
+                f"CmdSet=[ CmdAV={self.random.choice(COMMANDS)} CmdArgAV=<cr> ], Privilege-Level=15, Service=Login")
+        return SyntheticMessage(seq, 'tacacs_accounting', 'tca', 'ise',
+                                self._ise_chunks('TACACS_Accounting', seq, event_time, body, 1))
+
+    def _ignored(self, seq, event_time):
+        # TACACS command authorizations, which the receiver drops on the raw bytes
+        body = (f"5202 NOTICE Device-Administration: Command Authorization succeeded, UserName=bench-{seq}, "
+                f"CmdSet=[ CmdAV=show CmdArgAV=version CmdArgAV=<cr> ], Protocol=Tacacs, "
+                f"NetworkDeviceName={self.random.choice(SWITCHES)}")
+        return SyntheticMessage(seq, 'ignored', None, 'ise',
+                                self._ise_chunks('Passed_Authentications', seq, event_time, body, 1))
+
+    def _wlc(self, seq, event_time):
+        task, event, text = self.random.choice(WLC_EVENTS)
+        priority = 16 * 8 + int(event.split('-')[1])  # local0
+        message = (f"<{priority}>{self.random.choice(CONTROLLERS)}: *{task}: "
+                   f"{event_time:%b %d %H:%M:%S}.{event_time.microsecond // 1000:03d}: %{event}: "
+                   + text.format(user=f'bench-{seq}', mac=self._mac().replace('-', ':').lower()))
+        return SyntheticMessage(seq, 'wlc', 'wlc', 'wlc', [message.encode()])
+
+
+def send_traffic(stream, rate, host, port, sources, on_message=None):
+    """
+    Send a TrafficGenerator.stream() to host:port at `rate` messages per second from the
+    source addresses in `sources` ('ise' and 'wlc' -> local address to bind). Calls
+    on_message(message, send time) once all of a message's datagrams are sent. Returns
+    the number of datagrams sent. Materialise the stream into a list first for rates
+    above what generating on the fly can keep up with.
+    """
+    sockets = {}
+    for kind, address in sources.items():
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((address, 0))
+        sockets[kind] = sock
+    sent = 0
+    completed = 0
+    started = time.perf_counter()
+    try:
+        for message, datagram, last in stream:
+            sockets[message.source].sendto(datagram, (host, port))
+            sent += 1
+            if last:
+                completed += 1
+                if on_message is not None:
+                    on_message(message, time.time())
+                if completed % 16 == 0:
+                    delay = completed / rate - (time.perf_counter() - started)
+                    if delay > 0:
+                        time.sleep(delay)
+    finally:
+        for sock in sockets.values():
+            sock.close()
+    return sent
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Send synthetic ISE and WLC syslog traffic")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=514)
+    parser.add_argument('--rate', type=float, default=1000, help="Messages per second")
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ise-source', default='0.0.0.0', help="Local address ISE traffic is sent from")
+    parser.add_argument('--wlc-source', default='0.0.0.0', help="Local address WLC traffic is sent from")
+    args = parser.parse_args()
+
+    generator = TrafficGenerator(args.seed, messages_per_second=args.rate)
+    stream = list(generator.stream(args.messages))
+    started = time.time()
+    datagrams = send_traffic(stream, args.rate, args.host, args.port, {'ise': args.ise_source, 'wlc': args.wlc_source})
+    elapsed = time.time() - started
+    print(f"Sent {args.messages} messages in {datagrams} datagrams to {args.host}:{args.port} "
+          f"in {elapsed:.1f}s ({args.messages / elapsed:,.0f} msg/s)")
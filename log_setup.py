@@ -0,0 +1,149 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# The service's drive on Windows; elsewhere a directory beside the modules, as for routes.json
+DEFAULT_LOG_DIRECTORY = r'C:\Syslog' if os.name == 'nt' else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log')
+DEFAULT_LOG_LEVEL = 'INFO'
+LOG_FORMAT = '%(asctime)s - %(processName)s - %(threadName)s - %(levelname)s - %(message)s'
+RATE_LIMIT_INTERVAL = 60  # Seconds over which repeated warnings are counted
+RATE_LIMIT_BURST = 5  # Repeats of one warning logged per interval before the rest are suppressed
+
+# Records are handed to a background thread through this queue, so the ingest threads never
+# wait on the log file or the console
+_listener = None
+_rate_limiter = None
+
+
+def log_directory():
+    # SYSLOG_LOG_DIR overrides the default, so the service can run from any drive or host
+    return os.environ.get('SYSLOG_LOG_DIR', DEFAULT_LOG_DIRECTORY)
+
+
+def log_level():
+    return logging.getLevelName(os.environ.get('SYSLOG_LOG_LEVEL', DEFAULT_LOG_LEVEL).upper())
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Queues the record itself rather than the formatted message, so the %-formatting
+    happens on the listener thread. Records whose arguments could change before then
+    (dicts, lists, objects) are formatted now, as QueueHandler does.
+    """
+
+    _IMMUTABLE = (str, int, float, bool, type(None), bytes)
+
+    def prepare(self, record):
+        args = record.args
+        if record.exc_info or (args and not all(isinstance(arg, self._IMMUTABLE) for arg in
+                                                (args if isinstance(args, tuple) else (args,)))):
+            return super().prepare(record)
+        return record
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Lets through RATE_LIMIT_BURST records of each warning (keyed by its unformatted
+    message) per RATE_LIMIT_INTERVAL and counts the rest. The count is reported on the
+    next record of that warning let through, or by report_suppressed().
+    Records below WARNING are not limited.
+    """
+
+    def __init__(self, interval=RATE_LIMIT_INTERVAL, burst=RATE_LIMIT_BURST):
+        super().__init__()
+        self.interval = interval
+        self.burst = burst
+        self.lock = threading.Lock()
+        # (logger name, level, message template) -> [window start, records in window, suppressed]
+        self.windows = {}
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = record.created
+        with self.lock:
+            window = self.windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self.windows[key] = [now, 1, 0]
+                if suppressed:
+                    record.msg = f"{record.msg} [{suppressed} similar messages suppressed]"
+                return True
+            window[1] += 1
+            if window[1] <= self.burst:
+                return True
+            window[2] += 1
+            return False
+
+    def report_suppressed(self, now=None):
+        # Summarize warnings whose window ended with suppressed repeats and that have not recurred
+        now = time.time() if now is None else now
+        expired = []
+        with self.lock:
+            for key, window in list(self.windows.items()):
+                if now - window[0] >= self.interval:
+                    del self.windows[key]
+                    if window[2]:
+                        expired.append((key, window[2]))
+        for (name, level, template), suppressed in expired:
+            logging.getLogger(name).log(level, "Suppressed %d repeats in %ss of: %s",
+                                        suppressed, self.interval, template)
+
+
+def configure_logging(process_name, directory=None, level=None, console=True):
+    """
+    Log to <directory>/syslogService_<process_name>.txt (and the console) through a
+    background writer thread. Call once at the start of each process; later calls
+    reconfigure it.
+    """
+    global _listener, _rate_limiter
+    directory = directory or log_directory()
+    level = log_level() if level is None else level
+    os.makedirs(directory, exist_ok=True)
+
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [logging.FileHandler(os.path.join(directory, f'syslogService_{process_name}.txt'), mode='a')]
+    if console:
+        handlers.append(logging.StreamHandler())
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    stop_logging()
+    records = queue.SimpleQueue()
+    _rate_limiter = RateLimitFilter()
+    queue_handler = _DeferredQueueHandler(records)
+    queue_handler.addFilter(_rate_limiter)
+
+    root = logging.getLogger()
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+        handler.close()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    logging.info("Logging started for %s in %s at %s", process_name, directory, logging.getLevelName(level))
+
+
+def report_suppressed():
+    if _rate_limiter is not None:
+        _rate_limiter.report_suppressed()
+
+
+def stop_logging():
+    # Write out what is queued and stop the writer thread
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
@@ -0,0 +1,212 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import socket
+import sys
+import threading
+import time
+from datetime import datetime
+
+BLOCK_BYTES = 256 * 1024  # Uncompressed records per block before it is compressed and written
+BLOCK_AGE = 10  # Seconds a block may stay open before it is written anyway
+SEGMENT_BYTES = 256 * 1024 * 1024  # Compressed bytes per segment file before a new one is started
+MAX_QUEUED_MESSAGES = 20000  # Messages waiting for the archive thread; beyond this they are not archived
+
+_CATEGORY = re.compile(r'CISE_(\w+)')
+# Start of each chunk of a reassembled ISE message, as in ise_attributes
+_CHUNK_START = re.compile(r'<\d+>\w{3} +\d+ [\d:]{8} \S+ CISE_\w+ \d+ \d+ \d+')
+
+
+def message_category(message):
+    match = _CATEGORY.search(message, 0, 512)
+    return match.group(1) if match else 'other'
+
+
+class MessageArchive:
+    """
+    Append-only archive of raw (reassembled) messages.
+
+    Messages are grouped into blocks per (source IP, category), each block a gzip member
+    of JSON lines [arrival time, source IP, message], so a segment file is also a plain
+    .gz file. Every block written adds a line to the segment's .idx sidecar:
+    {"offset", "length", "start", "end", "source", "category", "count"}, so a query reads
+    only the blocks of the wanted sources, categories and time window.
+
+    append() never blocks the caller: messages go to a bounded queue drained by a
+    background thread, and are counted as dropped when it is full.
+    """
+
+    def __init__(self, directory, block_bytes=BLOCK_BYTES, block_age=BLOCK_AGE, segment_bytes=SEGMENT_BYTES,
+                 max_queued=MAX_QUEUED_MESSAGES):
+        self.directory = directory
+        self.block_bytes = block_bytes
+        self.block_age = block_age
+        self.segment_bytes = segment_bytes
+        self.messages = queue.Queue(max_queued)
+        self.stats = {'archived': 0, 'dropped': 0, 'blocks': 0, 'bytes': 0}
+        # (source, category) -> [records, uncompressed size, first time, last time]
+        self.blocks = {}
+        self.segment = None
+        self.index = None
+        os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="MessageArchive", daemon=True)
+        self.thread.start()
+
+    def append(self, ip, message):
+        try:
+            self.messages.put_nowait((time.time(), ip, message))
+        except queue.Full:
+            self.stats['dropped'] += 1
+
+    def close(self, timeout=30):
+        self.messages.put(None)
+        self.thread.join(timeout)
+
+    def _run(self):
+        while True:
+            try:
+                item = self.messages.get(timeout=1)
+            except queue.Empty:
+                item = False
+            if item is None:
+                break
+            try:
+                if item:
+                    self._add(*item)
+                self._write_due(time.time())
+            except OSError as error:
+                logging.error("Message archive write failed: %s", error)
+        try:
+            self._write_due(None)
+            self._close_segment()
+        except OSError as error:
+            logging.error("Message archive write failed: %s", error)
+
+    def _add(self, arrived, ip, message):
+        key = (ip, message_category(message))
+        record = json.dumps([round(arrived, 3), ip, message]) + '\n'
+        block = self.blocks.get(key)
+        if block is None:
+            block = self.blocks[key] = [[], 0, arrived, arrived]
+        block[0].append(record)
+        block[1] += len(record)
+        block[3] = arrived
+        self.stats['archived'] += 1
+        if block[1] >= self.block_bytes:
+            self._write_block(key, self.blocks.pop(key))
+
+    def _write_due(self, now):
+        # now=None writes every open block
+        for key, block in list(self.blocks.items()):
+            if now is None or now - block[2] >= self.block_age:
+                self._write_block(key, self.blocks.pop(key))
+
+    def _write_block(self, key, block):
+        records, size, start, end = block
+        data = gzip.compress(''.join(records).encode('utf-8', errors='replace'), compresslevel=6)
+        if self.segment is None or self.segment.tell() + len(data) > self.segment_bytes:
+            self._open_segment()
+        offset = self.segment.tell()
+        self.segment.write(data)
+        self.segment.flush()
+        source, category = key
+        self.index.write(json.dumps({'offset': offset, 'length': len(data), 'start': start, 'end': end,
+                                     'source': source, 'category': category, 'count': len(records)}) + '\n')
+        self.index.flush()
+        self.stats['blocks'] += 1
+        self.stats['bytes'] += len(data)
+
+    def _open_segment(self):
+        self._close_segment()
+        name = f"archive-{time.strftime('%Y%m%d-%H%M%S')}"
+        suffix = 0
+        while os.path.exists(os.path.join(self.directory, name + '.gz')):
+            suffix += 1
+            name = f"archive-{time.strftime('%Y%m%d-%H%M%S')}-{suffix}"
+        self.segment = open(os.path.join(self.directory, name + '.gz'), 'ab')
+        self.index = open(os.path.join(self.directory, name + '.idx'), 'a')
+
+    def _close_segment(self):
+        if self.segment is not None:
+            self.segment.close()
+            self.index.close()
+            self.segment = None
+            self.index = None
+
+
+def query_archive(directory, start=None, end=None, source=None, category=None):
+    """
+    Archived (arrival time, source IP, message) tuples under `directory` (searched
+    recursively, so the per-worker archives are read together), in time order per block.
+    start and end are epoch seconds; None leaves that side open.
+    """
+    for root, _, files in os.walk(directory):
+        for name in sorted(files):
+            if not name.endswith('.idx'):
+                continue
+            segment_path = os.path.join(root, name[:-4] + '.gz')
+            with open(os.path.join(root, name)) as index:
+                entries = [json.loads(line) for line in index if line.endswith('\n')]
+            wanted = [entry for entry in entries
+                      if (source is None or entry['source'] == source)
+                      and (category is None or entry['category'] == category)
+                      and (start is None or entry['end'] >= start)
+                      and (end is None or entry['start'] <= end)]
+            if not wanted:
+                continue
+            with open(segment_path, 'rb') as segment:
+                for entry in wanted:
+                    segment.seek(entry['offset'])
+                    block = gzip.decompress(segment.read(entry['length'])).decode('utf-8')
+                    for line in block.split('\n')[:-1]:
+                        arrived, ip, message = json.loads(line)
+                        if (start is None or arrived >= start) and (end is None or arrived <= end):
+                            yield arrived, ip, message
+
+
+def split_chunks(message):
+    # A reassembled ISE message back into the datagrams it arrived as, so it can be replayed
+    starts = [match.start() for match in _CHUNK_START.finditer(message)]
+    if len(starts) < 2:
+        return [message]
+    return [message[begin:end] for begin, end in zip(starts, starts[1:] + [len(message)])]
+
+
+def _parse_time(value):
+    return datetime.strptime(value, '%Y-%m-%d %H:%M:%S').timestamp() if value else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Query or replay the raw message archive")
+    parser.add_argument('command', choices=['query', 'replay'])
+    parser.add_argument('--dir', required=True, help="Archive directory, e.g. C:\\Syslog\\archive")
+    parser.add_argument('--start', help="YYYY-MM-DD HH:MM:SS, local time")
+    parser.add_argument('--end', help="YYYY-MM-DD HH:MM:SS, local time")
+    parser.add_argument('--source', help="Source IP")
+    parser.add_argument('--category', help="CISE category, e.g. Passed_Authentications, or 'other'")
+    parser.add_argument('--host', default='127.0.0.1', help="replay: syslog server to send to")
+    parser.add_argument('--port', type=int, default=514)
+    parser.add_argument('--rate', type=float, default=1000, help="replay: messages per second")
+    args = parser.parse_args()
+
+    messages = query_archive(args.dir, _parse_time(args.start), _parse_time(args.end), args.source, args.category)
+    if args.command == 'query':
+        for arrived, ip, message in messages:
+            sys.stdout.write(f"{datetime.fromtimestamp(arrived):%Y-%m-%d %H:%M:%S.%f} {ip} {message}\n")
+    else:
+        # Sent from this host, so the server must route this address to the handler being replayed into
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sent = 0
+        started = time.time()
+        for arrived, ip, message in messages:
+            for chunk in split_chunks(message):
+                sock.sendto(chunk.encode('utf-8'), (args.host, args.port))
+            sent += 1
+            delay = sent / args.rate - (time.time() - started)
+            if delay > 0:
+                time.sleep(delay)
+        print(f"Replayed {sent} messages to {args.host}:{args.port}")
@@ -0,0 +1,195 @@
+import re
+import time
+from collections import OrderedDict
+
+# ISE header of every chunk: CISE_<category> <unique id> <total chunks> <chunk number>
+CISE_HEADER = re.compile(rb'CISE_(\w+) (\d+) (\d+) (\d+)')
+# What the receiver's shard routing keys on: the unique id, which cancel notices carry too
+CISE_UNIQUE_ID = re.compile(rb'CISE_\w+ (\d+) ')
+# Header bytes searched for the CISE header
+HEADER_SEARCH_BYTES = 512
+# Sent to the worker shard in place of a dropped message's chunk when earlier chunks of it
+# were already forwarded, so the shard discards them instead of holding them to expiry.
+# It matches the shard routing pattern, so it reaches the same shard as those chunks.
+CANCEL_PREFIX = b'\x00CISE_Cancel '
+MESSAGE_TIMEOUT = 30  # As message_combiner: how long a multi-chunk message is tracked
+MAX_TRACKED_MESSAGES = 20000
+
+
+def parse_header(data):
+    """
+    (category, unique id, total chunks, chunk number) of a datagram's CISE header, as
+    bytes, or None for a datagram without one.
+    """
+    header = CISE_HEADER.search(data, 0, HEADER_SEARCH_BYTES)
+    return None if header is None else header.groups()
+
+
+class ChunkTracker:
+    """
+    Multi-chunk ISE messages by (source IP, unique id), from their first chunk seen until
+    all their chunks have been seen or `timeout` passes, each with a state list of the
+    caller's: [deadline, chunks seen, ...].
+    """
+
+    def __init__(self, timeout=MESSAGE_TIMEOUT, max_tracked=MAX_TRACKED_MESSAGES):
+        self.timeout = timeout
+        self.max_tracked = max_tracked
+        self.tracked = OrderedDict()
+
+    def count(self, key, total, now):
+        # Counts a chunk of message `key`; returns its state and whether it is the first chunk seen
+        state = self.tracked.get(key)
+        first = state is None
+        if first:
+            state = self.tracked[key] = [now + self.timeout, 0]
+        state[1] += 1
+        if state[1] >= total:
+            del self.tracked[key]
+        return state, first
+
+    def expire(self, now):
+        tracked = self.tracked
+        while tracked:
+            key, state = next(iter(tracked.items()))
+            if state[0] > now and len(tracked) <= self.max_tracked:
+                break
+            del tracked[key]
+
+    def __len__(self):
+        return len(self.tracked)
+
+
+class DropRule:
+    """
+    Drop an ISE message of `category` (None: any category) that contains `marker`, or with
+    lacks=True, that does not contain it.
+
+    'contains' rules are checked on every chunk, so a marker in a later chunk still drops
+    the whole message. 'lacks' rules are checked on the first chunk (chunk 0), where ISE
+    puts the message code and text; a marker split across a chunk boundary is not seen,
+    which is why the ISE handlers keep their own checks.
+    """
+    __slots__ = ('name', 'category', 'marker', 'lacks')
+
+    def __init__(self, name, category, marker, lacks=False):
+        self.name = name
+        self.category = category.encode() if isinstance(category, str) else category
+        self.marker = marker.encode() if isinstance(marker, str) else marker
+        self.lacks = lacks
+
+
+# The messages cisco_ise_handler throws away
+DEFAULT_DROP_RULES = [
+    DropRule('tacacs_accounting_rejected', None, 'TACACS+ Accounting request rejected'),
+    DropRule('tacacs_accounting_without_command', 'TACACS_Accounting', 'TACACS+ Accounting with Command', lacks=True),
+    DropRule('tacacs_accounting_eem', 'TACACS_Accounting', 'EEM:'),
+    DropRule('tacacs_accounting_terminal_pager', 'TACACS_Accounting', 'CmdAV=terminal CmdArgAV=pager CmdArgAV=0 '),
+    DropRule('passed_command_auth', 'Passed_Authentications', 'Command Auth'),
+    DropRule('passed_tacacs', 'Passed_Authentications', 'Protocol=Tacacs'),
+]
+
+
+class MessageClassifier:
+    """
+    Drops ignored ISE traffic in the receiver, on raw bytes, before it is queued for the
+    workers. Datagrams without a CISE header (WLC and other sources) pass through.
+
+    Multi-chunk messages are tracked by (source IP, unique id) until all their chunks have
+    been seen or MESSAGE_TIMEOUT passes: once a rule drops one, its remaining chunks are
+    dropped too, and if some were already forwarded a cancel notice is forwarded instead.
+    """
+
+    def __init__(self, rules=DEFAULT_DROP_RULES, timeout=MESSAGE_TIMEOUT, max_tracked=MAX_TRACKED_MESSAGES):
+        self.rule_names = [rule.name for rule in rules]
+        # category -> rules that apply to it; None holds the rules for any category
+        self.rules = {}
+        for rule in rules:
+            self.rules.setdefault(rule.category, []).append(rule)
+        self.any_category = self.rules.pop(None, [])
+        self.category_rules = {}
+        self.counts = dict.fromkeys(self.rule_names, 0)
+        self.published = dict.fromkeys(self.rule_names, 0)
+        # State per message: [deadline, chunks seen, chunks forwarded, dropping rule or None]
+        self.tracked = ChunkTracker(timeout, max_tracked)
+
+    def _rules_for(self, category):
+        rules = self.category_rules.get(category)
+        if rules is None:
+            rules = self.category_rules[category] = self.any_category + self.rules.get(category, [])
+        return rules
+
+    def _match(self, rules, data, chunk_number):
+        for rule in rules:
+            if rule.lacks:
+                if chunk_number == 0 and rule.marker not in data:
+                    return rule
+            elif rule.marker in data:
+                return rule
+        return None
+
+    def filter_batch(self, batch):
+        """
+        Returns the (ip, data) items of `batch` to forward, with dropped chunks removed and
+        cancel notices added.
+        """
+        kept = []
+        now = None
+        for item in batch:
+            ip, data = item
+            header = parse_header(data)
+            if header is None:
+                kept.append(item)
+                continue
+            category, unique_id, total, chunk_number = header
+            rules = self._rules_for(category)
+            if total == b'1':
+                rule = self._match(rules, data, 0)
+                if rule is None:
+                    kept.append(item)
+                else:
+                    self.counts[rule.name] += 1
+                continue
+            if now is None:
+                now = time.time()
+            forward = self._chunk(ip, unique_id, int(total), int(chunk_number), data, rules, now)
+            if forward is not None:
+                kept.append((ip, forward))
+        if now is not None:
+            self.tracked.expire(now)
+        return kept
+
+    def _chunk(self, ip, unique_id, total, chunk_number, data, rules, now):
+        state, first = self.tracked.count((ip, unique_id), total, now)
+        if first:
+            state += [0, None]
+        if state[3] is not None:
+            return None
+        rule = self._match(rules, data, chunk_number)
+        if rule is None:
+            state[2] += 1
+            return data
+        self.counts[rule.name] += 1
+        state[3] = rule
+        if state[2]:
+            # The shard holds the chunks already forwarded; tell it to discard them
+            return CANCEL_PREFIX + unique_id + b' '
+        return None
+
+    def publish(self, shared_counts):
+        # Add the drops since the last call to the shared per-rule counters
+        for name, count in self.counts.items():
+            delta = count - self.published[name]
+            if delta:
+                with shared_counts[name].get_lock():
+                    shared_counts[name].value += delta
+                self.published[name] = count
+
+
+def parse_cancel(message):
+    """
+    Unique id of a cancel notice (decoded), or None for an ordinary message.
+    """
+    if message.startswith('\x00CISE_Cancel '):
+        return message[len('\x00CISE_Cancel '):].strip()
+    return None
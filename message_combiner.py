@@ -1,42 +1,186 @@
 import re
+import heapq
 import logging
 import time
 
 MESSAGE_TIMEOUT = 30  # Reduced from 60 to 30 seconds
+MAX_PENDING_MESSAGES = 20000  # Incomplete messages held across all sources
+MAX_PENDING_PER_SOURCE = 5000  # Incomplete messages held per source IP
+MAX_PENDING_BYTES = 64 * 1024 * 1024  # Fragment bytes held across all sources
+MAX_CHUNKS = 64  # ISE splits messages into a handful of chunks; larger totals are malformed
+
+FRAGMENT_HEADER = re.compile(r'CISE_\w+ (\d+) (\d+) (\d+)')
+
+
+class PendingMessage:
+    __slots__ = ('ip', 'unique_id', 'chunks', 'received', 'size', 'deadline')
+
+    def __init__(self, ip, unique_id, total_chunks, deadline):
+        self.ip = ip
+        self.unique_id = unique_id
+        self.chunks = [None] * total_chunks
+        self.received = 0
+        self.size = 0
+        self.deadline = deadline
+
+
+class FragmentReassembler:
+    """
+    Reassembles multi-chunk ISE messages keyed by (source IP, unique id).
+
+    Each pending message has one slot per expected chunk index, so retransmitted chunks
+    are detected as duplicates and completion means every slot is filled. Deadlines sit
+    in a heap that expire() sweeps from the worker loop. The table is bounded by message
+    count, per-source count and bytes; when a limit is hit the oldest pending message is
+    evicted.
+    """
+
+    def __init__(self, timeout=MESSAGE_TIMEOUT, max_messages=MAX_PENDING_MESSAGES,
+                 max_per_source=MAX_PENDING_PER_SOURCE, max_bytes=MAX_PENDING_BYTES):
+        self.timeout = timeout
+        self.max_messages = max_messages
+        self.max_per_source = max_per_source
+        self.max_bytes = max_bytes
+        self.pending = {}
+        # Per source, keys in arrival order so the oldest of a source can be evicted
+        self.by_source = {}
+        # (deadline, key); entries of completed or evicted messages are skipped lazily
+        self.expiry_heap = []
+        self.pending_bytes = 0
+        self.stats = {'completed': 0, 'expired': 0, 'duplicates': 0, 'evicted': 0, 'invalid': 0, 'cancelled': 0}
+
+    def __len__(self):
+        return len(self.pending)
+
+    def add(self, ip, message):
+        """
+        Store one chunk. Returns the full message when this chunk completes it, else None.
+        """
+        match = FRAGMENT_HEADER.search(message, 0, 512)
+        if not match:
+            self.stats['invalid'] += 1
+            logging.warning("No regex match on chunKing %.200s", message)
+            return None
+
+        unique_id = match.group(1)
+        total_chunks = int(match.group(2))
+        current_chunk = int(match.group(3))
+        if total_chunks == 1 and current_chunk == 0:
+            self.stats['completed'] += 1
+            return message
+        if not 0 <= current_chunk < total_chunks <= MAX_CHUNKS:
+            self.stats['invalid'] += 1
+            logging.warning("%s %s Invalid chunk %d/%d", ip, unique_id, current_chunk, total_chunks)
+            return None
+
+        key = (ip, unique_id)
+        pending = self.pending.get(key)
+        if pending is None:
+            pending = self._start(key, ip, unique_id, total_chunks)
+        elif len(pending.chunks) != total_chunks:
+            self.stats['invalid'] += 1
+            logging.warning("%s %s Chunk total changed from %d to %d", ip, unique_id, len(pending.chunks), total_chunks)
+            return None
+
+        if pending.chunks[current_chunk] is not None:
+            self.stats['duplicates'] += 1
+            return None
+
+        pending.chunks[current_chunk] = message
+        pending.received += 1
+        pending.size += len(message)
+        self.pending_bytes += len(message)
+
+        if pending.received == len(pending.chunks):
+            self._remove(key, pending)
+            self.stats['completed'] += 1
+            logging.debug("Full message joined: %s", unique_id)
+            return ''.join(pending.chunks)
+
+        while self.pending_bytes > self.max_bytes and self.pending:
+            self._evict_oldest()
+        return None
+
+    def discard(self, ip, unique_id):
+        # The receiver dropped this message after forwarding some of its chunks
+        key = (ip, unique_id)
+        pending = self.pending.get(key)
+        if pending is None:
+            return False
+        self._remove(key, pending)
+        self.stats['cancelled'] += 1
+        return True
+
+    def expire(self, now=None):
+        """
+        Drop pending messages whose deadline has passed. Returns how many were dropped.
+        """
+        now = time.time() if now is None else now
+        expired = 0
+        heap = self.expiry_heap
+        while heap and heap[0][0] <= now:
+            deadline, key = heapq.heappop(heap)
+            pending = self.pending.get(key)
+            if pending is None or pending.deadline != deadline:
+                continue
+            self._remove(key, pending)
+            expired += 1
+            logging.warning("%s %s Fragment timed out after %ss, received %d/%d chunks",
+                            pending.ip, pending.unique_id, self.timeout, pending.received, len(pending.chunks))
+        self.stats['expired'] += expired
+        self._compact_heap()
+        return expired
+
+    def _compact_heap(self):
+        # Completed and evicted messages leave their heap entries behind until their deadline;
+        # rebuild when those dominate so the heap stays proportional to the pending table
+        if len(self.expiry_heap) > 2 * len(self.pending) + 1024:
+            self.expiry_heap = [(p.deadline, key) for key, p in self.pending.items()]
+            heapq.heapify(self.expiry_heap)
+
+    def _start(self, key, ip, unique_id, total_chunks):
+        source_keys = self.by_source.setdefault(ip, {})
+        if len(source_keys) >= self.max_per_source:
+            oldest_key = next(iter(source_keys))
+            self._evict(oldest_key, self.pending[oldest_key])
+        if len(self.pending) >= self.max_messages:
+            self._evict_oldest()
+        source_keys = self.by_source.setdefault(ip, {})
+
+        pending = PendingMessage(ip, unique_id, total_chunks, time.time() + self.timeout)
+        self.pending[key] = pending
+        source_keys[key] = None
+        heapq.heappush(self.expiry_heap, (pending.deadline, key))
+        self._compact_heap()
+        return pending
+
+    def _evict_oldest(self):
+        heap = self.expiry_heap
+        while heap:
+            deadline, key = heapq.heappop(heap)
+            pending = self.pending.get(key)
+            if pending is not None and pending.deadline == deadline:
+                self._evict(key, pending)
+                return
+
+    def _evict(self, key, pending):
+        self._remove(key, pending)
+        self.stats['evicted'] += 1
+        logging.warning("%s %s Evicted incomplete message, received %d/%d chunks",
+                        pending.ip, pending.unique_id, pending.received, len(pending.chunks))
+
+    def _remove(self, key, pending):
+        del self.pending[key]
+        source_keys = self.by_source[pending.ip]
+        del source_keys[key]
+        if not source_keys:
+            del self.by_source[pending.ip]
+        self.pending_bytes -= pending.size
+
 
 def chunKing(addr, message_fragments, message):
     try:
-        match = re.search(r'CISE_\w+ (\d+) (\d+) (\d+)', message)
-        if match:
-            unique_id = match.group(1)
-            total_chunks = int(match.group(2))
-            current_chunk = int(match.group(3))
-            
-            if unique_id not in message_fragments:
-                message_fragments[unique_id] = {'total': total_chunks, 'received': [], 'complete': False, 'timestamp': time.time(), 'ip': addr}
-
-            message_fragments[unique_id]['received'].append((current_chunk, message))
-            message_fragments[unique_id]['timestamp'] = time.time()
-
-            if len(message_fragments[unique_id]['received']) == message_fragments[unique_id]['total']:
-                message_fragments[unique_id]['complete'] = True
-
-            if message_fragments[unique_id]['complete']:
-                full_message = ''.join(msg for _, msg in sorted(message_fragments[unique_id]['received']))
-                logging.info(f"Full message joined: {unique_id}")
-                del message_fragments[unique_id]
-                return full_message
-            else:
-                # Check for timed-out fragments
-                current_time = time.time()
-                if current_time - message_fragments[unique_id]['timestamp'] > MESSAGE_TIMEOUT:
-                    incomplete_message = ''.join(msg for _, msg in sorted(message_fragments[unique_id]['received']))
-                    logging.warning(f"{addr} {unique_id} Fragment timed out after {MESSAGE_TIMEOUT}s, received {len(message_fragments[unique_id]['received'])}/{total_chunks} chunks")
-                    del message_fragments[unique_id]
-                    return incomplete_message
-        else:
-            logging.warning(f"No regex match on chunKing {message}")
-
+        return message_fragments.add(addr, message)
     except Exception as e:
-        logging.error(f"Error in chunKing: {e}")
+        logging.error("Error in chunKing: %s", e)
     return None
@@ -0,0 +1,238 @@
+import bisect
+import json
+import logging
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# In-process counters and latency histograms. Every process records into its own
+# `metrics` registry (a dict update under a lock, no I/O) and publishes a snapshot to the
+# shared metrics queue about once a second; the monitor process keeps the latest snapshot
+# of each process and serves their sum over HTTP in the Prometheus text format:
+#   curl http://127.0.0.1:9514/metrics
+
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 9514
+PUBLISH_INTERVAL = 1.0
+MAX_QUEUED_SNAPSHOTS = 1000
+
+# Histogram bucket upper bounds in seconds, shared by every histogram
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# name -> (type, help)
+METRIC_HELP = {
+    'syslog_datagrams_received_total': ('counter', "Datagrams read from the socket"),
+    'syslog_datagrams_dropped_total': ('counter', "Datagrams dropped before a worker handled them, by reason"),
+    'syslog_datagrams_handled_total': ('counter', "Datagrams a worker handed to handle_syslog"),
+    'syslog_handle_errors_total': ('counter', "Datagrams whose handling raised"),
+    'syslog_messages_total': ('counter', "Complete messages handled, by category"),
+    'syslog_rows_rejected_total': ('counter', "Rows that failed validation, by table"),
+    'syslog_rows_inserted_total': ('counter', "Rows committed to the database, by table, including replayed spilled rows"),
+    'syslog_rows_spilled_total': ('counter', "Rows written to the spill queue instead of the database, by table"),
+    'syslog_rows_lost_total': ('counter', "Rows neither inserted nor spilled, by table"),
+    'syslog_dimension_lookups_total': ('counter', "Dimension values of written batches, by dimension and result (hit: cached)"),
+    'syslog_stage_seconds': ('histogram', "Time spent per stage: receive (per received batch), queue_wait "
+                                          "(per batch, receive to worker), reassembly (per datagram), "
+                                          "validation (per row), batch_wait (oldest row, per batch), "
+                                          "insert (per batch write, by table)"),
+    'syslog_parse_seconds': ('histogram', "Handler time per complete message, by category"),
+    'syslog_queue_depth': ('gauge', "Batches waiting in each worker's queue"),
+    'syslog_open_fragments': ('gauge', "Incomplete ISE messages held for reassembly"),
+    'syslog_pending_rows': ('gauge', "Rows in unsent batches"),
+    'syslog_spill_bytes': ('gauge', "Bytes in the spill queue waiting for replay"),
+    'syslog_rows_arrival_rate': ('gauge', "Rows per second reaching the inserter batches, by table (smoothed)"),
+    'syslog_memory_bytes': ('gauge', "Bytes counted against the admission control memory budget, by shard"),
+    'syslog_messages_shed_total': ('counter', "Messages shed by admission control, by class, source and reason"),
+    'syslog_admission_pressure': ('gauge', "Ingest pressure seen by each receiver (1.0 is the memory budget or a full queue)"),
+    'syslog_process_cpu_seconds_total': ('counter', "User and system CPU time, by process"),
+    'syslog_process_rss_bytes': ('gauge', "Resident memory, by process"),
+    'syslog_process_threads': ('gauge', "Threads, by process"),
+    'syslog_process_open_handles': ('gauge', "Open file descriptors (handles on Windows), by process"),
+    'syslog_process_gc_collections_total': ('counter', "Garbage collector runs, by process and generation"),
+    'syslog_process_gc_collected_total': ('counter', "Objects the garbage collector freed, by process and generation"),
+    'syslog_process_gc_objects': ('gauge', "Allocations counted toward the next collection, by process and generation"),
+}
+
+
+class Metrics:
+    """
+    Counters, gauges and histograms of one process, keyed by (name, labels) where labels
+    is a tuple of (label, value) pairs.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        # (name, labels) -> [bucket counts..., +Inf count, sum]
+        self.histograms = {}
+        # Called with the current time before each snapshot is published, e.g. resource samplers
+        self.hooks = []
+
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+
+    def run_hooks(self, now=None):
+        for hook in self.hooks:
+            hook(now)
+
+    def count(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def set_counter(self, name, labels, value):
+        # A total kept elsewhere, e.g. in a shared multiprocessing.Value
+        self.counters[(name, labels)] = value
+
+    def set_gauge(self, name, labels, value):
+        self.gauges[(name, labels)] = value
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            histogram[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            histogram[-1] += seconds
+
+    def snapshot(self):
+        with self.lock:
+            return (dict(self.counters), dict(self.gauges),
+                    {key: list(histogram) for key, histogram in self.histograms.items()})
+
+
+# This process's registry
+metrics = Metrics()
+_last_publish = 0.0
+
+
+def publish(metrics_queue, process_name, now=None, force=False):
+    """
+    Send this process's snapshot to the collector, at most once per PUBLISH_INTERVAL
+    unless forced (e.g. on exit).
+    """
+    global _last_publish
+    now = time.time() if now is None else now
+    if metrics_queue is None or (not force and now - _last_publish < PUBLISH_INTERVAL):
+        return
+    _last_publish = now
+    metrics.run_hooks(now)
+    try:
+        metrics_queue.put_nowait((process_name, metrics.snapshot()))
+    except queue.Full:
+        pass
+
+
+class MetricsCollector:
+    """
+    Latest snapshot per process, summed into one exposition. Counters of a process that
+    restarts under the same name start again from zero, which Prometheus treats as a reset.
+    """
+
+    def __init__(self, metrics_queue, refresh=None):
+        self.metrics_queue = metrics_queue
+        # Called before each collection, e.g. to take a fresh snapshot of the collecting process
+        self.refresh = refresh
+        self.snapshots = {}
+        self.lock = threading.Lock()
+
+    def collect(self):
+        if self.refresh is not None:
+            self.refresh()
+        while True:
+            try:
+                process_name, snapshot = self.metrics_queue.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                self.snapshots[process_name] = snapshot
+
+    def totals(self):
+        counters, gauges, histograms = {}, {}, {}
+        with self.lock:
+            snapshots = list(self.snapshots.values())
+        for process_counters, process_gauges, process_histograms in snapshots:
+            for key, value in process_counters.items():
+                counters[key] = counters.get(key, 0) + value
+            for key, value in process_gauges.items():
+                gauges[key] = gauges.get(key, 0) + value
+            for key, histogram in process_histograms.items():
+                total = histograms.get(key)
+                if total is None:
+                    histograms[key] = list(histogram)
+                else:
+                    for index, value in enumerate(histogram):
+                        total[index] += value
+        return counters, gauges, histograms
+
+    def counter_total(self, name):
+        counters = self.totals()[0]
+        return sum(value for (counter_name, _), value in counters.items() if counter_name == name)
+
+    def render(self):
+        counters, gauges, histograms = self.totals()
+        series = {}
+        for (name, labels), value in sorted(list(counters.items()) + list(gauges.items())):
+            series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+        for (name, labels), histogram in sorted(histograms.items()):
+            lines = series.setdefault(name, [])
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), histogram):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram[-1]:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        out = []
+        for name in sorted(series):
+            metric_type, help_text = METRIC_HELP.get(name, ('untyped', name))
+            out.append(f"# HELP {name} {help_text}")
+            out.append(f"# TYPE {name} {metric_type}")
+            out.extend(series[name])
+        return '\n'.join(out) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def serve_metrics(collector, host=METRICS_HOST, port=METRICS_PORT, resources=None):
+    """
+    Serve GET /metrics, and GET /resources (JSON from the `resources` callable) when given,
+    from a daemon thread. Returns the server; shutdown() stops it.
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            path = self.path.split('?', 1)[0]
+            if path == '/metrics':
+                collector.collect()
+                body = collector.render().encode()
+                content_type = 'text/plain; version=0.0.4; charset=utf-8'
+            elif path == '/resources' and resources is not None:
+                body = json.dumps(resources()).encode()
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug("Metrics request from %s: %s", self.client_address[0], format % args)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="MetricsServer", daemon=True).start()
+    logging.info("Metrics served on http://%s:%d/metrics", host, port)
+    return server
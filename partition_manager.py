@@ -0,0 +1,401 @@
+import argparse
+import logging
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import psycopg2
+from psycopg2 import sql
+from table_schemas import TABLES
+from db_writer import CONNECT_TIMEOUT
+
+try:
+    from zoneinfo import ZoneInfo
+except ImportError:
+    ZoneInfo = None
+
+# The ISE tables are range partitioned by day on "timestamp" (see TableSchema.partitioned).
+# Writers send each batch straight to its day partitions (PartitionRouter), creating a
+# missing one on demand in a short transaction of its own; the monitor process pre-creates the coming days, applies the
+# retention and indexes closed partitions (PartitionMaintainer). Existing heap tables are
+# converted once with:
+#   python partition_manager.py migrate [table ...]
+# which keeps the old table as the <table>_legacy partition holding everything before the
+# first day partition.
+
+PARTITION_TIMEZONE = 'UTC'  # Day boundaries of the partitions
+PRECREATE_DAYS = 3  # Partitions created ahead of today
+MAINTENANCE_INTERVAL = 3600
+_PARTITION_SUFFIX = re.compile(r'_p(\d{8})$')
+
+
+def partition_timezone(name):
+    if name in (None, 'UTC'):
+        return timezone.utc
+    if ZoneInfo is None:
+        raise ValueError(f"Time zone {name} needs zoneinfo (Python 3.9+)")
+    return ZoneInfo(name)
+
+
+def partition_name(table, day):
+    return f"{table}_p{day:%Y%m%d}"
+
+
+def partition_day(name):
+    match = _PARTITION_SUFFIX.search(name)
+    return datetime.strptime(match.group(1), '%Y%m%d').date() if match else None
+
+
+def row_day(value, tz):
+    # Day of a timestamp column value, a timezone-aware datetime (see timestamps)
+    return value.astimezone(tz).date()
+
+
+def day_bounds(day, tz):
+    start = datetime(day.year, day.month, day.day, tzinfo=tz)
+    end = start.date() + timedelta(days=1)
+    return start, datetime(end.year, end.month, end.day, tzinfo=tz)
+
+
+def is_partitioned(cursor, table):
+    cursor.execute("SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+                   "WHERE c.relname = %s AND c.relnamespace = 'public'::regnamespace", (table,))
+    return cursor.fetchone() is not None
+
+
+def table_exists(cursor, table):
+    cursor.execute("SELECT to_regclass(%s) IS NOT NULL", (f'public.{table}',))
+    return cursor.fetchone()[0]
+
+
+def list_partitions(cursor, table):
+    cursor.execute("SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+                   "WHERE i.inhparent = %s::regclass ORDER BY c.relname", (f'public.{table}',))
+    return [name for name, in cursor.fetchall()]
+
+
+def partition_end(cursor, name):
+    # Upper bound of a range partition, e.g. the end of the last day the legacy partition holds
+    cursor.execute("SELECT (regexp_match(pg_get_expr(relpartbound, oid), 'TO \\(''([^'']+)''\\)'))[1]::timestamptz "
+                   "FROM pg_class WHERE oid = %s::regclass", (f'public.{name}',))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def legacy_name(table):
+    return f"{table}_legacy"
+
+
+def create_partition(cursor, table, day, tz):
+    """
+    Create the day's partition of `table` if it does not exist. Runs under a savepoint, so
+    a failure (a concurrent create, or a range the legacy partition covers) leaves the
+    caller's transaction usable; returns whether the partition exists afterwards.
+    """
+    name = partition_name(table, day)
+    start, end = day_bounds(day, tz)
+    in_transaction = not cursor.connection.autocommit
+    if in_transaction:
+        cursor.execute('SAVEPOINT create_partition')
+    try:
+        cursor.execute(sql.SQL('CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES FROM (%s) TO (%s)').format(
+            sql.Identifier('public', name), sql.Identifier('public', table)), (start, end))
+    except psycopg2.Error as e:
+        if in_transaction:
+            cursor.execute('ROLLBACK TO SAVEPOINT create_partition')
+        logging.warning("Could not create partition %s: %s", name, str(e).strip().splitlines()[0])
+        return False
+    if in_transaction:
+        cursor.execute('RELEASE SAVEPOINT create_partition')
+    return True
+
+
+class PartitionRouter:
+    """
+    Splits a table's batches, and spilled COPY text, by day into their day partitions, so
+    PostgreSQL does not route row by row and a batch straddling midnight lands in both
+    days. Used by the writer threads of BatchedDatabaseInserter; a table that is not
+    partitioned in the database (not migrated yet) is written as a whole, as before.
+
+    A missing partition is created and committed on a short connection of the router's
+    own (see create_partitions), never in the batch's transaction, which would hold the
+    parent's ACCESS EXCLUSIVE lock until the batch commits. route() and route_copy_text()
+    must therefore come before the batch's transaction takes any lock, or the CREATE may
+    wait for that transaction.
+    """
+
+    def __init__(self, table, fields, dsn, tz=None):
+        self.table = table
+        self.column = fields.index('timestamp')
+        self.dsn = dsn
+        self.tz = tz or partition_timezone(PARTITION_TIMEZONE)
+        self.partitioned = None
+        # Committed partitions; None marks a day written through the parent table
+        self.partitions = {}
+        self.lock = threading.Lock()
+
+    def route(self, cursor, rows):
+        # [(table name, rows)] per day of the batch
+        if not self._is_partitioned(cursor):
+            return [(self.table, rows)]
+        column, tz = self.column, self.tz
+        by_day = {}
+        for row in rows:
+            by_day.setdefault(row_day(row[column], tz), []).append(row)
+        self.ensure(cursor, by_day)
+        return [(self.partitions[day] or self.table, day_rows) for day, day_rows in by_day.items()]
+
+    def route_copy_text(self, cursor, text):
+        # [(table name, COPY text)] per day of a batch in COPY text, in the table's column order
+        if not self._is_partitioned(cursor):
+            return [(self.table, text)]
+        by_day = self._copy_text_days(text, self.column)
+        self.ensure(cursor, by_day)
+        return [(self.partitions[day] or self.table, '\n'.join(lines) + '\n') for day, lines in by_day.items()]
+
+    def ensure_copy_text(self, cursor, text, column):
+        # The partitions for COPY text loaded some other way, with "timestamp" at `column`:
+        # spilled batches of an encoded table, in the table's layout, go in through its facts table
+        if self._is_partitioned(cursor):
+            self.ensure(cursor, self._copy_text_days(text, column))
+
+    def _copy_text_days(self, text, column):
+        tz = self.tz
+        by_day = {}
+        for line in text.split('\n'):
+            if line:
+                stamp = datetime.fromisoformat(line.split('\t')[column])
+                by_day.setdefault(row_day(stamp, tz), []).append(line)
+        return by_day
+
+    def ensure(self, cursor, days):
+        missing = [day for day in days if day not in self.partitions]
+        if not missing:
+            return
+        with self.lock:
+            missing = [day for day in missing if day not in self.partitions]
+            absent = []
+            for day in missing:
+                name = partition_name(self.table, day)
+                if table_exists(cursor, name):
+                    self.partitions[day] = name
+                else:
+                    absent.append(day)
+            if absent:
+                created = create_partitions(self.dsn, self.table, absent, self.tz)
+                for day, name in created.items():
+                    if name is not None:
+                        logging.info("Created partition %s", name)
+                self.partitions.update(created)
+
+    def _is_partitioned(self, cursor):
+        if self.partitioned is None:
+            self.partitioned = is_partitioned(cursor, self.table)
+            if not self.partitioned:
+                logging.warning("Table %s is not partitioned; batches go to the table itself", self.table)
+        return self.partitioned
+
+
+def create_partitions(dsn, table, days, tz):
+    """
+    Create the day partitions of `table` for `days` on a short autocommit connection, so
+    each is committed, and visible to every writer, at once. Returns day -> partition
+    name, or None for a day that cannot have its own (e.g. the legacy range), whose rows
+    go through the parent.
+    """
+    conn = psycopg2.connect(dsn, connect_timeout=CONNECT_TIMEOUT)
+    conn.autocommit = True
+    try:
+        created = {}
+        with conn.cursor() as cursor:
+            for day in days:
+                name = partition_name(table, day)
+                # A failed create may have lost the race to another process's
+                created[day] = name if create_partition(cursor, table, day, tz) or table_exists(cursor, name) else None
+        return created
+    finally:
+        conn.close()
+
+
+def ensure_partitions(cursor, table, first_day, last_day, tz):
+    day = first_day
+    while day <= last_day:
+        create_partition(cursor, table, day, tz)
+        day += timedelta(days=1)
+
+
+def ensure_partitions_for(cursor, table, source, tz, dsn=None):
+    """
+    Create the partitions that rows of `source` (a table or staging table) need before an
+    INSERT ... SELECT into the partitioned `table`: in the cursor's transaction, or with
+    `dsn` committed on a connection of their own (see create_partitions), in which case
+    the cursor's transaction must not have touched `table` yet.
+    """
+    if not is_partitioned(cursor, table):
+        return
+    zone = 'UTC' if tz is timezone.utc else str(tz)
+    cursor.execute(sql.SQL('SELECT min(("timestamp" AT TIME ZONE %s)::date), max(("timestamp" AT TIME ZONE %s)::date) '
+                           'FROM {}').format(sql.Identifier(source)), (zone, zone))
+    first_day, last_day = cursor.fetchone()
+    if first_day is None:
+        return
+    if dsn is None:
+        ensure_partitions(cursor, table, first_day, last_day, tz)
+        return
+    days = [first_day + timedelta(days=n) for n in range((last_day - first_day).days + 1)]
+    missing = [day for day in days if not table_exists(cursor, partition_name(table, day))]
+    if missing:
+        create_partitions(dsn, table, missing, tz)
+
+
+class PartitionMaintainer:
+    """
+    Periodic partition upkeep, run from the monitor process:
+      - creates the partitions of today and the next precreate_days days
+      - past retention_days, detaches partitions (concurrently from PostgreSQL 14) and drops
+        them unless retention_action is 'detach'; the legacy partition left by migrate()
+        goes once the last day it holds is past retention
+      - builds closed_indexes {table: [column tuple, ...]} on partitions of past days only,
+        so the partition taking today's inserts has no index to maintain
+    """
+
+    def __init__(self, dsn, timezone=PARTITION_TIMEZONE, precreate_days=PRECREATE_DAYS, retention_days=None,
+                 retention_action='drop', closed_indexes=None, interval=MAINTENANCE_INTERVAL):
+        self.dsn = dsn
+        self.tz = partition_timezone(timezone)
+        self.precreate_days = precreate_days
+        self.retention_days = retention_days
+        self.retention_action = retention_action
+        self.closed_indexes = closed_indexes or {}
+        self.interval = interval
+        self.last_run = 0
+        self.thread = None
+
+    def run_if_due(self, now=None):
+        # In a thread, so a DETACH waiting for a lock does not hold up the caller
+        now = time.time() if now is None else now
+        if now - self.last_run < self.interval or (self.thread is not None and self.thread.is_alive()):
+            return
+        self.last_run = now
+        self.thread = threading.Thread(target=self.run, name="PartitionMaintenance", daemon=True)
+        self.thread.start()
+
+    def run(self):
+        try:
+            conn = psycopg2.connect(self.dsn)
+        except psycopg2.Error as e:
+            logging.error("Partition maintenance could not connect: %s", e)
+            return
+        # DETACH ... CONCURRENTLY and CREATE INDEX CONCURRENTLY cannot run in a transaction
+        conn.autocommit = True
+        try:
+            today = datetime.now(self.tz).date()
+            with conn.cursor() as cursor:
+                for table in partitioned_tables(with_facts=True):
+                    if not is_partitioned(cursor, table):
+                        continue
+                    ensure_partitions(cursor, table, today, today + timedelta(days=self.precreate_days), self.tz)
+                    partitions = list_partitions(cursor, table)
+                    if self.retention_days is not None:
+                        partitions = self.apply_retention(cursor, table, partitions, today)
+                    for columns in self.closed_indexes.get(table, ()):
+                        self.index_closed(cursor, partitions, columns, today)
+        except psycopg2.Error as e:
+            logging.error("Partition maintenance failed: %s", e)
+        finally:
+            conn.close()
+
+    def apply_retention(self, cursor, table, partitions, today):
+        cutoff = today - timedelta(days=self.retention_days)
+        kept = []
+        for name in partitions:
+            day = partition_day(name)
+            if day is None:
+                end = partition_end(cursor, name) if name == legacy_name(table) else None
+                expired = end is not None and end <= day_bounds(cutoff, self.tz)[0]
+            else:
+                expired = day < cutoff
+            if not expired:
+                kept.append(name)
+                continue
+            # DETACH ... CONCURRENTLY is PostgreSQL 14+; older servers lock the parent for the detach
+            concurrently = ' CONCURRENTLY' if cursor.connection.server_version >= 140000 else ''
+            cursor.execute(sql.SQL('ALTER TABLE {} DETACH PARTITION {}' + concurrently).format(
+                sql.Identifier('public', table), sql.Identifier('public', name)))
+            if self.retention_action == 'drop':
+                cursor.execute(sql.SQL('DROP TABLE {}').format(sql.Identifier('public', name)))
+            logging.info("Partition %s past the %d day retention %s", name, self.retention_days,
+                         'dropped' if self.retention_action == 'drop' else 'detached')
+        return kept
+
+    def index_closed(self, cursor, partitions, columns, today):
+        for name in partitions:
+            day = partition_day(name)
+            if day is None or day >= today:
+                continue
+            cursor.execute(sql.SQL('CREATE INDEX CONCURRENTLY IF NOT EXISTS {} ON {} ({})').format(
+                sql.Identifier(f"{name}_{'_'.join(columns)}_idx"), sql.Identifier('public', name),
+                sql.SQL(', ').join(map(sql.Identifier, columns))))
+
+
+def partitioned_tables(with_facts=False):
+    # with_facts: also the facts tables of dictionary encoded tables (see dimensions)
+    tables = [name for name, schema in TABLES.items() if schema.partitioned]
+    if with_facts:
+        tables += [schema.facts_table for schema in TABLES.values() if schema.partitioned and schema.facts_table]
+    return tables
+
+
+def migrate(conn, table, tz):
+    """
+    Turn the heap table into a partitioned one: the old table becomes <table>_legacy,
+    attached for everything up to the end of its last day, and the day partitions follow.
+    """
+    legacy = legacy_name(table)
+    with conn.cursor() as cursor:
+        if is_partitioned(cursor, table):
+            logging.info("%s is already partitioned", table)
+            return
+        cursor.execute(sql.SQL('SELECT max("timestamp") FROM {}').format(sql.Identifier('public', table)))
+        latest = cursor.fetchone()[0]
+        last_day = (latest or datetime.now(tz) - timedelta(days=1)).astimezone(tz).date()
+        cursor.execute(sql.SQL('ALTER TABLE {} RENAME TO {}').format(sql.Identifier('public', table), sql.Identifier(legacy)))
+        cursor.execute(sql.SQL('CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) '
+                               'PARTITION BY RANGE ("timestamp")').format(
+            sql.Identifier('public', table), sql.Identifier('public', legacy)))
+        cursor.execute(sql.SQL('ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (MINVALUE) TO (%s)').format(
+            sql.Identifier('public', table), sql.Identifier('public', legacy)), (day_bounds(last_day, tz)[1],))
+        today = datetime.now(tz).date()
+        ensure_partitions(cursor, table, last_day + timedelta(days=1), today + timedelta(days=PRECREATE_DAYS), tz)
+    conn.commit()
+    logging.info("%s partitioned by day; rows up to %s are in %s", table, last_day, legacy)
+
+
+if __name__ == '__main__':
+    from database_utils import DATABASE_URL
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    parser = argparse.ArgumentParser(description="Manage the day partitions of the ISE tables")
+    parser.add_argument('action', choices=['migrate', 'maintain', 'list'])
+    parser.add_argument('tables', nargs='*', help="Default: every partitioned table")
+    parser.add_argument('--dsn', default=DATABASE_URL)
+    parser.add_argument('--timezone', default=PARTITION_TIMEZONE)
+    parser.add_argument('--retention-days', type=int)
+    parser.add_argument('--retention-action', choices=['drop', 'detach'], default='drop')
+    args = parser.parse_args()
+
+    tz = partition_timezone(args.timezone)
+    if args.action == 'maintain':
+        PartitionMaintainer(args.dsn, args.timezone, retention_days=args.retention_days,
+                            retention_action=args.retention_action).run()
+    else:
+        conn = psycopg2.connect(args.dsn)
+        try:
+            for table in args.tables or partitioned_tables():
+                if args.action == 'migrate':
+                    migrate(conn, table, tz)
+                else:
+                    with conn.cursor() as cursor:
+                        print(table, ' '.join(list_partitions(cursor, table)))
+        finally:
+            conn.close()
@@ -0,0 +1,169 @@
+import gc
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+try:
+    import psutil
+except ImportError:  # RSS and open FDs from /proc on Linux, CPU time, threads and GC everywhere
+    psutil = None
+
+from metrics import metrics
+
+# Every process of the service samples itself (no subprocesses, no WMI) when it publishes
+# its metrics, so the monitor sees the whole tree: Main, Monitor, Worker{n} and Listener{n}.
+# The monitor keeps the samples in ResourceHistory and serves them as JSON on /resources
+# next to /metrics.
+
+SAMPLE_INTERVAL = 5.0
+
+# (seconds per point, points kept): 5s for an hour, 1 minute for a day, 15 minutes for a week
+HISTORY_TIERS = ((5, 720), (60, 1440), (900, 672))
+
+# Gauges averaged when downsampled; the rest keep the last value of the interval
+AVERAGED = ('rss_bytes', 'threads', 'open_handles', 'cpu_percent')
+
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def proc_rss():
+    # Resident pages are the second field of /proc/self/statm
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def proc_open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+class ProcessSampler:
+    """
+    Records this process's RSS, CPU time, threads, open files/handles and GC statistics
+    into the metrics registry, labelled with the process name.
+    """
+
+    def __init__(self, process_name, interval=SAMPLE_INTERVAL):
+        self.labels = (('process', process_name),)
+        self.interval = interval
+        self.last_sample = 0.0
+        self.process = psutil.Process() if psutil is not None else None
+        self.has_proc = os.path.exists('/proc/self/statm')
+
+    def sample(self, now=None):
+        now = time.time() if now is None else now
+        if now - self.last_sample < self.interval:
+            return
+        self.last_sample = now
+        labels = self.labels
+        try:
+            if self.process is not None:
+                with self.process.oneshot():
+                    cpu = self.process.cpu_times()
+                    metrics.set_counter('syslog_process_cpu_seconds_total', labels, cpu.user + cpu.system)
+                    metrics.set_gauge('syslog_process_rss_bytes', labels, self.process.memory_info().rss)
+                    metrics.set_gauge('syslog_process_threads', labels, self.process.num_threads())
+                    handles = self.process.num_handles() if os.name == 'nt' else self.process.num_fds()
+                    metrics.set_gauge('syslog_process_open_handles', labels, handles)
+            else:
+                times = os.times()
+                metrics.set_counter('syslog_process_cpu_seconds_total', labels, times.user + times.system)
+                metrics.set_gauge('syslog_process_threads', labels, threading.active_count())
+                if self.has_proc:
+                    metrics.set_gauge('syslog_process_rss_bytes', labels, proc_rss())
+                    metrics.set_gauge('syslog_process_open_handles', labels, proc_open_fds())
+        except Exception as e:
+            logging.debug("Resource sample failed: %s", e)
+        for generation, stats in enumerate(gc.get_stats()):
+            generation_labels = labels + (('generation', str(generation)),)
+            metrics.set_counter('syslog_process_gc_collections_total', generation_labels, stats['collections'])
+            metrics.set_counter('syslog_process_gc_collected_total', generation_labels, stats['collected'])
+        for generation, count in enumerate(gc.get_count()):
+            metrics.set_gauge('syslog_process_gc_objects', labels + (('generation', str(generation)),), count)
+
+
+def start_resource_sampling(process_name, interval=SAMPLE_INTERVAL):
+    # Samples are taken from metrics.publish(), so only in processes that publish
+    sampler = ProcessSampler(process_name, interval)
+    metrics.add_hook(sampler.sample)
+    return sampler
+
+
+def process_samples(snapshots, now):
+    """
+    One sample per process from the collector's latest snapshots:
+    process name -> {'time', 'rss_bytes', 'cpu_seconds', 'threads', 'open_handles', 'gc_collections'}.
+    """
+    samples = {}
+    for process_name, (counters, gauges, _) in snapshots.items():
+        sample = {'time': now}
+        for (name, labels), value in list(counters.items()) + list(gauges.items()):
+            if not name.startswith('syslog_process_'):
+                continue
+            if name == 'syslog_process_gc_collections_total':
+                sample['gc_collections'] = sample.get('gc_collections', 0) + value
+            elif name in ('syslog_process_cpu_seconds_total', 'syslog_process_rss_bytes',
+                          'syslog_process_threads', 'syslog_process_open_handles'):
+                sample[name[len('syslog_process_'):].replace('_total', '')] = value
+        if len(sample) > 1:
+            samples[process_name] = sample
+    return samples
+
+
+class ResourceHistory:
+    """
+    Fixed-size history of process samples, downsampled through HISTORY_TIERS so memory
+    stays bounded however long the service runs.
+    """
+
+    def __init__(self, tiers=HISTORY_TIERS):
+        self.tiers = tiers
+        self.lock = threading.Lock()
+        # process name -> one deque per tier
+        self.points = {}
+        # (process name, tier index) -> samples of the tier's current interval
+        self.pending = {}
+        self.last_cpu = {}
+
+    def add(self, process_name, sample):
+        sample = dict(sample)
+        previous = self.last_cpu.get(process_name)
+        if previous is not None and 'cpu_seconds' in sample and sample['time'] > previous[0]:
+            sample['cpu_percent'] = round(100 * (sample['cpu_seconds'] - previous[1]) / (sample['time'] - previous[0]), 1)
+        if 'cpu_seconds' in sample:
+            self.last_cpu[process_name] = (sample['time'], sample['cpu_seconds'])
+        with self.lock:
+            tiers = self.points.get(process_name)
+            if tiers is None:
+                tiers = self.points[process_name] = [deque(maxlen=size) for _, size in self.tiers]
+            for index, (seconds, _) in enumerate(self.tiers):
+                key = (process_name, index)
+                pending = self.pending.setdefault(key, [])
+                if pending and int(sample['time'] // seconds) != int(pending[0]['time'] // seconds):
+                    tiers[index].append(self._downsample(pending, seconds))
+                    pending.clear()
+                pending.append(sample)
+
+    def add_all(self, samples):
+        for process_name, sample in samples.items():
+            self.add(process_name, sample)
+
+    @staticmethod
+    def _downsample(samples, seconds):
+        point = dict(samples[-1])
+        point['time'] = samples[0]['time'] // seconds * seconds
+        for name in AVERAGED:
+            values = [sample[name] for sample in samples if name in sample]
+            if values:
+                point[name] = round(sum(values) / len(values), 1)
+        peak = [sample['rss_bytes'] for sample in samples if 'rss_bytes' in sample]
+        if peak:
+            point['peak_rss_bytes'] = max(peak)
+        return point
+
+    def to_dict(self):
+        with self.lock:
+            return {process_name: {str(seconds): list(points)
+                                   for (seconds, _), points in zip(self.tiers, tiers)}
+                    for process_name, tiers in self.points.items()}
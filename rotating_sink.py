@@ -0,0 +1,129 @@
+import gzip
+import logging
+import os
+import shutil
+import threading
+import time
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAX_SEGMENT_BYTES = 64 * 1024 * 1024  # The active file is rotated at this size
+MAX_SEGMENT_AGE = 3600  # ... or when it has been open this many seconds
+FLUSH_INTERVAL = 1.0  # Seconds buffered lines may wait before they reach the file
+WRITE_BUFFER_BYTES = 1024 * 1024
+
+
+class RotatingFileSink:
+    """
+    Long-lived buffered line writer for one file, e.g. C:\\Syslog\\WLC.txt.
+
+    Lines are buffered and written out at least every flush_interval seconds (on the
+    next write or maintain() call). The file is rotated once it reaches max_bytes or
+    max_age seconds: it is renamed to <name>-<timestamp><ext> and, with compression
+    'gzip' or 'zstd', compressed by a background thread. zstd needs the zstandard
+    package; without it closed segments are gzipped.
+    """
+
+    def __init__(self, path, max_bytes=MAX_SEGMENT_BYTES, max_age=MAX_SEGMENT_AGE,
+                 flush_interval=FLUSH_INTERVAL, compression=None, buffer_bytes=WRITE_BUFFER_BYTES):
+        if compression not in (None, 'gzip', 'zstd'):
+            raise ValueError(f"Unknown compression {compression}")
+        if compression == 'zstd' and zstandard is None:
+            logging.warning("zstandard is not installed, rotated %s segments will be gzipped", path)
+            compression = 'gzip'
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self.compression = compression
+        self.buffer_bytes = buffer_bytes
+        self.lock = threading.Lock()
+        self.file = None
+        self.size = 0
+        self.opened = 0
+        self.last_flush = 0
+        self.compressors = []
+        self.stats = {'lines': 0, 'bytes': 0, 'rotations': 0}
+
+    def _open(self, now):
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.file = open(self.path, 'a', encoding='utf-8', errors='replace', newline='\n',
+                         buffering=self.buffer_bytes)
+        self.size = self.file.tell()
+        # An existing file continues its segment, aged from its last modification
+        self.opened = now if self.size == 0 else min(now, os.path.getmtime(self.path))
+        self.last_flush = now
+
+    def write(self, line):
+        now = time.time()
+        with self.lock:
+            if self.file is None:
+                self._open(now)
+            self.file.write(line)
+            self.file.write('\n')
+            self.size += len(line) + 1
+            self.stats['lines'] += 1
+            if self.size >= self.max_bytes or now - self.opened >= self.max_age:
+                self._rotate(now)
+            elif now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+
+    def maintain(self, now=None):
+        # Flush and rotate on time when no lines arrive to trigger it
+        now = time.time() if now is None else now
+        with self.lock:
+            if self.file is None:
+                return
+            if now - self.opened >= self.max_age:
+                self._rotate(now)
+            elif now - self.last_flush >= self.flush_interval:
+                self.file.flush()
+                self.last_flush = now
+        self.compressors = [thread for thread in self.compressors if thread.is_alive()]
+
+    def _rotate(self, now):
+        self.file.close()
+        self.file = None
+        self.stats['bytes'] += self.size
+        self.stats['rotations'] += 1
+        root, ext = os.path.splitext(self.path)
+        closed = f"{root}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}{ext}"
+        suffix = 1
+        while os.path.exists(closed) or os.path.exists(closed + '.gz') or os.path.exists(closed + '.zst'):
+            closed = f"{root}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(now))}-{suffix}{ext}"
+            suffix += 1
+        os.replace(self.path, closed)
+        if self.compression is not None:
+            thread = threading.Thread(target=compress_segment, args=(closed, self.compression),
+                                      name="SinkCompressor", daemon=True)
+            thread.start()
+            self.compressors.append(thread)
+
+    def close(self, timeout=30):
+        with self.lock:
+            if self.file is not None:
+                self.file.close()
+                self.file = None
+        for thread in self.compressors:
+            thread.join(timeout)
+        self.compressors = []
+
+
+def compress_segment(path, compression):
+    target = path + ('.zst' if compression == 'zstd' else '.gz')
+    try:
+        with open(path, 'rb') as source:
+            if compression == 'zstd':
+                with open(target + '.tmp', 'wb') as out:
+                    zstandard.ZstdCompressor().copy_stream(source, out)
+            else:
+                with gzip.open(target + '.tmp', 'wb') as out:
+                    shutil.copyfileobj(source, out, 1024 * 1024)
+        os.replace(target + '.tmp', target)
+        os.remove(path)
+    except OSError as error:
+        logging.error("Could not compress %s: %s", path, error)
@@ -0,0 +1,174 @@
+import multiprocessing
+import os
+import queue
+import socket
+import struct
+import time
+from multiprocessing import shared_memory
+from udp_receiver import RECV_BUFFER_SIZE
+
+# Ring header: next write sequence, next read sequence, datagrams dropped because the ring was full
+_HEADER = struct.Struct('<QQQ')
+_HEADER_SIZE = 64
+# Slot header: IPv4 source address, payload length
+_SLOT_HEADER = struct.Struct('<4sH')
+
+# Syslog sources are a handful of fixed devices, so address conversions are cached
+_packed_ips = {}
+_ip_strings = {}
+
+
+def _packed_ip(ip):
+    packed = _packed_ips.get(ip)
+    if packed is None:
+        packed = _packed_ips[ip] = socket.inet_aton(ip)
+    return packed
+
+
+def _ip_string(packed):
+    ip = _ip_strings.get(packed)
+    if ip is None:
+        ip = _ip_strings[packed] = socket.inet_ntoa(packed)
+    return ip
+
+
+class SharedRingBuffer:
+    """
+    Fixed-size ring of raw datagram slots in shared memory, written by one receiver
+    and read by one or more workers.
+
+    The producer never takes a lock: it fills slots and then publishes the new write
+    sequence once per batch. Consumers serialise on a lock only to claim slots and
+    advance the read sequence. Both sequences are aligned 8-byte words, which x86/x64
+    reads and writes atomically and in program order.
+
+    Duck-types the parts of multiprocessing.Queue the service uses: put() takes a
+    batch of (source_ip, bytes), get() returns a batch or raises queue.Empty, and
+    qsize() is the number of datagrams waiting.
+    """
+
+    def __init__(self, num_slots=8192, slot_size=RECV_BUFFER_SIZE):
+        self.num_slots = num_slots
+        self.slot_size = slot_size
+        self.slot_stride = _SLOT_HEADER.size + slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + num_slots * self.slot_stride)
+        self.read_lock = multiprocessing.Lock()
+        self.owner = True
+        _HEADER.pack_into(self.shm.buf, 0, 0, 0, 0)
+
+    def __getstate__(self):
+        return {'name': self.shm.name, 'num_slots': self.num_slots, 'slot_size': self.slot_size,
+                'read_lock': self.read_lock}
+
+    def __setstate__(self, state):
+        self.num_slots = state['num_slots']
+        self.slot_size = state['slot_size']
+        self.slot_stride = _SLOT_HEADER.size + self.slot_size
+        self.shm = shared_memory.SharedMemory(name=state['name'])
+        if os.name == 'posix':
+            # Attaching registers the segment with this process's resource tracker, which
+            # would unlink it when the worker exits. Only the creating process owns it.
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(self.shm._name, 'shared_memory')
+        self.read_lock = state['read_lock']
+        self.owner = False
+
+    def put(self, batch):
+        buf = self.shm.buf
+        head, tail, overflow = _HEADER.unpack_from(buf, 0)
+        free = self.num_slots - (head - tail)
+        if len(batch) > free:
+            overflow += len(batch) - free
+            batch = batch[:free]
+        num_slots, slot_stride, slot_size = self.num_slots, self.slot_stride, self.slot_size
+        pack_slot_header = _SLOT_HEADER.pack_into
+        for ip, data in batch:
+            offset = _HEADER_SIZE + (head % num_slots) * slot_stride
+            length = len(data)
+            if length > slot_size:
+                length = slot_size
+                data = data[:slot_size]
+            pack_slot_header(buf, offset, _packed_ip(ip), length)
+            start = offset + _SLOT_HEADER.size
+            buf[start:start + length] = data
+            head += 1
+        # Publish the slots before the new head; only the producer writes head and overflow
+        struct.pack_into('<Q', buf, 0, head)
+        struct.pack_into('<Q', buf, 16, overflow)
+
+    def get(self, timeout=1.0, max_items=512):
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while True:
+            batch = self.get_nowait(max_items)
+            if batch:
+                return batch
+            if time.monotonic() >= deadline:
+                raise queue.Empty
+            time.sleep(delay)
+            delay = min(delay * 2, 0.02)
+
+    def get_nowait(self, max_items=512):
+        buf = self.shm.buf
+        with self.read_lock:
+            head, tail, _ = _HEADER.unpack_from(buf, 0)
+            count = min(head - tail, max_items)
+            batch = []
+            num_slots, slot_stride = self.num_slots, self.slot_stride
+            unpack_slot_header = _SLOT_HEADER.unpack_from
+            for seq in range(tail, tail + count):
+                offset = _HEADER_SIZE + (seq % num_slots) * slot_stride
+                packed_ip, length = unpack_slot_header(buf, offset)
+                start = offset + _SLOT_HEADER.size
+                batch.append((_ip_string(packed_ip), buf[start:start + length].tobytes()))
+            if count:
+                struct.pack_into('<Q', buf, 8, tail + count)
+        return batch
+
+    def qsize(self):
+        head, tail, _ = _HEADER.unpack_from(self.shm.buf, 0)
+        return head - tail
+
+    def fill(self):
+        # Share of the slots holding unread datagrams
+        return self.qsize() / self.num_slots
+
+    def overflow_count(self):
+        return _HEADER.unpack_from(self.shm.buf, 0)[2]
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+class RingReader:
+    """
+    Reads from several rings that feed the same worker pipeline (one ring per listener,
+    since each ring has a single producer).
+    """
+
+    def __init__(self, rings):
+        self.rings = rings
+        self.next_ring = 0
+
+    def get(self, timeout=1.0, max_items=512):
+        deadline = time.monotonic() + timeout
+        delay = 0.0005
+        while True:
+            for _ in range(len(self.rings)):
+                ring = self.rings[self.next_ring]
+                self.next_ring = (self.next_ring + 1) % len(self.rings)
+                batch = ring.get_nowait(max_items)
+                if batch:
+                    return batch
+            if time.monotonic() >= deadline:
+                raise queue.Empty
+            time.sleep(delay)
+            delay = min(delay * 2, 0.02)
+
+    def qsize(self):
+        return sum(ring.qsize() for ring in self.rings)
+
+    def overflow_count(self):
+        return sum(ring.overflow_count() for ring in self.rings)
@@ -0,0 +1,165 @@
+import ipaddress
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+# Which handler gets the traffic of each syslog source. The routes live in a JSON file,
+# handler name -> list of addresses and CIDR prefixes:
+#   {"cisco_ise": ["10.23.252.3", "10.23.18.0/24"], "wlc": ["10.23.16.25"]}
+# Workers check the file for changes and swap in the new table without restarting.
+DEFAULT_ROUTING_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'routes.json')
+RELOAD_CHECK_INTERVAL = 5  # Seconds between checks of the routing file's modification time
+REPORT_INTERVAL = 60  # Seconds between route hit reports
+UNKNOWN_SAMPLE_INTERVAL = 300  # Seconds between logged samples of one unknown source
+MAX_CACHED_SOURCES = 65536
+MAX_UNKNOWN_SOURCES = 1024  # Unknown sources counted individually; the rest only in the total
+
+
+def routing_file():
+    return os.environ.get('SYSLOG_ROUTING_FILE', DEFAULT_ROUTING_FILE)
+
+
+class RoutingTable:
+    """
+    Immutable source -> route name lookup: exact addresses in a dict, CIDR prefixes
+    matched longest first. Prefix results are cached per source address, so after the
+    first datagram of a source every lookup is one dict access.
+    """
+
+    def __init__(self, routes):
+        self.exact = {}
+        prefixes = []
+        for name, entries in routes.items():
+            for entry in entries:
+                network = ipaddress.ip_network(entry, strict=False)
+                if network.num_addresses == 1:
+                    source = str(network.network_address)
+                    if self.exact.get(source, name) != name:
+                        raise ValueError(f"{source} is routed to both {self.exact[source]} and {name}")
+                    self.exact[source] = name
+                else:
+                    prefixes.append((network, name))
+        self.prefixes = sorted(prefixes, key=lambda prefix: prefix[0].prefixlen, reverse=True)
+        self.cache = {}
+
+    def lookup(self, ip):
+        name = self.exact.get(ip)
+        if name is not None:
+            return name
+        try:
+            return self.cache[ip]
+        except KeyError:
+            pass
+        name = None
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            address = None
+        if address is not None:
+            for network, route in self.prefixes:
+                if address.version == network.version and address in network:
+                    name = route
+                    break
+        if len(self.cache) < MAX_CACHED_SOURCES:
+            self.cache[ip] = name
+        return name
+
+
+def load_routing_table(path, handlers):
+    with open(path) as f:
+        routes = json.load(f)
+    unknown = set(routes) - set(handlers)
+    if unknown:
+        raise ValueError(f"No handler named {', '.join(sorted(unknown))}")
+    return RoutingTable(routes)
+
+
+class SourceRouter:
+    """
+    Routes datagrams to handlers by source address, with per-route hit counters and
+    counted, sampled unknown sources. maintain() reloads the routing file when it
+    changes and logs the counters; a file that fails to load leaves the current table
+    in place.
+    """
+
+    def __init__(self, handlers, path=None):
+        self.handlers = handlers
+        self.path = path or routing_file()
+        self.table = RoutingTable({})
+        self.mtime = None
+        self.last_check = 0
+        self.last_report = time.time()
+        self.hits = {}
+        self.unknown = {}
+        self.unknown_total = 0
+        self.unsampled = 0
+        self.last_sample = OrderedDict()  # ip -> last logged sample, oldest first
+        self.reload()
+
+    def reload(self):
+        try:
+            mtime = os.path.getmtime(self.path)
+            table = load_routing_table(self.path, self.handlers)
+        except (OSError, ValueError) as error:
+            logging.error("Could not load routing file %s, keeping the current routes: %s", self.path, error)
+            return False
+        # One assignment: a concurrent route() sees either the old table or the new one
+        self.table = table
+        self.mtime = mtime
+        logging.info("Loaded routing file %s: %d sources, %d prefixes",
+                     self.path, len(table.exact), len(table.prefixes))
+        return True
+
+    def route(self, ip, message):
+        """
+        Handler for the datagram's source, or None for an unknown source.
+        """
+        name = self.table.lookup(ip)
+        if name is None:
+            self._count_unknown(ip, message)
+            return None
+        hits = self.hits
+        hits[name] = hits.get(name, 0) + 1
+        return self.handlers[name]
+
+    def _count_unknown(self, ip, message):
+        self.unknown_total += 1
+        if ip in self.unknown or len(self.unknown) < MAX_UNKNOWN_SOURCES:
+            self.unknown[ip] = self.unknown.get(ip, 0) + 1
+        now = time.time()
+        last_sample = self.last_sample
+        if now - last_sample.get(ip, 0) < UNKNOWN_SAMPLE_INTERVAL:
+            return
+        if ip not in last_sample and len(last_sample) >= MAX_UNKNOWN_SOURCES:
+            if now - next(iter(last_sample.values())) < UNKNOWN_SAMPLE_INTERVAL:
+                # Every tracked source was sampled recently: count this one in the report instead
+                self.unsampled += 1
+                return
+            last_sample.popitem(last=False)
+        last_sample[ip] = now
+        last_sample.move_to_end(ip)
+        logging.warning("Unhandled syslog source: %s, sample: %.200s", ip, message)
+
+    def maintain(self, now=None):
+        now = time.time() if now is None else now
+        if now - self.last_check >= RELOAD_CHECK_INTERVAL:
+            self.last_check = now
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError:
+                mtime = self.mtime
+            if mtime != self.mtime:
+                self.reload()
+        if now - self.last_report >= REPORT_INTERVAL:
+            self.last_report = now
+            self.report()
+
+    def report(self):
+        logging.info("Route hits: %s; unknown sources %d messages, %d not sampled%s",
+                     ', '.join(f"{name} {count}" for name, count in sorted(self.hits.items())) or 'none',
+                     self.unknown_total, self.unsampled,
+                     ' (' + ', '.join(f"{ip} {count}" for ip, count in
+                                      sorted(self.unknown.items(), key=lambda item: -item[1])[:10]) + ')'
+                     if self.unknown else '')
@@ -0,0 +1,271 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+
+SEGMENT_BYTES = 16 * 1024 * 1024  # A segment is sealed for replay once it reaches this size
+MAX_SPILL_BYTES = 2 * 1024 * 1024 * 1024  # Oldest segments are discarded beyond this
+FSYNC_INTERVAL = 1.0  # Seconds between fsyncs with the 'interval' policy
+
+# Frame: magic, crc32 of table name + payload, creation time, row count, table name length,
+# payload length; followed by the table name and the payload (the batch as COPY text)
+_FRAME = struct.Struct('<2sIdIHI')
+_MAGIC = b'SQ'
+_POSITION_FILE = 'replay.pos'
+
+
+class SpillQueue:
+    """
+    Write-ahead spill log for batches that could not be written to the database.
+
+    Batches are appended as CRC-checked frames to numbered segment files in `directory`.
+    The reader only reads sealed segments, in order; the active segment is sealed when
+    it fills up or when nothing older is left to replay. After each frame is written to
+    the database the reader records its position in replay.pos, so a restart resumes
+    there (a frame written but not yet acknowledged is replayed again).
+
+    fsync_policy is 'always' (every append), 'interval' (at most every FSYNC_INTERVAL
+    seconds) or 'never' (left to the OS). When the spilled data exceeds max_bytes the
+    oldest segments are discarded.
+    """
+
+    def __init__(self, directory, max_bytes=MAX_SPILL_BYTES, segment_bytes=SEGMENT_BYTES, fsync_policy='interval'):
+        if fsync_policy not in ('always', 'interval', 'never'):
+            raise ValueError(f"Unknown fsync policy {fsync_policy}")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_policy = fsync_policy
+        self.lock = threading.Lock()
+        self.stats = {'spilled_batches': 0, 'spilled_rows': 0, 'replayed_batches': 0, 'replayed_rows': 0,
+                      'discarded_bytes': 0, 'corrupt_frames': 0}
+        os.makedirs(directory, exist_ok=True)
+        # seq -> size in bytes, oldest first
+        self.segments = {}
+        for name in sorted(os.listdir(directory)):
+            if name.startswith('spill-') and name.endswith('.seg'):
+                self.segments[int(name[6:-4])] = os.path.getsize(os.path.join(directory, name))
+        self.active = None
+        self.active_seq = None
+        self.last_fsync = 0
+        self.reader = None
+        self.read_seq, self.read_offset = self._load_position()
+        # Frame returned by peek() and not yet acknowledged: (table, payload, rows, created, size)
+        self.current = None
+        self.oldest_cache = (None, None, None)
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f'spill-{seq:012d}.seg')
+
+    def _load_position(self):
+        try:
+            with open(os.path.join(self.directory, _POSITION_FILE)) as f:
+                seq, offset = f.read().split()
+            return int(seq), int(offset)
+        except (OSError, ValueError):
+            return None, 0
+
+    def _save_position(self):
+        path = os.path.join(self.directory, _POSITION_FILE)
+        with open(path + '.tmp', 'w') as f:
+            f.write(f"{self.read_seq} {self.read_offset}")
+            if self.fsync_policy != 'never':
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+    def append(self, table_name, payload, row_count):
+        name = table_name.encode()
+        data = payload.encode()
+        frame = _FRAME.pack(_MAGIC, zlib.crc32(data, zlib.crc32(name)), time.time(), row_count,
+                            len(name), len(data)) + name + data
+        with self.lock:
+            if self.active is None or self.segments[self.active_seq] >= self.segment_bytes:
+                self._open_segment()
+            self.active.write(frame)
+            self.segments[self.active_seq] += len(frame)
+            now = time.time()
+            if self.fsync_policy == 'always' or (self.fsync_policy == 'interval' and now - self.last_fsync >= FSYNC_INTERVAL):
+                self.active.flush()
+                os.fsync(self.active.fileno())
+                self.last_fsync = now
+            self.stats['spilled_batches'] += 1
+            self.stats['spilled_rows'] += row_count
+            self._enforce_cap()
+
+    def _open_segment(self):
+        self._seal()
+        self.active_seq = max(self.segments, default=0) + 1
+        self.segments[self.active_seq] = 0
+        self.active = open(self._segment_path(self.active_seq), 'ab')
+
+    def _seal(self):
+        if self.active is not None:
+            self.active.flush()
+            if self.fsync_policy != 'never':
+                os.fsync(self.active.fileno())
+            self.active.close()
+            self.active = None
+            self.active_seq = None
+
+    def _enforce_cap(self):
+        while self.pending_bytes() > self.max_bytes and len(self.segments) > 1:
+            seq = next(iter(self.segments))
+            size = self.segments[seq]
+            if seq == self.read_seq:
+                size -= self.read_offset
+                self._finish_segment()
+            else:
+                self._remove_segment(seq)
+            self.stats['discarded_bytes'] += size
+            logging.error("Spill queue over %s bytes, discarded segment %s (%s bytes)", self.max_bytes, seq, size)
+
+    def _remove_segment(self, seq):
+        del self.segments[seq]
+        try:
+            os.remove(self._segment_path(seq))
+        except OSError as error:
+            logging.error("Could not remove spill segment %s: %s", seq, error)
+
+    def _finish_segment(self):
+        # The read segment is fully replayed (or discarded)
+        seq = self.read_seq
+        if self.reader is not None:
+            self.reader.close()
+            self.reader = None
+        self.current = None
+        self.read_seq, self.read_offset = None, 0
+        self._remove_segment(seq)
+        self._save_position()
+
+    def pending_bytes(self):
+        total = sum(self.segments.values())
+        if self.read_seq in self.segments:
+            total -= self.read_offset
+        return total
+
+    def has_pending(self):
+        return bool(self.segments) and self.pending_bytes() > 0
+
+    def peek(self):
+        """
+        Next frame to replay as (table_name, payload, row_count), or None when there is none.
+        The same frame is returned until ack() is called.
+        """
+        with self.lock:
+            while self.segments:
+                if self.current is not None:
+                    return self.current[:3]
+                if self.reader is None:
+                    seq = next(iter(self.segments))
+                    if seq == self.active_seq:
+                        if self.segments[seq] == 0:
+                            return None
+                        self._seal()
+                    self.reader = open(self._segment_path(seq), 'rb')
+                    if seq != self.read_seq:
+                        self.read_seq, self.read_offset = seq, 0
+                self.current = self._read_frame()
+                if self.current is None:
+                    # End of the segment, or a torn/corrupt tail left by a crash
+                    self._finish_segment()
+            return None
+
+    def ack(self):
+        # The frame returned by peek() has been written to the database
+        with self.lock:
+            if self.current is None:
+                # Discarded by the size cap while it was being written
+                return
+            table_name, payload, row_count, created, size = self.current
+            self.current = None
+            self.read_offset += size
+            self.stats['replayed_batches'] += 1
+            self.stats['replayed_rows'] += row_count
+            self._save_position()
+
+    def _read_frame(self):
+        self.reader.seek(self.read_offset)
+        header = self.reader.read(_FRAME.size)
+        if len(header) < _FRAME.size:
+            return None
+        magic, crc, created, row_count, name_length, payload_length = _FRAME.unpack(header)
+        body = self.reader.read(name_length + payload_length)
+        if magic != _MAGIC or len(body) < name_length + payload_length or zlib.crc32(body) != crc:
+            self.stats['corrupt_frames'] += 1
+            logging.error("Corrupt spill frame in segment %s at offset %s, skipping the rest of the segment",
+                          self.read_seq, self.read_offset)
+            return None
+        return body[:name_length].decode(), body[name_length:].decode(), row_count, created, _FRAME.size + len(body)
+
+    def oldest_pending_age(self, now=None):
+        # Age of the oldest spilled batch not yet replayed, in seconds
+        now = time.time() if now is None else now
+        with self.lock:
+            if self.current is not None:
+                return now - self.current[3]
+            if not self.segments:
+                return 0
+            seq = next(iter(self.segments))
+            offset = self.read_offset if seq == self.read_seq else 0
+            if self.oldest_cache[:2] != (seq, offset):
+                created = None
+                if self.active is not None and seq == self.active_seq:
+                    self.active.flush()
+                try:
+                    with open(self._segment_path(seq), 'rb') as f:
+                        f.seek(offset)
+                        header = f.read(_FRAME.size)
+                    if len(header) == _FRAME.size:
+                        created = _FRAME.unpack(header)[2]
+                except OSError:
+                    pass
+                self.oldest_cache = (seq, offset, created)
+            created = self.oldest_cache[2]
+            return now - created if created is not None else 0
+
+    def close(self):
+        with self.lock:
+            if self.reader is not None:
+                self.reader.close()
+                self.reader = None
+            self.current = None
+            self._seal()
+
+
+def adopt_segments(source_directory, target_directory):
+    """
+    Move the unreplayed segments of another spill directory (a worker shard that no longer
+    exists) into target_directory, after the segments already there. Must run before a
+    SpillQueue is opened on either directory.
+    """
+    if not os.path.isdir(source_directory):
+        return
+    os.makedirs(target_directory, exist_ok=True)
+    source = SpillQueue.__new__(SpillQueue)
+    source.directory = source_directory
+    read_seq, read_offset = source._load_position()
+    next_seq = max([int(name[6:-4]) for name in os.listdir(target_directory)
+                    if name.startswith('spill-') and name.endswith('.seg')], default=0) + 1
+    for name in sorted(os.listdir(source_directory)):
+        if not (name.startswith('spill-') and name.endswith('.seg')):
+            continue
+        seq = int(name[6:-4])
+        path = os.path.join(source_directory, name)
+        target = os.path.join(target_directory, f'spill-{next_seq:012d}.seg')
+        if seq == read_seq and read_offset:
+            # Partly replayed: keep only the frames after the replay position
+            with open(path, 'rb') as f, open(target, 'wb') as out:
+                f.seek(read_offset)
+                out.write(f.read())
+            os.remove(path)
+        else:
+            os.replace(path, target)
+        next_seq += 1
+        logging.warning("Adopted spill segment %s as %s", path, target)
+    try:
+        os.remove(os.path.join(source_directory, _POSITION_FILE))
+    except OSError:
+        pass
@@ -1,142 +1,415 @@
 import socket
 import logging
 import os
-import win32serviceutil
-import win32service
-import win32event
-from handler_dispatcher import handle_syslog
+try:
+    import win32serviceutil
+    import win32service
+    import win32event
+except ImportError:
+    # Without pywin32 there is no service wrapper; SyslogServer still runs the pipeline,
+    # as the end-to-end benchmark does
+    win32serviceutil = None
 import multiprocessing
 import queue
 import time
-from database_utils import flush_all_batches, log_batch_status, cleanup_connections, get_total_batch_size, get_total_rejected_count
-from handler_dispatcher import handle_syslog, message_fragments
+from udp_receiver import open_syslog_socket, receive_batch, split_by_shard, ReceivedBatch, RECV_BUFFER_SIZE, MAX_BATCH_SIZE, REUSEPORT_SUPPORTED
+from shared_ring import SharedRingBuffer, RingReader
+from log_setup import configure_logging, log_directory
+from message_classifier import MessageClassifier, DEFAULT_DROP_RULES
+from database_utils import DATABASE_URL, inserters, configure_partitions, flush_all_batches, log_batch_status, cleanup_connections, get_total_batch_size, get_total_rejected_count, get_writer_status, configure_spill
+from handler_dispatcher import handle_syslog, message_fragments, maintenance, configure_wlc_output, close_wlc_output, configure_archive, close_archive
+from metrics import metrics, publish, MetricsCollector, serve_metrics, MAX_QUEUED_SNAPSHOTS, METRICS_HOST, METRICS_PORT
+from resource_sampler import start_resource_sampling, process_samples, ResourceHistory
+from flush_scheduler import FlushScheduler
+from partition_manager import PartitionMaintainer
+from admission_control import AdmissionController, memory_in_use, batch_bytes, MEMORY_BUDGET_BYTES, PRESSURE_INTERVAL
 import signal
 
 def setup_logging(process_name):
-    log_directory = r'C:\Syslog'
-    log_filename = f'syslogService_{process_name}.txt'
-    os.makedirs(log_directory, exist_ok=True)
-    logging.basicConfig(filename=os.path.join(log_directory, log_filename), level=logging.INFO,
-                        format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s', filemode='a')
-    console = logging.StreamHandler()
-    console.setLevel(logging.INFO)
-    logging.getLogger('').addHandler(console)
-    logging.info(f"Logging started for {process_name}")
-
-def process_syslog_queue(message_queue, is_running, flush_interval, counters):
-    setup_logging("Worker")
-    last_flush_time = time.time()
-    
-    while is_running.value:
+    # Queued to a writer thread; directory and level from SYSLOG_LOG_DIR and SYSLOG_LOG_LEVEL
+    configure_logging(process_name)
+
+def new_shard_stats():
+    # Published by each worker shard, read by the monitor
+    return {
+        'handled': multiprocessing.Value('q', 0),
+        'fragments': multiprocessing.Value('i', 0),
+        'rejected': multiprocessing.Value('i', 0),
+        'pending_rows': multiprocessing.Value('i', 0),
+        # Bytes held for the admission control memory budget: queued batches (added by the
+        # receivers, subtracted by the worker) and incomplete messages in the fragment table
+        'queued_bytes': multiprocessing.Value('q', 0),
+        'fragment_bytes': multiprocessing.Value('q', 0),
+        # Fragment reassembly outcomes, see FragmentReassembler.stats
+        'completed': multiprocessing.Value('q', 0),
+        'expired': multiprocessing.Value('q', 0),
+        'duplicates': multiprocessing.Value('q', 0),
+        'evicted': multiprocessing.Value('q', 0),
+        'cancelled': multiprocessing.Value('q', 0),
+        # Database spill queue: bytes waiting for replay, age of the oldest batch, replay rows/s
+        'spill_bytes': multiprocessing.Value('q', 0),
+        'spill_age': multiprocessing.Value('d', 0.0),
+        'replay_rate': multiprocessing.Value('d', 0.0)
+    }
+
+def get_early_drop_total(counters):
+    # Ignored ISE messages the receivers dropped before queuing, summed over the drop rules
+    return sum(count.value for count in counters['early_drops'].values())
+
+def get_rejected_total(counters):
+    # Inserters live in the worker shards, so rejections are read from their published stats
+    return sum(shard['rejected'].value for shard in counters['shards'])
+
+def publish_shard_stats(shard):
+    shard['fragments'].value = len(message_fragments)
+    shard['fragment_bytes'].value = message_fragments.pending_bytes
+    for name in ('completed', 'expired', 'duplicates', 'evicted', 'cancelled'):
+        shard[name].value = message_fragments.stats[name]
+    shard['rejected'].value = get_total_rejected_count()
+    shard['pending_rows'].value = get_total_batch_size()
+    writer_status = get_writer_status()
+    shard['spill_bytes'].value = writer_status.get('spill_bytes', 0)
+    shard['spill_age'].value = writer_status.get('spill_oldest_age', 0)
+    shard['replay_rate'].value = writer_status.get('replay_rate', 0)
+
+def handle_batch(batch, counters, shard):
+    # Queue items are lists of (addr, raw bytes) from the batched receiver
+    if isinstance(batch, ReceivedBatch):
+        metrics.observe('syslog_stage_seconds', (('stage', 'queue_wait'),), time.time() - batch.received_at)
+        with shard['queued_bytes'].get_lock():
+            shard['queued_bytes'].value -= batch.size
+    with counters['handled'].get_lock():
+        counters['handled'].value += len(batch)
+    shard['handled'].value += len(batch)
+    ready = 0
+    for addr, data in batch:
         try:
-            addr, message = message_queue.get(timeout=1)
+            handle_syslog(addr, data.decode(errors='replace'))
+            ready += 1
+        except Exception as e:
+            metrics.count('syslog_handle_errors_total')
+            logging.error("Error handling syslog message from %s: %s", addr, e)
+    with counters['ready_for_insertion'].get_lock():
+        counters['ready_for_insertion'].value += ready
+
+def log_status_if_due(last_status_time, status_interval, counters, scheduler):
+    current_time = time.time()
+    if current_time - last_status_time < status_interval:
+        return last_status_time
+    try:
+        log_batch_status()
+        scheduler.log_status()
+        log_counter_status(counters)
+        logging.info("Writer status at %s: %s", time.strftime('%Y-%m-%d %H:%M:%S'), get_writer_status())
+    except Exception as e:
+        logging.error("Error logging worker status: %s", e)
+    return current_time
+
+def spill_directories(spill_options, shard_index, num_shards):
+    # Each shard spills to its own directory; shard 0 also takes over those of shards that no longer exist
+    base = spill_options['directory']
+    orphans = []
+    if shard_index == 0 and os.path.isdir(base):
+        for name in os.listdir(base):
+            if name.startswith('worker') and name[6:].isdigit() and int(name[6:]) >= num_shards:
+                orphans.append(os.path.join(base, name))
+    return os.path.join(base, f'worker{shard_index}'), orphans
+
+def drain_queue(message_queue, counters, shard, timeout):
+    # At shutdown, handle what the listeners already queued so it reaches the batches
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            item = message_queue.get(timeout=0.1)
+        except queue.Empty:
+            return
+        if isinstance(item, list):
+            handle_batch(item, counters, shard)
+        else:
             with counters['handled'].get_lock():
                 counters['handled'].value += 1
-            handle_syslog(addr, message)
+            handle_syslog(*item)
             with counters['ready_for_insertion'].get_lock():
                 counters['ready_for_insertion'].value += 1
-            
+    logging.warning("Shutdown drain timed out with %s messages still queued", message_queue.qsize())
+
+def process_syslog_queue(message_queue, is_running, status_interval, counters, shard_index=0, spill_options=None, wlc_options=None,
+                         archive_options=None, flush_options=None, partition_options=None):
+    setup_logging(f"Worker{shard_index}")
+    start_resource_sampling(f"Worker{shard_index}")
+    if partition_options is not None:
+        configure_partitions(partition_options.get('timezone'))
+    if archive_options is not None:
+        archive_options = dict(archive_options)
+        configure_archive(os.path.join(archive_options.pop('directory'), f'worker{shard_index}'), **archive_options)
+    if wlc_options is not None:
+        wlc_options = dict(wlc_options)
+        if len(counters['shards']) > 1:
+            # One file per shard, as each worker rotates its own
+            root, ext = os.path.splitext(wlc_options['file_name'])
+            wlc_options['file_name'] = f"{root}-worker{shard_index}{ext}"
+        configure_wlc_output(**wlc_options)
+    if spill_options is not None:
+        directory, orphans = spill_directories(spill_options, shard_index, len(counters['shards']))
+        configure_spill(directory, orphans, max_bytes=spill_options['max_bytes'],
+                        fsync_policy=spill_options['fsync_policy'],
+                        replay_rows_per_second=spill_options['replay_rows_per_second'])
+    shard = counters['shards'][shard_index]
+    # Sizes every table's batches and sends them on size or deadline (see flush_scheduler)
+    scheduler = FlushScheduler(inserters, **(flush_options or {}))
+    last_status_time = time.time()
+    last_publish_time = 0
+    
+    while is_running.value:
+        try:
             current_time = time.time()
-            if current_time - last_flush_time >= flush_interval:
-                last_flush_time = current_time
-                try:
-                    flush_all_batches()
-                    log_batch_status()
-                    log_counter_status(counters)
-                    logging.info(f"Batch insert completed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-                except Exception as e:
-                    logging.error(f"Error during batch insert: {e}")
-                finally:
-                    cleanup_connections()
+            if current_time - last_publish_time >= 1:
+                last_publish_time = current_time
+                maintenance()
+                publish_shard_stats(shard)
+                publish(counters['metrics'], f"Worker{shard_index}", current_time)
+            scheduler.tick(current_time)
+            item = message_queue.get(timeout=min(1, scheduler.time_to_next_flush(current_time)))
+            if isinstance(item, list):
+                handle_batch(item, counters, shard)
+            else:
+                addr, message = item
+                with counters['handled'].get_lock():
+                    counters['handled'].value += 1
+                handle_syslog(addr, message)
+                with counters['ready_for_insertion'].get_lock():
+                    counters['ready_for_insertion'].value += 1
+            last_status_time = log_status_if_due(last_status_time, status_interval, counters, scheduler)
         except queue.Empty:
-            current_time = time.time()
-            if current_time - last_flush_time >= flush_interval:
-                last_flush_time = current_time
-                try:
-                    flush_all_batches()
-                    log_batch_status()
-                    log_counter_status(counters)
-                    logging.info(f"Batch insert completed at {time.strftime('%Y-%m-%d %H:%M:%S')}")
-                except Exception as e:
-                    logging.error(f"Error during batch insert: {e}")
-                finally:
-                    cleanup_connections()
+            last_status_time = log_status_if_due(last_status_time, status_interval, counters, scheduler)
         except Exception as e:
-            logging.error(f"Unexpected error in process_syslog_queue: {e}")
+            logging.error("Unexpected error in process_syslog_queue: %s", e)
             time.sleep(1)
 
-def monitor_queue_size(message_queue, is_running, queue_monitoring_file, counters, counter_file):
+    if spill_options is not None:
+        drain_queue(message_queue, counters, shard, spill_options['shutdown_drain_seconds'])
+    # Hand the partial batches to the writers and wait for them to be written; what cannot
+    # be written in time is spilled
+    flush_all_batches()
+    cleanup_connections()
+    close_wlc_output()
+    close_archive()
+    publish(counters['metrics'], f"Worker{shard_index}", force=True)
+
+def ingest_pressure(message_queues, counters, max_queued_batches, memory_budget):
+    # Fraction of the memory budget in use, or of the fullest worker queue or ring if that is higher
+    fill = max((message_queue.fill() if isinstance(message_queue, SharedRingBuffer)
+                else message_queue.qsize() / max_queued_batches for message_queue in message_queues), default=0)
+    return max(fill, memory_in_use(counters['shards']) / memory_budget)
+
+def receive_loop(sock, message_queues, is_running, counters, max_receive_batch, max_queued_batches, drop_rules=DEFAULT_DROP_RULES,
+                 process_name="Main", admission_options=None):
+    num_shards = len(message_queues)
+    classifier = MessageClassifier(drop_rules)
+    admission_options = dict(admission_options or {})
+    memory_budget = admission_options.pop('memory_budget', MEMORY_BUDGET_BYTES)
+    admission = AdmissionController(**admission_options)
+    last_pressure_time = 0
+    while is_running.value:
+        try:
+            batch = receive_batch(sock, max_receive_batch)
+            publish(counters['metrics'], process_name)
+            if not batch:
+                continue
+            received_at = time.time()
+            with counters['received'].get_lock():
+                counters['received'].value += len(batch)
+            batch = classifier.filter_batch(batch)
+            classifier.publish(counters['early_drops'])
+            if received_at - last_pressure_time >= PRESSURE_INTERVAL:
+                last_pressure_time = received_at
+                admission.set_pressure(ingest_pressure(message_queues, counters, max_queued_batches, memory_budget))
+                metrics.set_gauge('syslog_admission_pressure', (('process', process_name),), admission.pressure)
+            batch = admission.filter_batch(batch)
+            if not batch:
+                continue
+            for shard_index, shard_batch in split_by_shard(batch, num_shards).items():
+                message_queue = message_queues[shard_index]
+                if isinstance(message_queue, SharedRingBuffer):
+                    # The ring drops what does not fit and counts it as overflow
+                    message_queue.put(shard_batch)
+                elif message_queue.qsize() < max_queued_batches:
+                    size = batch_bytes(shard_batch)
+                    with counters['shards'][shard_index]['queued_bytes'].get_lock():
+                        counters['shards'][shard_index]['queued_bytes'].value += size
+                    message_queue.put(ReceivedBatch(shard_batch, received_at, size))
+                else:
+                    metrics.count('syslog_datagrams_dropped_total', (('reason', 'queue_full'),), len(shard_batch))
+                    logging.warning("Message queue %d is full. Dropping batch of %d messages.", shard_index, len(shard_batch))
+            metrics.observe('syslog_stage_seconds', (('stage', 'receive'),), time.time() - received_at)
+        except Exception as e:
+            logging.error("Error receiving syslog message: %s", e)
+
+def run_listener(listener_index, ip, port, message_queues, is_running, counters, max_receive_batch, max_queued_batches, drop_rules,
+                 admission_options=None):
+    setup_logging(f"Listener{listener_index}")
+    start_resource_sampling(f"Listener{listener_index}")
+    sock = open_syslog_socket(ip, port, reuse_port=True)
+    logging.info("Listener %s started on %s:%s", listener_index, ip, port)
+    try:
+        receive_loop(sock, message_queues, is_running, counters, max_receive_batch, max_queued_batches, drop_rules,
+                     f"Listener{listener_index}", admission_options)
+    finally:
+        sock.close()
+
+def monitor_queue_size(message_queues, is_running, counters, metrics_address=None, partition_options=None):
     setup_logging("Monitor")
-    last_received = 0
-    last_handled = 0
-    last_ready = 0
-    last_rejected = 0
+    start_resource_sampling("Monitor")
+    partition_maintainer = PartitionMaintainer(DATABASE_URL, **partition_options) if partition_options is not None else None
+    last_shard_handled = [0] * len(counters['shards'])
+    last_time = time.time()
+
+    def refresh():
+        metrics.run_hooks()
+        # Totals kept in shared Values are mirrored into this process's registry
+        metrics.set_counter('syslog_datagrams_received_total', (), counters['received'].value)
+        metrics.set_counter('syslog_datagrams_handled_total', (), counters['handled'].value)
+        for name, count in counters['early_drops'].items():
+            metrics.set_counter('syslog_datagrams_dropped_total', (('reason', name),), count.value)
+        ring_overflow = sum(message_queue.overflow_count() for message_queue in message_queues if hasattr(message_queue, 'overflow_count'))
+        metrics.set_counter('syslog_datagrams_dropped_total', (('reason', 'ring_overflow'),), ring_overflow)
+        for shard_index, (message_queue, shard) in enumerate(zip(message_queues, counters['shards'])):
+            labels = (('shard', str(shard_index)),)
+            metrics.set_gauge('syslog_queue_depth', labels, message_queue.qsize())
+            metrics.set_gauge('syslog_open_fragments', labels, shard['fragments'].value)
+            metrics.set_gauge('syslog_pending_rows', labels, shard['pending_rows'].value)
+            metrics.set_gauge('syslog_spill_bytes', labels, shard['spill_bytes'].value)
+            metrics.set_gauge('syslog_memory_bytes', labels, memory_in_use([shard]))
+        with collector.lock:
+            collector.snapshots['Monitor'] = metrics.snapshot()
+
+    collector = MetricsCollector(counters['metrics'], refresh)
+    history = ResourceHistory()
+    server = None
+    if metrics_address is not None:
+        try:
+            server = serve_metrics(collector, *metrics_address, resources=history.to_dict)
+        except OSError as e:
+            logging.error("Metrics endpoint on %s:%d not started: %s", metrics_address[0], metrics_address[1], e)
     while is_running.value:
-        queue_size = message_queue.qsize()
-        fragment_queue_size = len(getattr(message_fragments, 'fragments', {}))
-        logging.info(f"Queue size: {queue_size}, Fragment queue size: {fragment_queue_size}")
         try:
-            with open(queue_monitoring_file, 'a') as f:
-                f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} - Queue Size: {queue_size}, Fragment Queue Size: {fragment_queue_size}\n")
+            if partition_maintainer is not None:
+                partition_maintainer.run_if_due()
+            collector.collect()
+            with collector.lock:
+                snapshots = dict(collector.snapshots)
+            history.add_all(process_samples(snapshots, time.time()))
+            queue_size = sum(message_queue.qsize() for message_queue in message_queues)
+            ring_overflow = sum(message_queue.overflow_count() for message_queue in message_queues if hasattr(message_queue, 'overflow_count'))
+            fragment_queue_size = sum(shard['fragments'].value for shard in counters['shards'])
+            logging.info("Queue size: %s, Ring overflow: %s, Fragment queue size: %s", queue_size, ring_overflow, fragment_queue_size)
+            current_time = time.time()
+            elapsed = max(current_time - last_time, 1e-6)
+            last_time = current_time
+            for shard_index, (message_queue, shard) in enumerate(zip(message_queues, counters['shards'])):
+                handled = shard['handled'].value
+                logging.info("Shard %s: %.1f msg/s, queue depth %s, open fragments %s, pending rows %s, rejected %s, "
+                             "reassembled %s, expired %s, duplicates %s, evicted %s, cancelled %s, "
+                             "spill %s bytes, oldest spilled %.0fs, replay %.0f rows/s",
+                             shard_index, (handled - last_shard_handled[shard_index]) / elapsed, message_queue.qsize(),
+                             shard['fragments'].value, shard['pending_rows'].value, shard['rejected'].value,
+                             shard['completed'].value, shard['expired'].value, shard['duplicates'].value,
+                             shard['evicted'].value, shard['cancelled'].value, shard['spill_bytes'].value,
+                             shard['spill_age'].value, shard['replay_rate'].value)
+                last_shard_handled[shard_index] = handled
+            logging.info("Dropped before queuing: %s",
+                         ', '.join(f"{name} {count.value}" for name, count in counters['early_drops'].items()))
             log_counter_status(counters)
-            write_counter_data(counters, counter_file, last_received, last_handled, last_ready, last_rejected)
-            last_received = counters['received'].value
-            last_handled = counters['handled'].value
-            last_ready = counters['ready_for_insertion'].value
-            last_rejected = get_total_rejected_count()
+            log_accounting(collector)
         except Exception as e:
-            logging.error(f"Error in monitor_queue_size: {e}")
+            logging.error("Error in monitor_queue_size: %s", e)
         time.sleep(5)
+    if server is not None:
+        server.shutdown()
 
 def log_counter_status(counters):
-    logging.info(f"Messages received: {counters['received'].value}")
-    logging.info(f"Messages handled: {counters['handled'].value}")
-    logging.info(f"Messages ready for insertion: {counters['ready_for_insertion'].value}")
-    logging.info(f"Messages rejected: {get_total_rejected_count()}")
-
-def write_counter_data(counters, counter_file, last_received, last_handled, last_ready, last_rejected):
-    current_time = time.strftime('%Y-%m-%d %H:%M:%S')
-    received = counters['received'].value
-    handled = counters['handled'].value
-    ready = counters['ready_for_insertion'].value
-    rejected = get_total_rejected_count()
-    
-    new_received = received - last_received
-    new_handled = handled - last_handled
-    new_ready = ready - last_ready
-    new_rejected = rejected - last_rejected
-    
-    lost_before_handling = new_received - new_handled
-    lost_during_handling = new_handled - new_ready
-    
-    try:
-        with open(counter_file, 'a') as f:
-            f.write(f"{current_time},")
-            f.write(f"{received},{handled},{ready},{rejected},")
-            f.write(f"{new_received},{new_handled},{new_ready},{new_rejected},")
-            f.write(f"{lost_before_handling},{lost_during_handling}\n")
-        logging.debug(f"Counter data written to {counter_file}")
-    except Exception as e:
-        logging.error(f"Failed to write counter data: {e}")
-        logging.error(f"Attempted to write to: {counter_file}")
-        logging.error(f"Current working directory: {os.getcwd()}")
-        logging.error(f"File exists: {os.path.exists(counter_file)}")
-        logging.error(f"Directory exists: {os.path.exists(os.path.dirname(counter_file))}")
-
-class SyslogService(win32serviceutil.ServiceFramework):
-    _svc_name_ = "PythonSyslogService"
-    _svc_display_name_ = "Python Syslog Service for Windows"
-
-    def __init__(self, args):
-        win32serviceutil.ServiceFramework.__init__(self, args)
-        self.hWaitStop = win32event.CreateEvent(None, 0, 0, None)
+    logging.info("Messages received: %s", counters['received'].value)
+    logging.info("Messages handled: %s", counters['handled'].value)
+    logging.info("Messages ready for insertion: %s", counters['ready_for_insertion'].value)
+    logging.info("Messages rejected: %s", get_rejected_total(counters))
+
+def log_accounting(collector):
+    # Where every datagram and row went, from the same totals the metrics endpoint serves
+    received = collector.counter_total('syslog_datagrams_received_total')
+    dropped = collector.counter_total('syslog_datagrams_dropped_total')
+    handled = collector.counter_total('syslog_datagrams_handled_total')
+    logging.info("Datagrams: received %d, dropped %d, handled %d, handle errors %d, unaccounted %d; "
+                 "rows: inserted %d, spilled %d, rejected %d, lost %d",
+                 received, dropped, handled, collector.counter_total('syslog_handle_errors_total'),
+                 received - dropped - handled,
+                 collector.counter_total('syslog_rows_inserted_total'),
+                 collector.counter_total('syslog_rows_spilled_total'),
+                 collector.counter_total('syslog_rows_rejected_total'),
+                 collector.counter_total('syslog_rows_lost_total'))
+
+class SyslogServer:
+    def __init__(self):
+        self.ip = "10.23.252.4"
+        self.port = 514
         self.is_running = multiprocessing.Value('b', True)
-        self.message_queue = multiprocessing.Queue()
+        self.message_queues = []
         self.max_queue_size = 100000
-        self.queue_monitoring_file = r"C:\Syslog\queue_size.txt"
-        self.counter_file = r"C:\Syslog\counter_data.csv"
-        self.num_processes = 1  # Set to 1 as per your requirement
-        self.flush_interval = 60
+        self.receive_mode = 'batched'  # 'batched' drains the socket per wakeup, 'single' is one recvfrom per datagram
+        self.max_receive_batch = MAX_BATCH_SIZE
+        self.max_queued_batches = 2000  # Queue bound in batched mode, where each queue item holds up to max_receive_batch messages
+        # 'queue' hands batches to workers through multiprocessing.Queue, 'ring' through shared-memory
+        # rings of raw datagram slots (batched receive mode only)
+        self.transport = 'queue'
+        self.ring_slots = 8192
+        self.rings = []
+        # Worker shards. Listeners route each datagram by (source IP, CISE unique id), so all
+        # fragments of a message reach the same shard and any number of shards reassembles correctly.
+        self.num_processes = 1
+        # Listener processes bound to the same address with SO_REUSEPORT
+        self.num_listeners = 1
+        self.status_interval = 60  # Seconds between the workers' batch and writer status logs
+        # Inserter batches are sized per table so rows are committed within target_latency seconds
+        # (see flush_scheduler): target_latency, min_rows, max_rows
+        self.flush_options = {'target_latency': 5.0}
+        # Day partitions of the ISE tables, kept by the monitor (see partition_manager): partitions
+        # of the next precreate_days days are created ahead, those older than retention_days (None
+        # keeps everything) are dropped or with retention_action 'detach' only detached, and
+        # closed_indexes {table: [(column, ...)]} are built on past days' partitions only
+        self.partition_options = {
+            'timezone': 'UTC',
+            'precreate_days': 3,
+            'retention_days': None,
+            'retention_action': 'drop',
+            'closed_indexes': {},
+        }
+        # WLC traffic: rotated, buffered file in the log directory, and optionally the wlc table
+        self.wlc_options = {
+            'file_name': 'WLC.txt',
+            'to_file': True,
+            'to_database': False,
+            'max_bytes': 64 * 1024 * 1024,
+            'max_age': 3600,
+            'flush_interval': 1.0,
+            'compression': 'gzip',  # None, 'gzip' or 'zstd' for rotated segments
+        }
+        # Raw message archive (see message_archive; query and replay with its CLI). None disables it,
+        # e.g. {'directory': os.path.join(log_directory(), 'archive'), 'segment_bytes': 256 * 1024 * 1024}
+        self.archive_options = None
+        # Ignored ISE message types are dropped on raw bytes in the receiver (see message_classifier)
+        self.drop_rules = DEFAULT_DROP_RULES
+        # Overload shedding by traffic class and per-source token buckets (see admission_control):
+        # memory_budget, classes, source_rate, source_burst, source_limits {ip: (rate, burst)}
+        self.admission_options = {'memory_budget': MEMORY_BUDGET_BYTES}
+        # Batches the database cannot take are spilled to disk per worker and replayed when it is back
+        self.spill_options = {
+            'directory': os.path.join(log_directory(), 'spill'),
+            'max_bytes': 2 * 1024 * 1024 * 1024,
+            'fsync_policy': 'interval',  # 'always', 'interval' or 'never'
+            'replay_rows_per_second': 5000,
+            'shutdown_drain_seconds': 20,
+        }
+        # Prometheus text endpoint served by the monitor process; None disables it
+        self.metrics_address = (METRICS_HOST, METRICS_PORT)
         self.processes = []
         
         # Initialize shared counters
@@ -144,68 +417,149 @@ class SyslogService(win32serviceutil.ServiceFramework):
         self.counters = {
             'received': multiprocessing.Value('i', 0),
             'handled': multiprocessing.Value('i', 0),
-            'ready_for_insertion': multiprocessing.Value('i', 0)
+            'ready_for_insertion': multiprocessing.Value('i', 0),
+            'early_drops': {rule.name: multiprocessing.Value('q', 0) for rule in self.drop_rules},
+            'shards': [new_shard_stats() for _ in range(self.num_processes)],
+            # Per-process metric snapshots for the monitor (see metrics)
+            'metrics': multiprocessing.Queue(MAX_QUEUED_SNAPSHOTS),
         }
 
-        # Initialize counter file with headers
-        with open(self.counter_file, 'w') as f:
-            f.write("Timestamp,Total Received,Total Handled,Total Ready,Total Rejected,New Received,New Handled,New Ready,New Rejected,Lost Before Handling,Lost During Handling\n")
-
-    def SvcDoRun(self):
-        self.ReportServiceStatus(win32service.SERVICE_RUNNING)
-        self.start_syslog_server()
-
-    def SvcStop(self):
-        self.ReportServiceStatus(win32service.SERVICE_STOP_PENDING)
+    def stop(self):
         self.is_running.value = False
         for process in self.processes:
-            process.join(timeout=5)
+            # Workers drain their queue and write or spill their batches before exiting
+            process.join(timeout=self.spill_options['shutdown_drain_seconds'] + 40)
             if process.is_alive():
                 process.terminate()
         cleanup_connections()  # Ensure database connections are closed
-        win32event.SetEvent(self.hWaitStop)
+        for rings in self.rings:
+            for ring in rings:
+                ring.close()
 
     def start_syslog_server(self):
         setup_logging("Main")
 
-        # Start worker processes
-        for _ in range(self.num_processes):
-            p = multiprocessing.Process(target=process_syslog_queue, 
-                                        args=(self.message_queue, self.is_running, self.flush_interval, self.counters))
+        IP = self.ip
+        PORT = self.port
+
+        num_listeners = self.num_listeners
+        if num_listeners > 1 and (not REUSEPORT_SUPPORTED or self.receive_mode != 'batched'):
+            logging.warning("Multiple listeners need SO_REUSEPORT and batched receive mode. Falling back to a single listener.")
+            num_listeners = 1
+        num_shards = self.num_processes
+        if num_shards > 1 and self.receive_mode != 'batched':
+            logging.warning("Sharded workers need batched receive mode. Falling back to a single worker.")
+            num_shards = 1
+        if self.transport == 'ring' and self.receive_mode == 'batched':
+            # Each ring has a single producer, so every listener gets its own ring per shard
+            self.rings = [[SharedRingBuffer(self.ring_slots) for _ in range(num_shards)] for _ in range(num_listeners)]
+            listener_queues = self.rings
+            self.message_queues = [RingReader([rings[shard_index] for rings in self.rings]) for shard_index in range(num_shards)]
+        else:
+            self.message_queues = [multiprocessing.Queue() for _ in range(num_shards)]
+            listener_queues = [self.message_queues] * num_listeners
+        self.counters['shards'] = [new_shard_stats() for _ in range(num_shards)]
+
+        # Start one worker process per shard
+        for shard_index, message_queue in enumerate(self.message_queues):
+            p = multiprocessing.Process(target=process_syslog_queue, name=f"Worker{shard_index}",
+                                        args=(message_queue, self.is_running, self.status_interval, self.counters, shard_index, self.spill_options,
+                                              self.wlc_options, self.archive_options, self.flush_options, self.partition_options))
             p.start()
             self.processes.append(p)
 
         # Start monitoring process
-        monitor_process = multiprocessing.Process(target=monitor_queue_size, 
-                                                  args=(self.message_queue, self.is_running, self.queue_monitoring_file, self.counters, self.counter_file))
+        monitor_process = multiprocessing.Process(target=monitor_queue_size, name="Monitor",
+                                                  args=(self.message_queues, self.is_running, self.counters, self.metrics_address, self.partition_options))
         monitor_process.start()
         self.processes.append(monitor_process)
+        # After the children start, so forked processes do not inherit the sampler
+        start_resource_sampling("Main")
 
-        IP = "10.23.252.4"
-        PORT = 514
+        if num_listeners > 1:
+            for listener_index in range(num_listeners):
+                p = multiprocessing.Process(target=run_listener, name=f"Listener{listener_index}",
+                                            args=(listener_index, IP, PORT, listener_queues[listener_index], self.is_running, self.counters,
+                                                  self.max_receive_batch, self.max_queued_batches, self.drop_rules,
+                                                  self.admission_options))
+                p.start()
+                self.processes.append(p)
+            logging.info("Syslog server started on %s:%s with %s listeners", IP, PORT, num_listeners)
+            while self.is_running.value:
+                publish(self.counters['metrics'], "Main")
+                time.sleep(1)
+            return
 
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind((IP, PORT))
+        sock = open_syslog_socket(IP, PORT)
 
-        logging.info(f"Syslog server started on {IP}:{PORT}")
+        logging.info("Syslog server started on %s:%s (%s receive mode)", IP, PORT, self.receive_mode)
+
+        if self.receive_mode == 'batched':
+            receive_loop(sock, listener_queues[0], self.is_running, self.counters, self.max_receive_batch, self.max_queued_batches, self.drop_rules,
+                         admission_options=self.admission_options)
+        else:
+            self.receive_single(sock)
+
+        sock.close()
 
+    def receive_single(self, sock):
+        sock.settimeout(1.0)
+        classifier = MessageClassifier(self.drop_rules)
         while self.is_running.value:
             try:
-                data, addr = sock.recvfrom(8192)
+                data, addr = sock.recvfrom(RECV_BUFFER_SIZE)
                 if not data:
                     break
-                message = data.decode()
                 with self.counters['received'].get_lock():
                     self.counters['received'].value += 1
-                if self.message_queue.qsize() < self.max_queue_size:
-                    self.message_queue.put((addr[0], message))
+                kept = classifier.filter_batch([(addr[0], data)])
+                classifier.publish(self.counters['early_drops'])
+                if not kept:
+                    continue
+                message = kept[0][1].decode()
+                if self.message_queues[0].qsize() < self.max_queue_size:
+                    self.message_queues[0].put((addr[0], message))
                 else:
-                    logging.warning(f"Message queue is full. Dropping message from {addr[0]}.")
+                    logging.warning("Message queue is full. Dropping message from %s.", addr[0])
+            except socket.timeout:
+                continue
             except Exception as e:
-                logging.error(f"Error receiving syslog message: {e}")
+                logging.error("Error receiving syslog message: %s", e)
 
-        sock.close()
+if win32serviceutil is not None:
+    class SyslogService(win32serviceutil.ServiceFramework):
+        _svc_name_ = "PythonSyslogService"
+        _svc_display_name_ = "Python Syslog Service for Windows"
+
+        def __init__(self, args):
+            win32serviceutil.ServiceFramework.__init__(self, args)
+            self.hWaitStop = win32event.CreateEvent(None, 0, 0, None)
+            self.server = SyslogServer()
+
+        def SvcDoRun(self):
+            self.ReportServiceStatus(win32service.SERVICE_RUNNING)
+            self.server.start_syslog_server()
+
+        def SvcStop(self):
+            self.ReportServiceStatus(win32service.SERVICE_STOP_PENDING)
+            self.server.stop()
+            win32event.SetEvent(self.hWaitStop)
 
 if __name__ == '__main__':
     multiprocessing.freeze_support()  # Necessary for PyInstaller
-    win32serviceutil.HandleCommandLine(SyslogService)
+    if win32serviceutil is not None:
+        win32serviceutil.HandleCommandLine(SyslogService)
+    else:
+        # No service wrapper: run in the foreground until SIGINT or SIGTERM. The forked
+        # processes inherit the handler, so the workers drain and flush instead of dying.
+        server = SyslogServer()
+
+        def request_stop(signum, frame):
+            server.is_running.value = False
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+        try:
+            server.start_syslog_server()
+        finally:
+            server.stop()
@@ -0,0 +1,237 @@
+import ipaddress
+import sys
+from datetime import datetime
+
+# Each destination table is declared once here. The handlers hand a dict of extracted
+# fields to the table's inserter, which builds the row tuple, validates it and inserts
+# it with functions compiled from these declarations when the module loads. The DDL in
+# `tables` is rendered from the same declarations: python table_schemas.py > tables
+
+# Validated inet strings; sources and NAS addresses are a small, stable set
+_valid_inets = set()
+MAX_CACHED_INETS = 65536
+
+
+def _valid_inet(value):
+    if value in _valid_inets:
+        return True
+    try:
+        ipaddress.ip_address(value)
+    except ValueError:
+        return False
+    if len(_valid_inets) < MAX_CACHED_INETS:
+        _valid_inets.add(value)
+    return True
+
+
+# pg type -> (check expression on `v`, error message prefix)
+_TYPE_CHECKS = {
+    'timestamp with time zone': ('isinstance(v, datetime) and v.tzinfo is not None', 'Invalid timestamp'),
+    'text': ('isinstance(v, str)', 'Invalid text'),
+    'integer': ('isinstance(v, int) or (isinstance(v, str) and v.isdigit())', 'Invalid integer'),
+    'inet': ('_valid_inet(v)', 'Invalid inet address'),
+}
+
+
+class Column:
+    __slots__ = ('name', 'pg_type', 'source', 'transform', 'not_null')
+
+    def __init__(self, name, pg_type, source, transform=None, not_null=False):
+        self.name = name
+        self.pg_type = pg_type
+        # Key of the handler's extracted fields dict the value is taken from
+        self.source = source
+        # Applied to the value when it is present, before validation
+        self.transform = transform
+        self.not_null = not_null
+
+
+class TableSchema:
+    def __init__(self, name, columns, loader='insert', partitioned=False, dimensions=()):
+        self.name = name
+        # How BatchedDatabaseInserter writes batches: 'insert' (execute_values) or 'copy'
+        self.loader = loader
+        # Range partitioned by day on "timestamp" (see partition_manager)
+        self.partitioned = partitioned
+        # Low-cardinality text columns: interned while batched, and stored as IDs into
+        # dimension tables once the table is dictionary encoded (see dimensions)
+        self.dimensions = tuple(dimensions)
+        self.facts_table = f"{name}_facts" if self.dimensions else None
+        self.columns = tuple(columns)
+        self.fields = tuple(column.name for column in self.columns)
+        self.not_null_fields = [column.name for column in self.columns if column.not_null]
+        self.build_row, self.validate = _compile(self.columns, self.dimensions)
+
+    def render_ddl(self):
+        lines = []
+        for column in self.columns:
+            name = f'"{column.name}"' if column.name in _RESERVED_NAMES else column.name
+            line = f'    {name} {column.pg_type}'
+            if column.pg_type == 'text':
+                line += ' COLLATE pg_catalog."default"'
+            if column.not_null:
+                line += ' NOT NULL'
+            lines.append(line)
+        body = ',\n'.join(lines)
+        partitioning = ' PARTITION BY RANGE ("timestamp")' if self.partitioned else ''
+        return f"CREATE TABLE IF NOT EXISTS public.{self.name}\n(\n{body}\n){partitioning};\n"
+
+
+_RESERVED_NAMES = {'timestamp'}
+
+
+def _compile(columns, interned=()):
+    """
+    Generate the row builder and validator for a column list, so the per-row work is
+    straight-line code with no loops, zips or per-column type dispatch.
+
+    build_row(fields) -> tuple in column order, transforms applied and the `interned`
+    columns' strings interned, so batched rows share one copy of each value.
+    validate(row) -> None when the row is valid, else the reason it is rejected.
+    """
+    namespace = {'_valid_inet': _valid_inet, 'datetime': datetime}
+
+    builder = ['def build_row(fields):', '    get = fields.get']
+    values = []
+    for i, column in enumerate(columns):
+        transform = column.transform
+        if column.name in interned:
+            transform = sys.intern if transform is None else (lambda value, f=transform: sys.intern(f(value)))
+        if transform is None:
+            values.append(f'get({column.source!r})')
+        else:
+            namespace[f'_transform_{i}'] = transform
+            builder.append(f'    v{i} = get({column.source!r})')
+            builder.append(f'    if v{i} is not None:')
+            builder.append(f'        v{i} = _transform_{i}(v{i})')
+            values.append(f'v{i}')
+    builder.append(f'    return ({", ".join(values)},)')
+
+    validator = ['def validate(row):',
+                 f'    if len(row) != {len(columns)}:',
+                 f'        return f"Mismatch in number of fields. Expected {len(columns)}, got {{len(row)}}"']
+    for i, column in enumerate(columns):
+        check, error = _TYPE_CHECKS[column.pg_type]
+        validator.append(f'    v = row[{i}]')
+        if column.not_null:
+            validator.append('    if v is None:')
+            validator.append(f'        return "NULL value not allowed for field {column.name}"')
+            validator.append(f'    if not ({check}):')
+        else:
+            validator.append(f'    if v is not None and not ({check}):')
+        validator.append(f'        return f"{error} for field {column.name}: {{v}}"')
+    validator.append('    return None')
+
+    exec('\n'.join(builder + validator), namespace)
+    return namespace['build_row'], namespace['validate']
+
+
+def _ise_columns(*columns):
+    return [Column(name, pg_type, source) for name, pg_type, source in columns]
+
+
+_TIMESTAMP = Column('timestamp', 'timestamp with time zone', 'timestamp', not_null=True)
+
+# Columns of the passed tables that repeat a few values across millions of rows
+_PASSED_DIMENSIONS = ('networkdevicename', 'isepolicysetname', 'selectedaccessservice',
+                      'authorizationpolicymatchedrule', 'ndlocation', 'adhostresolveddns')
+
+# Columns shared by the wired (pla) and wireless (pwa) passed authentication tables,
+# after nasportid which only pla has
+_PASSED_COLUMNS = _ise_columns(
+    ('requestlatency', 'integer', 'RequestLatency'),
+    ('ciscoavpairmethod', 'text', 'cisco-av-pair=method'),
+    ('username', 'text', 'UserName'),
+    ('authenticationmethod', 'text', 'AuthenticationMethod'),
+    ('authenticationidentitystore', 'text', 'AuthenticationIdentityStore'),
+    ('selectedaccessservice', 'text', 'SelectedAccessService'),
+    ('selectedauthorizationprofiles', 'text', 'SelectedAuthorizationProfiles'),
+    ('identitygroup', 'text', 'IdentityGroup'),
+    ('selectedauthenticationidentitystores', 'text', 'SelectedAuthenticationIdentityStores'),
+    ('authenticationstatus', 'text', 'AuthenticationStatus'),
+    ('ndlocation', 'text', 'NetworkDeviceGroups=Location#'),
+    ('nddevice', 'text', 'NetworkDeviceGroups=Device='),
+    ('ndrollout', 'text', 'NetworkDeviceGroups=Rollout='),
+    ('ndreauth', 'text', 'NetworkDeviceGroups=Reauth='),
+    ('ndclosed', 'text', 'NetworkDeviceGroups=Closed='),
+    ('identitypolicymatchedrule', 'text', 'IdentityPolicyMatchedRule'),
+    ('authorizationpolicymatchedrule', 'text', 'AuthorizationPolicyMatchedRule'),
+    ('subjectcommonname', 'text', 'Subject - Common Name'),
+    ('endpointmacaddress', 'text', 'EndPointMACAddress'),
+    ('isepolicysetname', 'text', 'ISEPolicySetName'),
+    ('adhostresolveddns', 'text', 'AD-Host-Resolved-DNs'),
+    ('daystoexpiry', 'integer', 'Days to Expiry'),
+    ('sessiontimeout', 'integer', 'Session-Timeout'),
+    ('ciscoavpairacs', 'text', 'cisco-av-pair=ACS'),
+    ('deviceip', 'inet', 'DeviceIP'),
+)
+
+TABLES = {schema.name: schema for schema in [
+    # Failed TACACS authentications
+    TableSchema('fta', [_TIMESTAMP] + _ise_columns(
+        ('ipaddress', 'text', 'source_ip'),
+        ('username', 'text', 'UserName'),
+        ('nasipaddress', 'text', 'Device IP Address'),
+        ('remoteaddress', 'text', 'RemoteAddress'),
+        ('failurereason', 'text', 'FailureReason'),
+        ('networkdevicename', 'text', 'NetworkDeviceName'),
+        ('requestlatency', 'integer', 'RequestLatency'),
+    ), partitioned=True),
+    # Failed wireless authentications
+    TableSchema('fwa', [_TIMESTAMP] + _ise_columns(
+        ('ipaddress', 'text', 'source_ip'),
+        ('username', 'text', 'UserName'),
+        ('nasipaddress', 'text', 'NASIPAddress'),
+        ('calledstationid', 'text', 'CalledStationID'),
+        ('failurereason', 'text', 'FailureReason'),
+        ('networkdevicename', 'text', 'NetworkDeviceName'),
+    ), partitioned=True),
+    # Failed wired (LAN) authentications
+    TableSchema('fla', [_TIMESTAMP] + _ise_columns(
+        ('ipaddress', 'text', 'source_ip'),
+        ('username', 'text', 'UserName'),
+        ('nasipaddress', 'text', 'NASIPAddress'),
+        ('nasportid', 'text', 'NasPortID'),
+        ('failurereason', 'text', 'FailureReason'),
+        ('networkdevicename', 'text', 'NetworkDeviceName'),
+    ), partitioned=True),
+    # Passed wireless authentications; the passed tables carry most rows and load with COPY
+    TableSchema('pwa', [_TIMESTAMP] + _ise_columns(
+        ('sourceip', 'inet', 'source_ip'),
+        ('nasipaddress', 'inet', 'NAS-IP-Address'),
+        ('networkdevicename', 'text', 'NetworkDeviceName'),
+    ) + _PASSED_COLUMNS + _ise_columns(
+        ('calledstationid', 'text', 'Called-Station-ID'),
+        ('radiusflowtype', 'text', 'RadiusFlowType'),
+    ), loader='copy', partitioned=True, dimensions=_PASSED_DIMENSIONS),
+    # Passed wired (LAN) authentications
+    TableSchema('pla', [_TIMESTAMP] + _ise_columns(
+        ('sourceip', 'inet', 'source_ip'),
+        ('nasipaddress', 'inet', 'NAS-IP-Address'),
+        ('nasportid', 'text', 'NAS-Port-Id'),
+        ('networkdevicename', 'text', 'NetworkDeviceName'),
+    ) + _PASSED_COLUMNS, loader='copy', partitioned=True, dimensions=_PASSED_DIMENSIONS),
+    # TACACS command accounting
+    TableSchema('tca', [
+        _TIMESTAMP,
+        Column('username', 'text', 'Username', not_null=True),
+        Column('networkdevicename', 'text', 'NetworkDeviceName', not_null=True),
+        Column('networkdeviceip', 'inet', 'NetworkDeviceIP', not_null=True),
+        Column('remotedevice', 'inet', 'RemoteDevice'),
+        Column('cmdset', 'text', 'CmdSet', not_null=True),
+        Column('ipaddress', 'inet', 'source_ip'),
+    ], partitioned=True),
+    # Cisco WLC messages, when wlc_handler is configured to store them
+    TableSchema('wlc', [_TIMESTAMP] + _ise_columns(
+        ('sourceip', 'inet', 'source_ip'),
+        ('devicename', 'text', 'DeviceName'),
+        ('facility', 'text', 'Facility'),
+        ('severity', 'integer', 'Severity'),
+        ('mnemonic', 'text', 'Mnemonic'),
+        ('message', 'text', 'Message'),
+    ), loader='copy'),
+]}
+
+
+if __name__ == '__main__':
+    print('\n'.join(schema.render_ddl() for schema in TABLES.values()))
@@ -0,0 +1,120 @@
+import time
+from datetime import datetime
+
+# Values for the "timestamp with time zone" column. Handlers pass timezone-aware datetimes,
+# so the loader never sends PostgreSQL a naive time to read in its session timezone. A burst
+# of ISE or WLC messages shares a handful of seconds, so parsed seconds are cached and only
+# the fraction is applied per message.
+
+MAX_CACHED_SECONDS = 4096
+# Characters searched for the CISE header, as in the receiver's shard routing
+HEADER_SEARCH_CHARS = 256
+
+
+class Timestamp(datetime):
+    """
+    A timezone-aware datetime that carries its text for the COPY loader, assembled from the
+    cached second, so rows are not formatted again on the way to the database. Datetimes
+    derived from it (astimezone, replace, unpickling) have no text and format as usual.
+    """
+    __slots__ = ('text',)
+
+    def __str__(self):
+        try:
+            return self.text
+        except AttributeError:
+            return datetime.__str__(self)
+
+
+def _timestamp(value):
+    value = Timestamp(value.year, value.month, value.day, value.hour, value.minute, value.second,
+                      value.microsecond, value.tzinfo)
+    value.text = value.isoformat(' ')
+    return value
+
+
+# '2024-08-09 12:11:07+00:00' -> (date and time fields, tzinfo, '2024-08-09 12:11:07', '+00:00')
+_ise_seconds = {}
+# (year, month, day, clock) -> Timestamp
+_local_seconds = {}
+_tick_second = None
+_tick = None
+
+
+def ise_timestamp(message):
+    """
+    Event time of an ISE message, read from the fields following its CISE header:
+
+        CISE_<category> <unique id> <total chunks> <chunk number> 2024-08-09 12:11:07.453 +00:00
+
+    Returns None when the header is missing or carries no valid time.
+    """
+    start = message.find('CISE_', 0, HEADER_SEARCH_CHARS)
+    if start < 0:
+        return None
+    for _ in range(4):
+        start = message.find(' ', start) + 1
+        if not start:
+            return None
+    end = start + 19
+    if message[end:end + 1] == '.':
+        fraction_end = message.find(' ', end + 1, end + 12)
+        if fraction_end < 0:
+            return None
+        fraction = message[end + 1:fraction_end][:6]
+        end = fraction_end
+    else:
+        fraction = ''
+    key = message[start:start + 19] + message[end + 1:end + 7]
+    cached = _ise_seconds.get(key)
+    if cached is None:
+        try:
+            value = datetime.fromisoformat(key)
+        except ValueError:
+            return None
+        if value.tzinfo is None or len(key) != 25:
+            return None
+        cached = ((value.year, value.month, value.day, value.hour, value.minute, value.second),
+                  value.tzinfo, key[:19], key[19:])
+        if len(_ise_seconds) >= MAX_CACHED_SECONDS:
+            _ise_seconds.clear()
+        _ise_seconds[key] = cached
+    fields, tzinfo, second, offset = cached
+    if not fraction:
+        value = Timestamp(*fields, 0, tzinfo)
+        value.text = key
+        return value
+    if not fraction.isdigit():
+        return None
+    value = Timestamp(*fields, int(fraction) * 10 ** (6 - len(fraction)), tzinfo)
+    value.text = f"{second}.{fraction}{offset}"
+    return value
+
+
+def local_timestamp(year, month, day, clock):
+    """
+    Timezone-aware local time of a syslog header time ('Oct', '18', '02:41:00') in `year`,
+    or None when it is not a valid date.
+    """
+    key = (year, month, day, clock)
+    value = _local_seconds.get(key)
+    if value is None:
+        try:
+            value = _timestamp(datetime.strptime(f"{year} {month} {day} {clock}", '%Y %b %d %H:%M:%S').astimezone())
+        except ValueError:
+            return None
+        if len(_local_seconds) >= MAX_CACHED_SECONDS:
+            _local_seconds.clear()
+        _local_seconds[key] = value
+    return value
+
+
+def now_tick():
+    # The time a message is handled, to the second, for messages without an event time:
+    # one timezone-aware datetime per second instead of a clock read and format per message
+    global _tick_second, _tick
+    second = int(time.time())
+    if second != _tick_second:
+        _tick = _timestamp(datetime.fromtimestamp(second).astimezone())
+        _tick_second = second
+    return _tick
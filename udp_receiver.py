@@ -0,0 +1,94 @@
+import socket
+import select
+import logging
+import zlib
+from message_classifier import CISE_UNIQUE_ID, HEADER_SEARCH_BYTES
+
+# Largest datagram we accept (ISE fragments are well below this)
+RECV_BUFFER_SIZE = 8192
+# Kernel receive buffer requested for the listening socket, so bursts queue in the kernel
+# instead of being dropped while the receiver is busy handing a batch to the workers
+SOCKET_RCVBUF_BYTES = 32 * 1024 * 1024
+# Upper bound on datagrams drained per wakeup
+MAX_BATCH_SIZE = 512
+# SO_REUSEPORT lets several listener processes bind the same address with the kernel
+# balancing flows between them. It is not available on Windows.
+REUSEPORT_SUPPORTED = hasattr(socket, 'SO_REUSEPORT')
+
+
+def open_syslog_socket(ip, port, rcvbuf_bytes=SOCKET_RCVBUF_BYTES, reuse_port=False):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        if not REUSEPORT_SUPPORTED:
+            raise OSError("SO_REUSEPORT is not supported on this platform")
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf_bytes)
+    except OSError as e:
+        logging.warning("Could not set SO_RCVBUF to %s: %s", rcvbuf_bytes, e)
+    sock.bind((ip, port))
+    logging.info("Socket receive buffer on %s:%s is %s bytes", ip, port, sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF))
+    return sock
+
+
+def receive_batch(sock, max_batch=MAX_BATCH_SIZE, timeout=1.0):
+    """
+    Wait up to `timeout` seconds for the socket to become readable, then drain every
+    datagram already queued in the kernel (up to `max_batch`) without blocking.
+    Returns a list of (source_ip, raw_bytes); payloads are left undecoded.
+    The socket is switched to non-blocking mode on first use.
+    """
+    readable, _, _ = select.select([sock], [], [], timeout)
+    if not readable:
+        return []
+
+    if sock.gettimeout() != 0.0:
+        sock.setblocking(False)
+
+    batch = []
+    recvfrom = sock.recvfrom
+    append = batch.append
+    while len(batch) < max_batch:
+        try:
+            data, addr = recvfrom(RECV_BUFFER_SIZE)
+        except BlockingIOError:
+            break
+        except ConnectionResetError:
+            # Windows reports ICMP port-unreachable for earlier sends as a reset on UDP sockets
+            continue
+        if data:
+            append((addr[0], data))
+    return batch
+
+
+def shard_for_datagram(ip, data, num_shards):
+    # All chunks of one ISE message share (source IP, unique id), so they land on the same
+    # shard and reassemble there. crc32 is stable across processes, unlike hash().
+    match = CISE_UNIQUE_ID.search(data, 0, HEADER_SEARCH_BYTES)
+    key = ip.encode() + b' ' + match.group(1) if match else ip.encode()
+    return zlib.crc32(key) % num_shards
+
+
+class ReceivedBatch(list):
+    """
+    A shard's batch as queued for its worker, stamped with when it was received so the
+    worker can measure the time it waited in the queue, and with its size in bytes for
+    the admission control memory budget.
+    """
+
+    def __init__(self, items, received_at, size=0):
+        super().__init__(items)
+        self.received_at = received_at
+        self.size = size
+
+
+def split_by_shard(batch, num_shards):
+    """
+    Split a received batch into per-shard sub-batches keyed by shard index.
+    """
+    if num_shards == 1:
+        return {0: batch}
+    routed = {}
+    for ip, data in batch:
+        routed.setdefault(shard_for_datagram(ip, data, num_shards), []).append((ip, data))
+    return routed
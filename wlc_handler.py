@@ -1,10 +1,76 @@
 import logging
 import os
-# Add appropriate imports for PostgreSQL connection
+import re
+from log_setup import log_directory
+from rotating_sink import RotatingFileSink
+from database_utils import wlc_inserter
+from timestamps import local_timestamp, now_tick
+
+# <133>HO-FRN-WLC-01: *apfMsConnTask_5: Aug 09 12:11:07.453: %APF-6-USER_NAME_CREATED: apf_ms.c:2012 Username:...
+WLC_MESSAGE = re.compile(r'<\d+>(?:([\w.-]+): )?.*?%([A-Z0-9_]+)-(\d)-([A-Z0-9_]+): ?(.*)', re.S)
+# The controller's own event time, which has no year
+WLC_TIME = re.compile(r'([A-Z][a-z]{2}) +(\d+) (\d{2}:\d{2}:\d{2})(?:\.\d+)?: %')
+
+# Where WLC traffic goes: a rotated file in the log directory, and optionally the wlc table.
+# configure_wlc_output() sets this up per worker; without it the defaults below apply.
+wlc_output = {'to_file': True, 'to_database': False}
+wlc_sink = None
+
+def configure_wlc_output(file_name='WLC.txt', to_file=True, to_database=False, **sink_options):
+    global wlc_sink
+    close_wlc_output()
+    wlc_output.update(to_file=to_file, to_database=to_database)
+    if to_file:
+        wlc_sink = RotatingFileSink(os.path.join(log_directory(), file_name), **sink_options)
+
+def maintain_wlc_output():
+    if wlc_sink is not None:
+        wlc_sink.maintain()
+
+def close_wlc_output():
+    global wlc_sink
+    if wlc_sink is not None:
+        wlc_sink.close()
+        wlc_sink = None
+
+def wlc_timestamp(message, now):
+    # Event time from the message, so reprocessed messages get the same rows; the year is
+    # the current one unless that puts the event more than a day ahead (December events
+    # read in January). Messages without a parsable time get the time they are handled.
+    match = WLC_TIME.search(message, 0, 256)
+    if match is not None:
+        month, day, clock = match.groups()
+        event = local_timestamp(now.year, month, day, clock)
+        if event is not None and (event - now).days >= 1:
+            event = local_timestamp(now.year - 1, month, day, clock)
+        if event is not None:
+            return event
+    return now
+
+def parse_wlc_message(message):
+    match = WLC_MESSAGE.match(message)
+    if match is None:
+        return None
+    device_name, facility, severity, mnemonic, text = match.groups()
+    return {
+        'timestamp': wlc_timestamp(message, now_tick()),
+        'DeviceName': device_name,
+        'Facility': facility,
+        'Severity': severity,
+        'Mnemonic': mnemonic,
+        'Message': text.rstrip(),
+    }
 
 def handle_wlc_syslog(ip, message):
-    log_directory = r'C:\\Syslog'
-    log_filename = 'WLC.txt'
-    with open(log_directory + '\\' + log_filename, 'a') as file:
-        file.write(message + '\n')
-    # Implement similar logic as in handle_cisco_ise_syslog
+    global wlc_sink
+    if wlc_output['to_file']:
+        if wlc_sink is None:
+            wlc_sink = RotatingFileSink(os.path.join(log_directory(), 'WLC.txt'))
+        wlc_sink.write(message)
+    if wlc_output['to_database']:
+        fields = parse_wlc_message(message)
+        if fields is None:
+            logging.warning("Unparsed WLC message from %s: %.200s", ip, message)
+            return
+        fields['source_ip'] = ip
+        wlc_inserter.add_record(fields)